@@ -1,17 +1,384 @@
-import shutil
+"""
+Kopie zapasowe bazy danych przez API online backup SQLite.
+
+Kopia jest wykonywana partiami po BACKUP_PAGES_PER_STEP stron; pomiędzy
+krokami blokada odczytu bazy jest zwalniana, więc zapisy serwera czekają
+najwyżej jeden krok. Wynik jest spójną migawką bazy, skompresowaną gzipem.
+
+Kopia przyrostowa zapisuje tylko strony, które zmieniły się od poprzedniej
+kopii (porównanie skrótów stron zapisanych obok każdej kopii). Odtworzenie
+składa kopię pełną i kolejne przyrostowe, a weryfikacja sprawdza skrót
+SHA-256 i `PRAGMA integrity_check` odtworzonej bazy.
+
+Użycie:
+    python backup.py create [--incremental]
+    python backup.py restore backups/backup_20250101_120000.json bank_restored.db
+    python backup.py verify backups/backup_20250101_120000.json
+    python backup.py bench --size-mb 2048
+"""
+import argparse
+import gzip
+import hashlib
+import json
 import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
 from datetime import datetime
+from decouple import config
+
+BACKUP_DIR = config("BACKUP_DIR", default="backups")
+BACKUP_PAGES_PER_STEP = config("BACKUP_PAGES_PER_STEP", default=256, cast=int)  # Stron na krok (4 KiB strona = 1 MiB)
+BACKUP_STEP_SLEEP = config("BACKUP_STEP_SLEEP", default=0.005, cast=float)  # Przerwa dla zapisów między krokami (s)
+BACKUP_MAX_RESTARTS = config("BACKUP_MAX_RESTARTS", default=5, cast=int)  # Po tylu restartach kopia kończy się błędem
+BACKUP_MAX_PAGES_PER_STEP = config("BACKUP_MAX_PAGES_PER_STEP", default=4096, cast=int)  # Górny limit kroku po restartach (16 MiB)
+BACKUP_COMPRESS_LEVEL = config("BACKUP_COMPRESS_LEVEL", default=1, cast=int)  # Poziom 1: kilkukrotnie szybciej, podobny stopień kompresji
+
+PAGE_DIGEST_SIZE = 8  # Bajtów skrótu BLAKE2b na stronę (wykrywanie zmian, nie integralność)
+CHUNK_SIZE = 1024 * 1024
+
+
+# ---------------------------
+# Migawka bazy przez API backup
+# ---------------------------
+class BackupRestarted(Exception):
+    """
+    Kopia była restartowana zbyt wiele razy przez zapisy do bazy źródłowej.
+    """
+
+def snapshot(db_file: str, target_file: str, pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP) -> dict:
+    """
+    Kopiuje spójną migawkę bazy do `target_file` partiami po `pages` stron.
+
+    Zapis do bazy źródłowej przez inne połączenie w trakcie kopii powoduje jej
+    restart od początku. Po każdym restarcie kopia zaczyna się od nowa z
+    dwukrotnie większym krokiem (najwyżej BACKUP_MAX_PAGES_PER_STEP stron), więc
+    potrzebuje mniej kroków, a blokada odczytu nadal jest trzymana tylko przez
+    jeden krok. Po BACKUP_MAX_RESTARTS restartach zgłaszany jest BackupRestarted.
+    """
+    stats = {"steps": 0, "restarts": 0, "max_step_ms": 0.0}
+    state = {"last": time.perf_counter(), "remaining": None}
+
+    def progress(status, remaining, total):
+        now = time.perf_counter()
+        stats["steps"] += 1
+        stats["max_step_ms"] = max(stats["max_step_ms"], (now - state["last"]) * 1000)
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            raise BackupRestarted()  # Przerwanie kopii: ponowienie z większym krokiem
+        state["remaining"] = remaining
+        if sleep and remaining:
+            time.sleep(sleep)  # Blokada odczytu zwolniona: serwer może zatwierdzać transakcje
+        state["last"] = time.perf_counter()
+
+    started = time.perf_counter()
+    source = sqlite3.connect(db_file)
+    target = sqlite3.connect(target_file)
+    try:
+        while True:
+            state.update({"remaining": None, "last": time.perf_counter()})
+            try:
+                source.backup(target, pages=pages, progress=progress)
+                break
+            except BackupRestarted:
+                stats["restarts"] += 1
+                if stats["restarts"] > BACKUP_MAX_RESTARTS:
+                    raise BackupRestarted(
+                        f"Database changed during backup {stats['restarts']} times "
+                        f"(last step {pages} pages); retry when the write load is lower"
+                    )
+                pages = max(pages, min(pages * 2, BACKUP_MAX_PAGES_PER_STEP))
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+
+    stats.update({
+        "page_size": page_size,
+        "page_count": page_count,
+        "snapshot_seconds": round(time.perf_counter() - started, 3),
+        "max_step_ms": round(stats["max_step_ms"], 2),
+        "pages_per_step": pages,
+    })
+    return stats
 
-def create_backup():
-    # Ścieżka do pliku bazy danych
-    db_file = "bank.db"
-    backup_dir = "backups"
+def read_pages(path: str, page_size: int):
+    with open(path, "rb") as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+def page_digests(path: str, page_size: int) -> bytes:
+    return b"".join(hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest() for page in read_pages(path, page_size))
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------------------------
+# Manifesty kopii
+# ---------------------------
+def load_manifest(path: str) -> dict:
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest["path"] = path
+    return manifest
+
+def latest_manifest(backup_dir: str):
+    manifests = sorted(name for name in os.listdir(backup_dir) if name.startswith("backup_") and name.endswith(".json"))
+    return load_manifest(os.path.join(backup_dir, manifests[-1])) if manifests else None
+
+def backup_chain(manifest_path: str) -> list:
+    """
+    Zwraca listę manifestów od kopii pełnej do wskazanej (włącznie).
+    """
+    chain = [load_manifest(manifest_path)]
+    while chain[0]["parent"]:
+        chain.insert(0, load_manifest(os.path.join(os.path.dirname(manifest_path), chain[0]["parent"])))
+    return chain
+
+
+# ---------------------------
+# Tworzenie kopii
+# ---------------------------
+def create_backup(db_file: str = "bank.db", backup_dir: str = BACKUP_DIR, incremental: bool = False,
+                  compress_level: int = BACKUP_COMPRESS_LEVEL, pages: int = BACKUP_PAGES_PER_STEP) -> dict:
+    """
+    Tworzy kopię pełną lub przyrostową (względem ostatniej kopii w `backup_dir`).
+    Zwraca manifest kopii wraz z czasami poszczególnych etapów.
+    """
     os.makedirs(backup_dir, exist_ok=True)  # Tworzy folder na backupy, jeśli nie istnieje
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    name = f"backup_{timestamp}"
+    parent = latest_manifest(backup_dir) if incremental else None
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=backup_dir) as tmp:
+        snapshot_file = os.path.join(tmp, "snapshot.db")
+        stats = snapshot(db_file, snapshot_file, pages=pages)
+        page_size, page_count = stats["page_size"], stats["page_count"]
+
+        phase = time.perf_counter()
+        digests = page_digests(snapshot_file, page_size)
+        sha256 = file_sha256(snapshot_file)
+        stats["hash_seconds"] = round(time.perf_counter() - phase, 3)
+
+        if parent is not None and parent["page_size"] != page_size:
+            parent = None  # Zmiana rozmiaru strony: potrzebna kopia pełna
+
+        phase = time.perf_counter()
+        if parent is None:
+            data_file = f"{name}.db.gz"
+            with open(snapshot_file, "rb") as src, gzip.open(os.path.join(backup_dir, data_file), "wb", compresslevel=compress_level) as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    dst.write(chunk)
+            changed_pages = page_count
+        else:
+            # Tylko strony, których skrót różni się od poprzedniej kopii: numer strony + zawartość
+            with open(os.path.join(backup_dir, parent["digests"]), "rb") as f:
+                previous = f.read()
+            data_file = f"{name}.pages.gz"
+            changed_pages = 0
+            with gzip.open(os.path.join(backup_dir, data_file), "wb", compresslevel=compress_level) as dst:
+                for number, page in enumerate(read_pages(snapshot_file, page_size)):
+                    offset = number * PAGE_DIGEST_SIZE
+                    if digests[offset:offset + PAGE_DIGEST_SIZE] != previous[offset:offset + PAGE_DIGEST_SIZE]:
+                        dst.write(struct.pack(">I", number))
+                        dst.write(page)
+                        changed_pages += 1
+        stats["compress_seconds"] = round(time.perf_counter() - phase, 3)
+
+    digests_file = f"{name}.digests"
+    with open(os.path.join(backup_dir, digests_file), "wb") as f:
+        f.write(digests)
+
+    size = page_size * page_count
+    output_size = os.path.getsize(os.path.join(backup_dir, data_file))
+    elapsed = time.perf_counter() - started
+    manifest = {
+        "type": "incremental" if parent else "full",
+        "parent": os.path.basename(parent["path"]) if parent else None,
+        "created_at": datetime.now().isoformat(),
+        "data": data_file,
+        "digests": digests_file,
+        "page_size": page_size,
+        "page_count": page_count,
+        "changed_pages": changed_pages,
+        "sha256": sha256,
+        "timings": {
+            **stats,
+            "total_seconds": round(elapsed, 3),
+            "database_mb": round(size / 2 ** 20, 1),
+            "output_mb": round(output_size / 2 ** 20, 1),
+            "throughput_mb_s": round(size / 2 ** 20 / elapsed, 1) if elapsed else None,
+        },
+    }
+    manifest_path = os.path.join(backup_dir, f"{name}.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    manifest["path"] = manifest_path
+
+    print(f"Backup został utworzony: {manifest_path} ({manifest['type']}, {changed_pages}/{page_count} stron)")
+    return manifest
+
+
+# ---------------------------
+# Odtwarzanie i weryfikacja
+# ---------------------------
+def restore_backup(manifest_path: str, target_file: str, force: bool = False) -> dict:
+    """
+    Odtwarza bazę z kopii (pełnej lub przyrostowej wraz z jej poprzednikami)
+    i sprawdza jej skrót. Plik docelowy jest podmieniany dopiero po udanym odtworzeniu.
+    """
+    if os.path.exists(target_file) and not force:
+        raise FileExistsError(f"{target_file} already exists (use --force to overwrite)")
+
+    started = time.perf_counter()
+    chain = backup_chain(manifest_path)
+    backup_dir = os.path.dirname(manifest_path)
+    final = chain[-1]
+    page_size = final["page_size"]
+
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_file)), suffix=".restore")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            with gzip.open(os.path.join(backup_dir, chain[0]["data"]), "rb") as src:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+            for manifest in chain[1:]:
+                with gzip.open(os.path.join(backup_dir, manifest["data"]), "rb") as src:
+                    while True:
+                        header = src.read(4)
+                        if not header:
+                            break
+                        (number,) = struct.unpack(">I", header)
+                        out.seek(number * page_size)
+                        out.write(src.read(page_size))
+            out.truncate(final["page_count"] * page_size)  # Baza mogła się zmniejszyć (VACUUM)
+
+        if file_sha256(tmp_file) != final["sha256"]:
+            raise ValueError(f"Restored database does not match backup checksum ({manifest_path})")
+        os.replace(tmp_file, target_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+        raise
+
+    elapsed = time.perf_counter() - started
+    print(f"Odtworzono {target_file} z {len(chain)} kopii w {elapsed:.2f} s")
+    return {"backups": len(chain), "restore_seconds": round(elapsed, 3)}
+
+def verify_backup(manifest_path: str) -> dict:
+    """
+    Odtwarza kopię do pliku tymczasowego i uruchamia PRAGMA integrity_check.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        restored = os.path.join(tmp, "verify.db")
+        result = restore_backup(manifest_path, restored)
+        started = time.perf_counter()
+        connection = sqlite3.connect(restored)
+        try:
+            integrity = connection.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            connection.close()
+        result["integrity_check_seconds"] = round(time.perf_counter() - started, 3)
+
+    result["ok"] = integrity == "ok"
+    print(f"Weryfikacja {manifest_path}: {integrity}")
+    return result
+
+
+# ---------------------------
+# Pomiar czasów na syntetycznej bazie
+# ---------------------------
+def benchmark(size_mb: int, change_percent: float, workdir: str) -> dict:
+    """
+    Tworzy syntetyczną bazę o rozmiarze ok. `size_mb` MiB, wykonuje kopię pełną,
+    zmienia `change_percent` % wierszy, wykonuje kopię przyrostową oraz weryfikację.
+    """
+    import random
+
+    db_file = os.path.join(workdir, "bench.db")
+    backup_dir = os.path.join(workdir, "backups")
+    rng = random.Random(7)
+    row = 512
+    rows = size_mb * 2 ** 20 // (row + 32)
+
+    started = time.perf_counter()
+    connection = sqlite3.connect(db_file)
+    connection.execute("CREATE TABLE logs (id INTEGER PRIMARY KEY, details BLOB)")
+    batch = 10000
+    for start in range(0, rows, batch):
+        connection.executemany("INSERT INTO logs (details) VALUES (?)",
+                               ((rng.randbytes(row // 2).hex().encode(),) for _ in range(min(batch, rows - start))))
+        connection.commit()
+    connection.close()
+    results = {"create_db_seconds": round(time.perf_counter() - started, 1)}
+
+    results["full"] = create_backup(db_file, backup_dir)["timings"]
+
+    connection = sqlite3.connect(db_file)
+    changed = max(1, int(rows * change_percent / 100))
+    connection.executemany("UPDATE logs SET details = ? WHERE id = ?",
+                           ((rng.randbytes(row // 2).hex().encode(), rng.randint(1, rows)) for _ in range(changed)))
+    connection.commit()
+    connection.close()
+    incremental = create_backup(db_file, backup_dir, incremental=True)
+    results["incremental"] = {**incremental["timings"], "changed_pages": incremental["changed_pages"]}
+    results["verify"] = verify_backup(incremental["path"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="utwórz kopię")
+    create.add_argument("--db", default="bank.db")
+    create.add_argument("--dir", default=BACKUP_DIR)
+    create.add_argument("--incremental", action="store_true", help="tylko strony zmienione od ostatniej kopii")
+    create.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="stron na krok")
+    create.add_argument("--level", type=int, default=BACKUP_COMPRESS_LEVEL, help="poziom kompresji gzip")
+
+    restore = commands.add_parser("restore", help="odtwórz bazę z kopii")
+    restore.add_argument("manifest")
+    restore.add_argument("target")
+    restore.add_argument("--force", action="store_true", help="nadpisz istniejący plik")
+
+    verify = commands.add_parser("verify", help="sprawdź kopię")
+    verify.add_argument("manifest")
+
+    bench = commands.add_parser("bench", help="zmierz czasy na syntetycznej bazie")
+    bench.add_argument("--size-mb", type=int, default=2048)
+    bench.add_argument("--change-percent", type=float, default=1.0)
+    bench.add_argument("--workdir", default=None)
+
+    args = parser.parse_args()
+    if args.command == "create":
+        try:
+            manifest = create_backup(args.db, args.dir, incremental=args.incremental, compress_level=args.level, pages=args.pages)
+        except BackupRestarted as e:
+            sys.exit(str(e))
+        print(json.dumps(manifest["timings"], indent=2))
+    elif args.command == "restore":
+        try:
+            restore_backup(args.manifest, args.target, force=args.force)
+        except (FileExistsError, ValueError) as e:
+            sys.exit(str(e))
+    elif args.command == "verify":
+        sys.exit(0 if verify_backup(args.manifest)["ok"] else 1)
+    else:
+        with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+            print(json.dumps(benchmark(args.size_mb, args.change_percent, workdir), indent=2))
 
-    # Nazwa pliku backupu z timestampem
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = f"{backup_dir}/backup_{timestamp}.db"
 
-    # Tworzenie kopii zapasowej
-    shutil.copy(db_file, backup_file)
-    print(f"Backup został utworzony: {backup_file}")
+if __name__ == "__main__":
+    main()
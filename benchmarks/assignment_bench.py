@@ -0,0 +1,81 @@
+"""
+Benchmark przydziału użytkowników do serwerów.
+
+Mierzy koszt pojedynczego wyszukiwania na pierścieniu spójnego haszowania
+oraz odsetek kluczy przenoszonych przy zmianie członkostwa klastra,
+w porównaniu z dawnym przydziałem `md5(username) % len(servers)`.
+
+Uruchomienie: python -m benchmarks.assignment_bench
+"""
+import argparse
+import hashlib
+import timeit
+
+from utils.assignment import HashRing
+
+
+def modulo_assign(username: str, servers: list) -> str:
+    """
+    Dawny przydział (przed pierścieniem) – punkt odniesienia.
+    """
+    return servers[int(hashlib.md5(username.encode()).hexdigest(), 16) % len(servers)]
+
+
+def remapped_fraction(before: dict, after: dict) -> float:
+    return sum(1 for key in before if before[key] != after[key]) / len(before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--vnodes", type=int, default=160)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    urls = [f"https://localhost:{8001 + i}" for i in range(args.nodes)]
+    keys = [f"user{i}" for i in range(args.keys)]
+    ring = HashRing({url: 1 for url in urls}, vnodes=args.vnodes)
+
+    # Koszt wyszukiwania
+    healthy = set(urls[1:])
+    for label, stmt in (
+        ("modulo", lambda: modulo_assign("user12345", urls)),
+        ("ring.get_node", lambda: ring.get_node("user12345")),
+        ("ring.get_healthy_node (failover)", lambda: ring.get_healthy_node("user12345", healthy)),
+    ):
+        seconds = timeit.timeit(stmt, number=args.lookups)
+        print(f"{label:<36} {seconds / args.lookups * 1e9:8.0f} ns/lookup")
+
+    # Odsetek przeniesionych kluczy przy dodaniu i usunięciu serwera
+    new_url = f"https://localhost:{8001 + args.nodes}"
+    ring_before = {key: ring.get_node(key) for key in keys}
+    modulo_before = {key: modulo_assign(key, urls) for key in keys}
+
+    ring.add_node(new_url)
+    ring_added = {key: ring.get_node(key) for key in keys}
+    modulo_added = {key: modulo_assign(key, urls + [new_url]) for key in keys}
+    ring.remove_node(new_url)
+
+    ring.remove_node(urls[0])
+    ring_removed = {key: ring.get_node(key) for key in keys}
+    modulo_removed = {key: modulo_assign(key, urls[1:]) for key in keys}
+
+    print()
+    print(f"{'remapped keys':<36} {'ring':>8} {'modulo':>8} {'ideal':>8}")
+    print(f"{'add node':<36} {remapped_fraction(ring_before, ring_added):8.1%} "
+          f"{remapped_fraction(modulo_before, modulo_added):8.1%} {1 / (args.nodes + 1):8.1%}")
+    print(f"{'remove node':<36} {remapped_fraction(ring_before, ring_removed):8.1%} "
+          f"{remapped_fraction(modulo_before, modulo_removed):8.1%} {1 / args.nodes:8.1%}")
+
+    # Równomierność obciążenia
+    counts = {}
+    for node in ring_before.values():
+        counts[node] = counts.get(node, 0) + 1
+    print()
+    for url in urls:
+        print(f"{url:<36} {counts.get(url, 0) / len(keys):8.1%} of keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark warstwy bazy danych dla endpointów async na jednym workerze.
+
+Porównuje endpoint `async def` wykonujący zapytania przez synchroniczną
+sesję (blokuje pętlę zdarzeń, stan sprzed zmiany) z endpointem używającym
+`AsyncSession` (aiosqlite). Raportuje przepustowość przy równoległych
+żądaniach oraz najdłuższe zablokowanie pętli zdarzeń.
+
+Uruchomienie: python -m benchmarks.async_db_bench
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import crud, models
+from database.database import Base
+
+
+def build_app(path: str, accounts: int, pool_size: int) -> FastAPI:
+    # Pula wielkości współbieżności: przy mniejszej blokujące zapytanie czeka na połączenie
+    # trzymane przez zawieszone żądanie i cała pętla stoi do pool_timeout
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=pool_size)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as db:
+        user = models.User(username="bench", password="x", full_name="Bench", pesel="bench")
+        db.add(user)
+        db.flush()
+        db.add_all(models.Account(owner_id=user.id, balance=1000) for _ in range(accounts))
+        db.commit()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=pool_size)
+    async_session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    def get_db():
+        with session_factory() as db:
+            yield db
+
+    async def get_async_db():
+        async with async_session_factory() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.get("/sync/{account_id}")
+    async def sync_balance(account_id: int, db: Session = Depends(get_db)):
+        return {"balance": crud.get_account(db, account_id).balance}
+
+    @app.get("/async/{account_id}")
+    async def async_balance(account_id: int, db: AsyncSession = Depends(get_async_db)):
+        return {"balance": (await crud.get_account_async(db, account_id)).balance}
+
+    return app
+
+
+async def heartbeat(stop: asyncio.Event, stalls: list):
+    # Mierzy opóźnienie wybudzenia pętli zdarzeń względem oczekiwanego
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - started - 0.001)
+
+
+async def drive(app: FastAPI, prefix: str, requests: int, concurrency: int, accounts: int):
+    rng = random.Random(7)
+    semaphore = asyncio.Semaphore(concurrency)
+    stop, stalls = asyncio.Event(), []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get(f"/{prefix}/{rng.randint(1, accounts)}")
+                response.raise_for_status()
+
+        ticker = asyncio.create_task(heartbeat(stop, stalls))
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+
+    print(f"{prefix:<6} {requests / elapsed:10.0f} req/s  max loop stall {max(stalls) * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--accounts", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, "bench.db"), args.accounts, args.concurrency)
+        asyncio.run(drive(app, "sync", args.requests, args.concurrency, args.accounts))
+        asyncio.run(drive(app, "async", args.requests, args.concurrency, args.accounts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Benchmark end-to-end całego stosu: load-balancer przed serwerami main:app.
+
+Uruchamia lokalnie `--backends` serwerów (uvicorn) na wspólnej, świeżo
+zasianej bazie w katalogu tymczasowym (konta i tokeny są wstawiane
+bezpośrednio, bez bcrypt dla każdego użytkownika) oraz load-balancer,
+a następnie przez `--duration` sekund wysyła żądania w mieszance `--mix`
+przy współbieżności `--concurrency`. Dostępne operacje:
+
+  balance   odczyt salda własnego konta
+  deposit   wpłata na własne konto
+  transfer  przelew między kontami użytkownika
+  hot       przelew na jedno z `--hot-accounts` kont (rywalizacja o wiersze)
+  logs      odczyt historii operacji konta
+  login     logowanie i wylogowanie (bcrypt, "burza logowań")
+
+Wynik (przepustowość, p50/p95/p99 na operację, commit) jest zapisywany jako
+JSON; `--compare poprzedni.json` pokazuje zmianę względem wcześniejszego
+przebiegu.
+
+Uruchomienie: python -m benchmarks.e2e_bench --mix deposit=40,transfer=20,hot=20,logs=20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import httpx
+from sqlalchemy import create_engine, insert
+
+from database import models
+from database.database import Base
+from database.rollups import rebuild_rollups
+from utils.hashing import pwd_context
+from utils.security import create_access_token, encrypt_data
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPERATIONS = ("balance", "deposit", "transfer", "hot", "logs", "login")
+BENCH_PASSWORD = "bench-password"
+
+# Gotowe mieszanki (--scenario); --mix nadpisuje
+SCENARIOS = {
+    "mixed": "balance=30,deposit=25,transfer=20,hot=10,logs=10,login=5",
+    "contention": "hot=80,balance=20",
+    "login-storm": "login=100",
+    "history": "logs=90,deposit=10",
+}
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ---------------------------
+# Przygotowanie danych
+# ---------------------------
+def seed(path: str, args) -> dict:
+    """
+    Zasiewa bazę bezpośrednio (bez API): użytkowników z aktywnymi tokenami,
+    ich konta z historią operacji, konta "gorące" i użytkowników do logowania.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    # Jeden hash dla wszystkich (bcrypt tylko raz), z liczbą rund serwerów, aby logowanie nie haszowało ponownie
+    context = pwd_context.copy(bcrypt__rounds=args.bcrypt_rounds) if args.bcrypt_rounds else pwd_context
+    password = context.hash(BENCH_PASSWORD)
+    rng = random.Random(3)
+    now = datetime.now(timezone.utc)
+
+    users, storm_users = [], []
+    with engine.begin() as connection:
+        def add_user(username: str, token: str = None) -> int:
+            return connection.execute(insert(models.User).values(
+                username=username, password=password, full_name=username.title(),
+                pesel=encrypt_data(f"{username}-pesel"), active_token=token,
+            )).inserted_primary_key[0]
+
+        def add_account(owner_id: int, balance: int) -> int:
+            return connection.execute(
+                insert(models.Account).values(owner_id=owner_id, balance=balance, held=0)
+            ).inserted_primary_key[0]
+
+        hot_owner = add_user("hot-owner")
+        hot_accounts = [add_account(hot_owner, 0) for _ in range(args.hot_accounts)]
+
+        for i in range(args.users):
+            username = f"bench{i}"
+            token = create_access_token(data={"sub": username})
+            user_id = add_user(username, token)
+            accounts = [add_account(user_id, args.initial_balance) for _ in range(args.accounts_per_user)]
+            users.append({"username": username, "token": token, "accounts": accounts})
+
+        for i in range(args.storm_users):
+            add_user(f"storm{i}")
+            storm_users.append(f"storm{i}")
+
+        # Historia operacji dla odczytów logów
+        rows = []
+        for user in users:
+            for account_id in user["accounts"]:
+                for _ in range(args.logs_per_account):
+                    amount = rng.randint(1, 500)
+                    rows.append({
+                        "account_id": account_id,
+                        "operation": "deposit",
+                        "timestamp": now - timedelta(seconds=rng.randint(0, 90 * 86400)),
+                        "details": encrypt_data(f"Deposited {amount}"),
+                        "amount": amount,
+                        "direction": "in",
+                    })
+                if len(rows) >= 5000:
+                    connection.execute(insert(models.Log), rows)
+                    rows = []
+        if rows:
+            connection.execute(insert(models.Log), rows)
+    rebuild_rollups(engine)
+    engine.dispose()
+    return {"users": users, "storm_users": storm_users, "hot_accounts": hot_accounts}
+
+
+# ---------------------------
+# Uruchomienie stosu
+# ---------------------------
+def start_stack(workdir: str, args) -> Tuple[List[subprocess.Popen], List[str]]:
+    """
+    Uruchamia serwery i load-balancer. Zwraca procesy i adresy do sprawdzenia
+    gotowości (ostatni jest adresem, pod który trafia ruch).
+    """
+    backend_ports = [free_port() for _ in range(args.backends)]
+    backend_urls = [f"http://127.0.0.1:{port}" for port in backend_ports]
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT,
+        EVENT_BUS_DIR=os.path.join(workdir, "bus"),
+        PEER_SERVERS=",".join(f"ws://127.0.0.1:{port}/sync" for port in backend_ports),
+        CLUSTER_SERVERS=",".join(backend_urls),
+    )
+    if args.bcrypt_rounds:
+        env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+    processes = []
+    log = open(os.path.join(workdir, "servers.log"), "w")
+    for i, port in enumerate(backend_ports):
+        # Zadania w tle (przelewy cykliczne, rozliczenia, archiwizacja logów) tylko w jednym procesie
+        backend_env = dict(env, RECURRING_SCHEDULER=str(i == 0), PENDING_SETTLER=str(i == 0),
+                           LOG_ARCHIVER=str(i == 0))
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+             "--workers", str(args.backend_workers)],
+            cwd=workdir, env=backend_env, stdout=log, stderr=subprocess.STDOUT,
+        ))
+
+    if not args.lb:
+        return processes, backend_urls[:1]
+
+    lb_port = free_port()
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "load_balancer:app", "--port", str(lb_port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    ))
+    return processes, backend_urls + [f"http://127.0.0.1:{lb_port}"]
+
+
+async def wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not become ready in {timeout:.0f} s")
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ---------------------------
+# Generowanie ruchu
+# ---------------------------
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, data: dict, weights: Dict[str, int], seed_value: int):
+        self.client = client
+        self.users = data["users"]
+        self.hot_accounts = data["hot_accounts"]
+        self.storm_users: asyncio.Queue = asyncio.Queue()
+        for username in data["storm_users"]:
+            self.storm_users.put_nowait(username)
+        self.operations = list(weights)
+        self.weights = list(weights.values())
+        self.rng = random.Random(seed_value)
+
+        self.latencies: Dict[str, List[float]] = {name: [] for name in weights}
+        self.failed: Dict[str, int] = {name: 0 for name in weights}  # Odpowiedź z "status": "error"
+        self.errors: Dict[str, int] = {name: 0 for name in weights}  # Kod HTTP inny niż 200 lub błąd połączenia
+        self.recording = False
+
+    async def _call(self, method: str, path: str, as_user: str, token: str = None, **params) -> httpx.Response:
+        headers = {"X-Username": as_user}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return await self.client.request(method, path, params=params, headers=headers)
+
+    async def _request(self, name: str) -> List[httpx.Response]:
+        user = self.rng.choice(self.users)
+        username, token, accounts = user["username"], user["token"], user["accounts"]
+        account_id = self.rng.choice(accounts)
+
+        if name == "balance":
+            return [await self._call("GET", f"/accounts/{account_id}/balance", username, token)]
+        if name == "deposit":
+            return [await self._call("POST", f"/accounts/{account_id}/deposit", username, token, amount=10)]
+        if name == "transfer":
+            to_account_id = self.rng.choice([a for a in accounts if a != account_id] or accounts)
+            return [await self._call("POST", "/accounts/transfer", username, token,
+                                     from_account_id=account_id, to_account_id=to_account_id, amount=1)]
+        if name == "hot":
+            return [await self._call("POST", "/accounts/transfer", username, token, from_account_id=account_id,
+                                     to_account_id=self.rng.choice(self.hot_accounts), amount=1)]
+        if name == "logs":
+            return [await self._call("GET", f"/accounts/{account_id}/logs", username, token)]
+
+        # login: użytkownik z puli jest zajęty aż do wylogowania
+        username = await self.storm_users.get()
+        try:
+            login = await self._call("POST", "/users/login", username, username=username, password=BENCH_PASSWORD)
+            body = login.json() if login.status_code == 200 else {}
+            if body.get("status") != "success":
+                return [login]
+            logout = await self._call("POST", "/users/logout", username, body["data"]["access_token"])
+            return [login, logout]
+        finally:
+            self.storm_users.put_nowait(username)
+
+    async def worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(self.operations, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                responses = await self._request(name)
+            except httpx.HTTPError:
+                responses = None
+            elapsed = time.perf_counter() - started
+            if not self.recording:
+                continue
+            if responses is None or any(response.status_code != 200 for response in responses):
+                self.errors[name] += 1
+                continue
+            if any(response.json().get("status") == "error" for response in responses):
+                self.failed[name] += 1
+            self.latencies[name].append(elapsed)
+
+    def summary(self, seconds: float) -> dict:
+        def describe(latencies: List[float], failed: int, errors: int) -> dict:
+            latencies = sorted(latencies)
+            return {
+                "requests": len(latencies) + errors,
+                "throughput": round((len(latencies) + errors) / seconds, 1),
+                "failed": failed,
+                "errors": errors,
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            }
+
+        operations = {
+            name: describe(self.latencies[name], self.failed[name], self.errors[name]) for name in self.operations
+        }
+        operations["total"] = describe(
+            [latency for values in self.latencies.values() for latency in values],
+            sum(self.failed.values()), sum(self.errors.values()),
+        )
+        return operations
+
+
+async def drive(url: str, data: dict, args) -> dict:
+    weights = parse_mix(args.mix or SCENARIOS[args.scenario])
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        workload = Workload(client, data, weights, args.seed)
+        started = time.perf_counter()
+        deadline = started + args.warmup + args.duration
+        workers = [asyncio.create_task(workload.worker(deadline)) for _ in range(args.concurrency)]
+        await asyncio.sleep(args.warmup)
+        workload.recording = True
+        await asyncio.gather(*workers)
+        return {"mix": weights, "operations": workload.summary(args.duration)}
+
+
+# ---------------------------
+# Raport
+# ---------------------------
+def print_table(result: dict, baseline: dict = None):
+    header = f"{'operation':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'failed':>7} {'errors':>7}"
+    print(header, file=sys.stderr)
+    for name, stats in result["operations"].items():
+        line = (f"{name:<10} {stats['throughput']:9.1f} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} "
+                f"{stats['p99_ms']:9.2f} {stats['failed']:7d} {stats['errors']:7d}")
+        previous = (baseline or {}).get("operations", {}).get(name)
+        if previous:
+            def change(key):
+                return f"{(stats[key] / previous[key] - 1) * 100:+.0f}%" if previous[key] else "n/a"
+            line += f"   vs {baseline.get('commit', '?')}: req/s {change('throughput')}, p99 {change('p99_ms')}"
+        print(line, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--mix", help="wagi operacji, np. deposit=40,logs=20 (nadpisuje --scenario)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="czas pomiaru (s)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="rozgrzewka bez pomiaru (s)")
+    parser.add_argument("--backends", type=int, default=2)
+    parser.add_argument("--backend-workers", type=int, default=1)
+    parser.add_argument("--no-lb", dest="lb", action="store_false", help="żądania bezpośrednio do pierwszego serwera")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--accounts-per-user", type=int, default=2)
+    parser.add_argument("--initial-balance", type=int, default=1_000_000)
+    parser.add_argument("--hot-accounts", type=int, default=4)
+    parser.add_argument("--storm-users", type=int, default=64)
+    parser.add_argument("--logs-per-account", type=int, default=200)
+    parser.add_argument("--bcrypt-rounds", type=int, help="BCRYPT_ROUNDS serwerów (domyślnie z konfiguracji)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="plik wyniku JSON (domyślnie stdout)")
+    parser.add_argument("--compare", help="wcześniejszy wynik JSON do porównania")
+    parser.add_argument("--keep", action="store_true", help="nie usuwaj katalogu roboczego (baza, logi serwerów)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bank-bench-")
+    processes = []
+    try:
+        seed_started = time.perf_counter()
+        data = seed(os.path.join(workdir, "bank.db"), args)
+        print(f"Seeded {args.users} users in {time.perf_counter() - seed_started:.1f} s ({workdir})", file=sys.stderr)
+
+        processes, urls = start_stack(workdir, args)
+        for url in urls:
+            asyncio.run(wait_ready(url))
+        result = asyncio.run(drive(urls[-1], data, args))
+    finally:
+        stop_stack(processes)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep")},
+        **result,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(result, baseline)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark ścieżki zapisu przelewów.
+
+Porównuje dawną ścieżkę (commit salda + osobny commit każdego logu, czyli
+3 commity na przelew) z jednostką pracy i grupowym zatwierdzaniem
+(`database.unit_of_work.GroupCommitter`). Raportuje liczbę commitów (fsync)
+na operację, przepustowość oraz opóźnienia p50/p99.
+
+Uruchomienie: python -m benchmarks.group_commit_bench
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import crud, models
+from database.database import Base
+from database.unit_of_work import GroupCommitter
+
+
+def make_database(path: str, accounts: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 60})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as db:
+        user = models.User(username="bench", password="x", full_name="Bench", pesel="bench")
+        db.add(user)
+        db.flush()
+        db.add_all(models.Account(owner_id=user.id, balance=10 ** 9) for _ in range(accounts))
+        db.commit()
+
+    commits = {"count": 0}
+
+    @event.listens_for(engine, "commit")
+    def count_commit(_):
+        commits["count"] += 1
+
+    return engine, session_factory, commits
+
+
+def transfer_work(from_account_id: int, to_account_id: int, amount: int):
+    async def apply(db):
+        from_account = await crud.get_account_async(db, from_account_id)
+        to_account = await crud.get_account_async(db, to_account_id)
+        from_account.balance -= amount
+        to_account.balance += amount
+        crud.log_operation(db, from_account_id, "transfer", f"Transferred {amount} to account {to_account_id}", commit=False)
+        crud.log_operation(db, to_account_id, "transfer", f"Received {amount} from account {from_account_id}", commit=False)
+        return True
+    return apply
+
+
+def legacy_transfer(session_factory, from_account_id: int, to_account_id: int, amount: int) -> float:
+    started = time.perf_counter()
+    with session_factory() as db:
+        from_account = db.query(models.Account).filter(models.Account.id == from_account_id).first()
+        to_account = db.query(models.Account).filter(models.Account.id == to_account_id).first()
+        from_account.balance -= amount
+        to_account.balance += amount
+        db.commit()
+        crud.log_operation(db, from_account_id, "transfer", f"Transferred {amount} to account {to_account_id}")
+        crud.log_operation(db, to_account_id, "transfer", f"Received {amount} from account {from_account_id}")
+    return time.perf_counter() - started
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def report(label, elapsed, latencies, commits, operations):
+    print(f"{label:<14} {operations / elapsed:10.0f} ops/s  "
+          f"{commits / operations:6.3f} fsyncs/op  "
+          f"p50 {percentile(latencies, 0.50) * 1000:8.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.2f} ms")
+
+
+def run_legacy(args, pairs):
+    path = os.path.join(args.dir, "legacy.db")
+    engine, session_factory, commits = make_database(path, args.accounts)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(lambda pair: legacy_transfer(session_factory, *pair, 1), pairs))
+    report("legacy", time.perf_counter() - started, latencies, commits["count"], len(pairs))
+    engine.dispose()
+
+
+async def run_group_commit(args, pairs):
+    path = os.path.join(args.dir, "group.db")
+    engine, _, _ = make_database(path, args.accounts)
+    engine.dispose()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    commits = {"count": 0}
+
+    @event.listens_for(async_engine.sync_engine, "commit")
+    def count_commit(_):
+        commits["count"] += 1
+
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    committer = GroupCommitter(session_factory=session_factory, window=args.window, max_batch=args.max_batch)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(pair):
+        async with semaphore:
+            started = time.perf_counter()
+            await committer.run(transfer_work(*pair, 1))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(pair) for pair in pairs))
+    report("group commit", time.perf_counter() - started, latencies, commits["count"], len(pairs))
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--window", type=float, default=0.002)
+    parser.add_argument("--max-batch", type=int, default=128)
+    parser.add_argument("--dir", default=None, help="Katalog na bazy testowe (domyślnie katalog tymczasowy)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    pairs = [tuple(rng.sample(range(1, args.accounts + 1), 2)) for _ in range(args.operations)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args.dir = args.dir or tmp
+        run_legacy(args, pairs)
+        asyncio.run(run_group_commit(args, pairs))
+
+
+if __name__ == "__main__":
+    main()
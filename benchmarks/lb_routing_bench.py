@@ -0,0 +1,105 @@
+"""
+Benchmark trybów wyboru serwera w load-balancerze przy nierównym ruchu.
+
+Serwery są symulowane w procesie (ASGI): każdy obsługuje najwyżej
+`--workers` żądań naraz, po `--service-ms` ms każde, więc opóźnienie rośnie
+z kolejką na serwerze. Część ruchu (`--hot-share`) pochodzi od jednego
+użytkownika, reszta od wielu. Raportuje p50/p99 i podział ruchu dla trybów
+hash, bounded i least.
+
+Uruchomienie: python -m benchmarks.lb_routing_bench
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import load_balancer
+from utils.health import HealthMonitor
+
+
+def backend_app(url: str, workers: int, service_ms: float, served: dict) -> FastAPI:
+    app = FastAPI()
+    semaphore = asyncio.Semaphore(workers)
+
+    @app.get("/{path:path}")
+    async def handle(path: str):
+        served[url] = served.get(url, 0) + 1
+        async with semaphore:
+            await asyncio.sleep(service_ms / 1000)
+        return {"ok": True}
+
+    return app
+
+
+async def run(mode: str, args) -> dict:
+    urls = [f"http://backend{i}" for i in range(args.backends)]
+    load_balancer.LB_ROUTING = mode
+    load_balancer.health_monitor = HealthMonitor([{"url": url} for url in urls])
+    load_balancer.assignment.ring = load_balancer.assignment.HashRing({url: 1 for url in urls})
+    load_balancer.clients.clear()
+    served = {}
+    for url in urls:
+        load_balancer.clients[url] = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=backend_app(url, args.workers, args.service_ms, served)), base_url=url
+        )
+
+    rng = random.Random(11)
+    users = [f"user{i}" for i in range(1000)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=load_balancer.app), base_url="http://lb") as client:
+        async def one():
+            nonlocal errors
+            username = "hot" if rng.random() < args.hot_share else rng.choice(users)
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get("/accounts/1/balance", headers={"X-Username": username})
+                if response.status_code != 200:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    for backend_client in load_balancer.clients.values():
+        await backend_client.aclose()
+    load_balancer.clients.clear()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "throughput": round(args.requests / elapsed),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1) if latencies else None,
+        "errors": errors,
+        "split": [served.get(url, 0) for url in urls],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=48)
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8, help="równoległe żądania na serwer")
+    parser.add_argument("--service-ms", type=float, default=10.0)
+    parser.add_argument("--hot-share", type=float, default=0.6, help="udział ruchu jednego użytkownika")
+    parser.add_argument("--modes", default="hash,bounded,least")
+    args = parser.parse_args()
+
+    for mode in args.modes.split(","):
+        result = asyncio.run(run(mode, args))
+        print(f"{result['mode']:<8} {result['throughput']:6d} req/s  p50 {result['p50_ms']:7.1f} ms  "
+              f"p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}  "
+              f"split {result['split']}")
+
+
+if __name__ == "__main__":
+    main()
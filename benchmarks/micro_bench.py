@@ -0,0 +1,78 @@
+"""
+Mikrobenchmarki gorących ścieżek: przydział serwera, Fernet i bcrypt.
+
+Mierzy czas pojedynczego wywołania `assign_server` (wszystkie serwery zdrowe
+i failover), szyfrowania/deszyfrowania Fernet dla typowych rozmiarów danych
+oraz haszowania i weryfikacji bcrypt dla podanych liczb rund. Wynik jest
+zapisywany jako JSON, aby można go było porównać między commitami.
+
+Uruchomienie: python -m benchmarks.micro_bench --bcrypt-rounds 10,12
+"""
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime, timezone
+
+from benchmarks.e2e_bench import git_commit
+from utils import assignment
+from utils.hashing import BCRYPT_ROUNDS, pwd_context
+from utils.security import decrypt_data, encrypt_data
+
+
+def measure(stmt, number: int, repeat: int = 5) -> float:
+    """
+    Zwraca najlepszy czas jednego wywołania (s) z `repeat` serii.
+    """
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--fernet-calls", type=int, default=20_000)
+    parser.add_argument("--bcrypt-rounds", default=str(BCRYPT_ROUNDS), help="lista liczb rund, np. 10,12")
+    parser.add_argument("--bcrypt-calls", type=int, default=3)
+    parser.add_argument("--output", help="plik wyniku JSON (domyślnie stdout)")
+    args = parser.parse_args()
+
+    results = {}
+
+    # Przydział serwera
+    urls = [server["url"] for server in assignment.servers]
+    owner = assignment.assign_server("user12345")
+    failover = [url for url in urls if url != owner] or urls  # Właściciel klucza niedostępny
+    results["assign_server"] = measure(lambda: assignment.assign_server("user12345"), args.lookups)
+    results["assign_server_healthy"] = measure(lambda: assignment.assign_server("user12345", urls), args.lookups)
+    results["assign_server_failover"] = measure(lambda: assignment.assign_server("user12345", failover), args.lookups)
+
+    # Fernet: PESEL i typowy opis operacji w logu
+    for label, value in (("pesel", "90010112345"), ("log_details", "Transferred 12500 to account 1234567 (pending 42)")):
+        token = encrypt_data(value)
+        results[f"fernet_encrypt_{label}"] = measure(lambda: encrypt_data(value), args.fernet_calls)
+        results[f"fernet_decrypt_{label}"] = measure(lambda: decrypt_data(token), args.fernet_calls)
+
+    # bcrypt
+    for rounds in (int(r) for r in args.bcrypt_rounds.split(",")):
+        context = pwd_context.copy(bcrypt__rounds=rounds)
+        hashed = context.hash("bench-password")
+        results[f"bcrypt_hash_{rounds}"] = measure(lambda: context.hash("bench-password"), args.bcrypt_calls, 1)
+        results[f"bcrypt_verify_{rounds}"] = measure(lambda: context.verify("bench-password", hashed), args.bcrypt_calls, 1)
+
+    for name, seconds in results.items():
+        print(f"{name:<32} {seconds * 1e6:12.2f} us/call", file=sys.stderr)
+
+    output = json.dumps({
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "us_per_call": {name: round(seconds * 1e6, 3) for name, seconds in results.items()},
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
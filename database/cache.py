@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from typing import Iterable, List, Optional, Tuple
+from database import models
+from utils.event_bus import event_bus
+from utils.metrics import registry
+
+ACCOUNT_CACHE_SIZE = config("ACCOUNT_CACHE_SIZE", default=100000, cast=int)
+ACCOUNT_CACHE_TTL = config("ACCOUNT_CACHE_TTL", default=10.0, cast=float)  # Maks. wiek wpisu (s): granica nieaktualności po utraconym unieważnieniu
+ACCOUNT_INVALIDATE_CHUNK = 4096  # Kont w jednym zdarzeniu unieważnienia (mieści się w datagramie szyny)
+
+
+class CachedAccount:
+    """
+    Migawka konta przechowywana w cache (niezwiązana z sesją bazy).
+    """
+    __slots__ = ("id", "owner_id", "balance", "held")
+
+    def __init__(self, id: int, owner_id: int, balance: int, held: int = 0):
+        self.id = id
+        self.owner_id = owner_id
+        self.balance = balance
+        self.held = held
+
+    @property
+    def available(self) -> int:
+        return self.balance - self.held
+
+
+# ---------------------------
+# Cache kont w pamięci procesu
+# ---------------------------
+class AccountCache:
+    """
+    Ograniczony cache LRU kont z zapisem przez cache (write-through).
+
+    Każdy commit zmieniający konto aktualizuje wpis (zdarzenia sesji poniżej),
+    a pozostałe workery i serwery unieważniają swoje kopie. Odczyt z bazy
+    uzupełnia cache tylko wtedy, gdy w międzyczasie nic się nie zmieniło,
+    aby nie nadpisać nowszego salda starszym.
+
+    Unieważnienia przez szynę zdarzeń mogą zostać utracone, dlatego wpisy
+    wygasają po `ttl` sekundach, a wykryta utrata czyści cały cache.
+    """
+
+    def __init__(self, max_size: int = ACCOUNT_CACHE_SIZE, ttl: float = ACCOUNT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[CachedAccount, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0  # Rośnie przy każdej zmianie; chroni przed wyścigiem odczyt-zapis
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.clears = 0
+
+    def get(self, account_id: int) -> Optional[CachedAccount]:
+        with self._lock:
+            entry = self._entries.get(account_id)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[account_id]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(account_id)
+            self.hits += 1
+            return entry[0]
+
+    def _store(self, account: CachedAccount):
+        self._entries[account.id] = (account, time.monotonic() + self.ttl)
+        self._entries.move_to_end(account.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def put(self, account: CachedAccount):
+        """
+        Zapisuje stan konta po zatwierdzonej zmianie.
+        """
+        with self._lock:
+            self.generation += 1
+            self._store(account)
+
+    def fill(self, account: CachedAccount, generation: int):
+        """
+        Uzupełnia cache wynikiem odczytu z bazy rozpoczętego przy danej generacji.
+        """
+        with self._lock:
+            if generation == self.generation and account.id not in self._entries:
+                self._store(account)
+
+    def invalidate(self, account_ids: Iterable[int]):
+        with self._lock:
+            self.generation += 1
+            for account_id in account_ids:
+                self._entries.pop(account_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.clears += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "clears": self.clears,
+        }
+
+
+account_cache = AccountCache()
+
+registry.counter("account_cache_requests_total", "Account cache lookups", ("result",),
+                 function=lambda: {("hit",): account_cache.hits, ("miss",): account_cache.misses})
+registry.counter("account_cache_clears_total", "Account cache clears after lost invalidations",
+                 function=lambda: account_cache.clears)
+
+
+# ---------------------------
+# Zapis przez cache przy każdym commicie
+# ---------------------------
+@event.listens_for(Session, "after_flush")
+def _collect_changed_accounts(db, flush_context):
+    changed = db.info.setdefault("changed_accounts", {})
+    for obj in list(db.new) + list(db.dirty):
+        if isinstance(obj, models.Account):
+            changed[obj.id] = CachedAccount(obj.id, obj.owner_id, obj.balance, obj.held or 0)
+    for obj in db.deleted:
+        if isinstance(obj, models.Account):
+            changed[obj.id] = None
+
+@event.listens_for(Session, "after_commit")
+def _write_through(db):
+    changed = db.info.pop("changed_accounts", None)
+    if not changed:
+        return
+    for account_id, account in changed.items():
+        if account is None:
+            account_cache.invalidate([account_id])
+        else:
+            account_cache.put(account)
+    # Pozostałe workery unieważniają swoje kopie
+    _publish_invalidation(list(changed))
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_accounts(db):
+    changed = db.info.pop("changed_accounts", None)
+    if changed:
+        account_cache.invalidate(changed)
+
+def invalidate_accounts(account_ids: Iterable[int]):
+    """
+    Unieważnia konta zmienione poza tym procesem (np. przez inny serwer) we wszystkich workerach.
+    """
+    account_ids = list(account_ids)
+    if account_ids:
+        account_cache.invalidate(account_ids)
+        _publish_invalidation(account_ids)
+
+def _publish_invalidation(account_ids: List[int]):
+    # Porcje mieszczące się w jednym datagramie szyny zdarzeń
+    for start in range(0, len(account_ids), ACCOUNT_INVALIDATE_CHUNK):
+        event_bus.publish("accounts", {
+            "origin": os.getpid(), "invalidate": account_ids[start:start + ACCOUNT_INVALIDATE_CHUNK]
+        })
+
+def _on_accounts_event(data: dict):
+    if data.get("origin") != os.getpid():
+        account_cache.invalidate(data.get("invalidate", []))
+
+event_bus.subscribe("accounts", _on_accounts_event)
+event_bus.on_loss("accounts", account_cache.clear)  # Nieznane, które konta się zmieniły: wszystkie
@@ -1,31 +1,18 @@
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from database import models
+from database.cache import CachedAccount, account_cache
+from database.database import after_commit
+from database.partitions import archived_logs, log_partitions
+from database.rollups import accumulate, new_totals, rollup_statement
 from utils.hashing import hash_password
 from utils.security import encrypt_data, decrypt_data
 from datetime import datetime, timezone
-import asyncio
-import websockets
+from utils.peers import peer_manager
+from typing import Dict, Iterable, List, Set, Tuple
 
-# Lista adresów innych serwerów do synchronizacji
-peer_servers = [
-    "ws://localhost:8001/sync",
-    "ws://localhost:8002/sync",
-    "ws://localhost:8003/sync"
-]
-
-# ---------------------------
-# Funkcja do powiadamiania serwerów
-# ---------------------------
-async def notify_peers(data: str):
-    """
-    Wysyła dane do innych serwerów za pomocą WebSocketów.
-    """
-    for server in peer_servers:
-        try:
-            async with websockets.connect(server) as websocket:
-                await websocket.send(data)
-        except Exception as e:
-            print(f"Failed to notify {server}: {e}")
+IN_CLAUSE_CHUNK = 500  # Maks. liczba ID w jednym zapytaniu IN
 
 # ---------------------------
 # Operacje CRUD dla User
@@ -53,6 +40,23 @@ def create_user(db: Session, username: str, password: str, full_name: str, pesel
     db.refresh(user)
     return user
 
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    """
+    Pobiera użytkownika po nazwie przez sesję asynchroniczną.
+    """
+    return (await db.execute(select(models.User).where(models.User.username == username))).scalar_one_or_none()
+
+async def create_user_async(db: AsyncSession, username: str, hashed_password: str, full_name: str, pesel: str):
+    """
+    Tworzy nowego użytkownika przez sesję asynchroniczną.
+    Hasło musi być już zahaszowane (haszowanie odbywa się w puli procesów bcrypt).
+    """
+    encrypted_pesel = encrypt_data(pesel)  # Szyfrowanie PESEL
+    user = models.User(username=username, password=hashed_password, full_name=full_name, pesel=encrypted_pesel)
+    db.add(user)
+    await db.commit()
+    return user
+
 # ---------------------------
 # Operacje CRUD dla Account
 # ---------------------------
@@ -62,6 +66,22 @@ def get_account(db: Session, account_id: int):
     """
     return db.query(models.Account).filter(models.Account.id == account_id).first()
 
+def get_account_cached(db: Session, account_id: int):
+    """
+    Pobiera migawkę konta (id, owner_id, balance, held) z cache, a przy braku wpisu z bazy danych.
+    Do odczytów; operacje zmieniające saldo muszą pobierać konto z bazy.
+    """
+    cached = account_cache.get(account_id)
+    if cached is not None:
+        return cached
+    generation = account_cache.generation
+    account = get_account(db, account_id)
+    if account is None:
+        return None
+    cached = CachedAccount(account.id, account.owner_id, account.balance, account.held)
+    account_cache.fill(cached, generation)
+    return cached
+
 def create_account(db: Session, owner_id: int, balance: int = 0):
     """
     Tworzy nowe konto przypisane do danego użytkownika.
@@ -72,6 +92,60 @@ def create_account(db: Session, owner_id: int, balance: int = 0):
     db.refresh(account)
     return account
 
+async def get_owned_account_ids_async(db: AsyncSession, owner_id: int, account_ids: Iterable[int]) -> Set[int]:
+    """
+    Zwraca te z podanych kont, których właścicielem jest użytkownik.
+    """
+    account_ids = sorted(set(account_ids))
+    owned = set()
+    for start in range(0, len(account_ids), IN_CLAUSE_CHUNK):
+        owned.update((await db.execute(
+            select(models.Account.id).where(
+                models.Account.id.in_(account_ids[start:start + IN_CLAUSE_CHUNK]),
+                models.Account.owner_id == owner_id
+            )
+        )).scalars())
+    return owned
+
+async def get_account_async(db: AsyncSession, account_id: int, for_update: bool = False):
+    """
+    Pobiera konto na podstawie jego ID przez sesję asynchroniczną.
+    """
+    query = select(models.Account).where(models.Account.id == account_id)
+    if for_update:
+        query = query.with_for_update()
+    return (await db.execute(query)).scalar_one_or_none()
+
+async def create_account_async(db: AsyncSession, owner_id: int, balance: int = 0, commit: bool = True):
+    """
+    Tworzy nowe konto przez sesję asynchroniczną.
+    Z `commit=False` konto jest tylko dodawane do bieżącej transakcji (jednostka pracy).
+    """
+    account = models.Account(owner_id=owner_id, balance=balance)
+    db.add(account)
+    await db.flush()  # Nadanie ID bez zatwierdzania
+    if commit:
+        await db.commit()
+    return account
+
+async def get_accounts_async(db: AsyncSession, account_ids: Iterable[int], for_update: bool = False) -> Dict[int, models.Account]:
+    """
+    Pobiera wiele kont naraz, zawsze w kolejności rosnących ID (deterministyczna kolejność blokad).
+    """
+    account_ids = sorted(set(account_ids))
+    accounts = {}
+    for start in range(0, len(account_ids), IN_CLAUSE_CHUNK):
+        query = (
+            select(models.Account)
+            .where(models.Account.id.in_(account_ids[start:start + IN_CLAUSE_CHUNK]))
+            .order_by(models.Account.id)
+        )
+        if for_update:
+            query = query.with_for_update()
+        for account in (await db.execute(query)).scalars():
+            accounts[account.id] = account
+    return accounts
+
 def update_account_balance(db: Session, account_id: int, amount: int):
     """
     Aktualizuje saldo konta z blokadą na poziomie bazy danych.
@@ -83,48 +157,206 @@ def update_account_balance(db: Session, account_id: int, amount: int):
         db.refresh(account)
     return account
 
+# ---------------------------
+# Operacje CRUD dla PendingTransfer
+# ---------------------------
+async def create_pending_transfer_async(db: AsyncSession, from_account_id: int, to_account_id: int, amount: int):
+    """
+    Dodaje przelew oczekujący do bieżącej transakcji (bez zatwierdzania).
+    Blokadę środków na koncie źródłowym ustawia wywołujący.
+    """
+    pending = models.PendingTransfer(from_account_id=from_account_id, to_account_id=to_account_id, amount=amount)
+    db.add(pending)
+    await db.flush()  # Nadanie ID bez zatwierdzania
+    return pending
+
+async def get_pending_transfers_async(db: AsyncSession, transfer_ids: Iterable[int]) -> Dict[int, models.PendingTransfer]:
+    """
+    Pobiera wiele przelewów oczekujących naraz (zapytania IN porcjami).
+    """
+    transfer_ids = sorted(set(transfer_ids))
+    transfers = {}
+    for start in range(0, len(transfer_ids), IN_CLAUSE_CHUNK):
+        query = select(models.PendingTransfer).where(
+            models.PendingTransfer.id.in_(transfer_ids[start:start + IN_CLAUSE_CHUNK])
+        )
+        for transfer in (await db.execute(query)).scalars():
+            transfers[transfer.id] = transfer
+    return transfers
+
+# ---------------------------
+# Operacje CRUD dla RecurringTransfer
+# ---------------------------
+def create_recurring_transfer(db: Session, from_account_id: int, to_account_id: int, amount: int,
+                              frequency: str, next_run_at: datetime, commit: bool = True):
+    """
+    Tworzy zlecenie stałe wykonywane przez harmonogram przelewów cyklicznych.
+    """
+    recurring = models.RecurringTransfer(
+        from_account_id=from_account_id,
+        to_account_id=to_account_id,
+        amount=amount,
+        frequency=frequency,
+        next_run_at=next_run_at,
+        anchor_day=next_run_at.day
+    )
+    db.add(recurring)
+    db.flush()  # Nadanie ID bez zatwierdzania
+    if commit:
+        db.commit()
+    return recurring
+
 # ---------------------------
 # Logowanie operacji
 # ---------------------------
-def log_operation(db: Session, account_id: int, operation: str, details: str):
+def log_operation(db: Session, account_id: int, operation: str, details: str, commit: bool = True,
+                  amount: int = None, counterparty_account_id: int = None, direction: str = None):
     """
     Loguje operację na koncie, zapisuje ją w bazie danych i synchronizuje z innymi serwerami.
+    Kwota, konto drugiej strony i kierunek ("in"/"out") są zapisywane jawnie,
+    a opis `details` jest szyfrowany.
+    Z `commit=False` log jest tylko dodawany do bieżącej transakcji (jednostka pracy);
+    w tym trybie `db` może być również sesją asynchroniczną.
     """
     encrypted_details = encrypt_data(details)  # Szyfrowanie szczegółów logu
+    timestamp = datetime.now(timezone.utc)  # Użycie timezone-aware datetime
     log = models.Log(
         account_id=account_id,
         operation=operation,
         details=encrypted_details,
-        timestamp=datetime.now(timezone.utc)  # Użycie timezone-aware datetime
+        timestamp=timestamp,
+        amount=amount,
+        counterparty_account_id=counterparty_account_id,
+        direction=direction
     )
     db.add(log)
-    db.commit()
 
-    # Notyfikacja innych serwerów
-    asyncio.create_task(notify_peers(f"Log: {operation}, Details: {details}"))
+    # Notyfikacja innych serwerów po zatwierdzeniu (kolejkowana, wysyłana w ramkach przez trwałe połączenia)
+    after_commit(db, lambda: peer_manager.publish({
+        "operation": operation,
+        "account_id": account_id,
+        "details": details,
+        "amount": amount,
+        "counterparty_account_id": counterparty_account_id,
+        "direction": direction,
+        "timestamp": timestamp.isoformat(),
+    }))
+
+    if commit:
+        db.commit()
 
     return log
 
+def ledger_entry(account_id: int, operation: str, details: str, amount: int = None,
+                 counterparty_account_id: int = None, direction: str = None) -> dict:
+    """
+    Wpis do `log_operations_async` (kolumny jak w `log_operation`, opis jeszcze niezaszyfrowany).
+    """
+    return {
+        "account_id": account_id,
+        "operation": operation,
+        "details": details,
+        "amount": amount,
+        "counterparty_account_id": counterparty_account_id,
+        "direction": direction,
+    }
+
+async def log_operations_async(db: AsyncSession, entries: List[dict]):
+    """
+    Loguje wiele operacji (wpisy z `ledger_entry`) jednym wielowierszowym INSERT
+    w bieżącej transakcji, bez tworzenia obiektów ORM. Nie zatwierdza transakcji.
+    """
+    if not entries:
+        return
+    timestamp = datetime.now(timezone.utc)
+    await db.execute(insert(models.Log), [
+        {**entry, "details": encrypt_data(entry["details"]), "timestamp": timestamp}
+        for entry in entries
+    ])
+
+    # Dzienne zestawienia w tej samej transakcji
+    totals = new_totals()
+    for entry in entries:
+        accumulate(totals, entry["account_id"], timestamp, entry["operation"], entry["amount"], entry["direction"])
+    await db.execute(rollup_statement(totals))
+
+    def publish():
+        for entry in entries:
+            peer_manager.publish({**entry, "timestamp": timestamp.isoformat()})
+
+    after_commit(db, publish)
+
 # ---------------------------
 # Pobieranie logów operacji
 # ---------------------------
-def get_logs_for_account(db: Session, account_id: int, start_date=None, end_date=None, operation_type=None):
+def _log_conditions(columns, account_id: int, start_date=None, end_date=None, operation_type=None,
+                   min_amount: int = None, max_amount: int = None, cursor: tuple = None) -> list:
     """
-    Pobiera logi operacji z możliwością filtrowania i odszyfrowaniem szczegółów.
+    Warunki filtrowania logów konta dla kolumn gorącej tabeli lub archiwum.
     """
-    query = db.query(models.Log).filter(models.Log.account_id == account_id)
+    conditions = [columns.account_id == account_id]
 
     # Filtrowanie według zakresu dat
     if start_date:
-        query = query.filter(models.Log.timestamp >= start_date)
+        conditions.append(columns.timestamp >= start_date)
     if end_date:
-        query = query.filter(models.Log.timestamp <= end_date)
+        conditions.append(columns.timestamp <= end_date)
 
     # Filtrowanie według rodzaju operacji
     if operation_type:
-        query = query.filter(models.Log.operation == operation_type)
+        conditions.append(columns.operation == operation_type)
+
+    # Filtrowanie według kwoty (kolumna jawna, bez odszyfrowywania)
+    if min_amount is not None:
+        conditions.append(columns.amount >= min_amount)
+    if max_amount is not None:
+        conditions.append(columns.amount <= max_amount)
+
+    # Kolejna strona: logi starsze niż (timestamp, id) z kursora
+    if cursor:
+        cursor_timestamp, cursor_id = cursor
+        conditions.append(or_(
+            columns.timestamp < cursor_timestamp,
+            and_(columns.timestamp == cursor_timestamp, columns.id < cursor_id)
+        ))
+    return conditions
+
+def get_logs_for_account(db: Session, account_id: int, start_date=None, end_date=None, operation_type=None,
+                         limit: int = None, cursor: tuple = None, min_amount: int = None, max_amount: int = None):
+    """
+    Pobiera logi operacji z możliwością filtrowania i odszyfrowaniem szczegółów.
+    Filtry są wykonywane w SQL; `cursor` = (timestamp, id) ostatniego logu poprzedniej
+    strony (paginacja keyset), `limit` ogranicza liczbę zwracanych (i odszyfrowanych) logów.
+    Czytane są tylko partycje (gorąca tabela, archiwa miesięczne) nakładające się
+    na zakres dat, od najnowszej, do zebrania `limit` logów.
+    """
+    conditions = dict(start_date=start_date, end_date=end_date, operation_type=operation_type,
+                      min_amount=min_amount, max_amount=max_amount, cursor=cursor)
+    upper = cursor[0] if cursor and (end_date is None or cursor[0] < end_date) else end_date
+    read_hot, hot_from, archives = log_partitions.plan(start_date, upper)
+
+    logs = []
+    if read_hot:
+        query = db.query(models.Log).filter(*_log_conditions(models.Log.__table__.c, account_id, **conditions))
+        if hot_from:
+            query = query.filter(models.Log.timestamp >= hot_from)
+        query = query.order_by(models.Log.timestamp.desc(), models.Log.id.desc())
+        if limit:
+            query = query.limit(limit)
+        logs = query.all()
 
-    logs = query.order_by(models.Log.timestamp.desc()).all()
+    for archive in archives:
+        if limit and len(logs) >= limit:
+            break
+        query = (
+            select(archived_logs)
+            .where(*_log_conditions(archived_logs.c, account_id, **conditions))
+            .order_by(archived_logs.c.timestamp.desc(), archived_logs.c.id.desc())
+        )
+        if limit:
+            query = query.limit(limit - len(logs))
+        with archive.engine.connect() as connection:
+            logs.extend(models.Log(**row._mapping) for row in connection.execute(query))  # Obiekty spoza sesji
 
     # Odszyfrowanie szczegółów logów
     for log in logs:
@@ -134,5 +366,79 @@ def get_logs_for_account(db: Session, account_id: int, start_date=None, end_date
 
     return logs
 
+def iter_logs_for_account(db: Session, account_id: int, start_date=None, end_date=None, operation_type=None,
+                          chunk_size: int = 1000, min_amount: int = None, max_amount: int = None):
+    """
+    Zwraca kolejne odszyfrowane logi konta, pobierając je z bazy porcjami (paginacja keyset).
+    Pamięć nie rośnie z długością historii: po każdej porcji obiekty są odłączane od sesji.
+    """
+    cursor = None
+    while True:
+        logs = get_logs_for_account(db, account_id, start_date, end_date, operation_type,
+                                    limit=chunk_size, cursor=cursor, min_amount=min_amount, max_amount=max_amount)
+        if not logs:
+            return
+        cursor = (logs[-1].timestamp, logs[-1].id)
+        db.expunge_all()
+        yield from logs
+        if len(logs) < chunk_size:
+            return
 
+def get_account_totals(db: Session, account_id: int, start_date=None, end_date=None, operation_type=None) -> dict:
+    """
+    Zwraca sumy wpływów i wypływów oraz liczbę operacji konta, liczone w SQL
+    na jawnych kolumnach (bez odszyfrowywania opisów), w partycjach z zakresu dat.
+    """
+    def totals_query(columns):
+        return (
+            select(columns.direction, func.count(), func.coalesce(func.sum(columns.amount), 0))
+            .where(columns.direction.is_not(None),
+                   *_log_conditions(columns, account_id, start_date, end_date, operation_type))
+            .group_by(columns.direction)
+        )
+
+    read_hot, hot_from, archives = log_partitions.plan(start_date, end_date)
+    results = []
+    if read_hot:
+        query = totals_query(models.Log.__table__.c)
+        if hot_from:
+            query = query.where(models.Log.timestamp >= hot_from)
+        results.extend(db.execute(query))
+    for archive in archives:
+        with archive.engine.connect() as connection:
+            results.extend(connection.execute(totals_query(archived_logs.c)))
+
+    totals = {"inflow": 0, "outflow": 0, "inflow_count": 0, "outflow_count": 0}
+    for direction, count, amount in results:
+        key = "inflow" if direction == "in" else "outflow"
+        totals[key] += amount
+        totals[f"{key}_count"] += count
+    totals["net"] = totals["inflow"] - totals["outflow"]
+    return totals
+
+def get_account_summary(db: Session, account_id: int, start_day=None, end_day=None, operation_type=None,
+                        period: str = "day") -> list:
+    """
+    Zwraca wpływy, wypływy i liczbę operacji konta w podziale na dni lub miesiące
+    i rodzaj operacji, z dziennych zestawień (bez czytania logów).
+    """
+    totals = models.AccountDailyTotal
+    bucket = totals.day if period == "day" else func.substr(totals.day, 1, 7)
+    query = (
+        select(bucket, totals.operation, func.sum(totals.inflow), func.sum(totals.outflow),
+               func.sum(totals.operation_count))
+        .where(totals.account_id == account_id)
+        .group_by(bucket, totals.operation)
+        .order_by(bucket, totals.operation)
+    )
+    if start_day:
+        query = query.where(totals.day >= start_day)
+    if end_day:
+        query = query.where(totals.day <= end_day)
+    if operation_type:
+        query = query.where(totals.operation == operation_type)
 
+    return [
+        {"period": str(key), "operation": operation, "inflow": inflow, "outflow": outflow, "count": count}
+        for key, operation, inflow, outflow, count in db.execute(query)
+    ]
@@ -1,8 +1,15 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from utils.metrics import FAST_BUCKETS, registry
+import logging
+import time
 
 DATABASE_URL = "sqlite:///./bank.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./bank.db"
+
+logger = logging.getLogger(__name__)
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -14,3 +21,116 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def ensure_columns():
+    """
+    Dodaje brakujące kolumny zdefiniowane w modelach do istniejących tabel.
+    Kolumny NOT NULL muszą mieć `server_default`, inaczej SQLite ich nie doda.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = f"{column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    if not column.nullable:
+                        definition += " NOT NULL"
+                    definition += f" DEFAULT {column.server_default.arg}"
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+                logger.info("Added column %s.%s", table.name, column.name)
+
+def ensure_indexes():
+    """
+    Tworzy brakujące indeksy zdefiniowane w modelach.
+    `create_all` pomija istniejące tabele, więc nowe indeksy nie trafiłyby do starszych baz.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logger.warning("Could not create index %s: %s", index.name, e)
+
+# Indeksy usunięte z modeli; starsze bazy nadal je mają i utrzymują przy każdym zapisie
+OBSOLETE_INDEXES = [
+    "ix_logs_id", "ix_logs_operation", "ix_logs_timestamp", "ix_logs_account_id", "ix_account_id_operation",
+]
+
+def drop_obsolete_indexes():
+    """
+    Usuwa indeksy, które nie są już zdefiniowane w modelach.
+    """
+    with engine.begin() as connection:
+        for name in OBSOLETE_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+# ---------------------------
+# Asynchroniczny dostęp do bazy (dla endpointów async)
+# ---------------------------
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# ---------------------------
+# Metryki zapytań i commitów
+# ---------------------------
+query_seconds = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("statement",), FAST_BUCKETS
+)
+commit_seconds = registry.histogram(
+    "db_commit_duration_seconds", "Session commit time (flush and COMMIT)", buckets=FAST_BUCKETS
+)
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+def _statement_kind(statement: str) -> str:
+    kind = statement.lstrip()[:6].upper()
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info["query_started"] = time.perf_counter()
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = connection.info.pop("query_started")
+    query_seconds.labels(_statement_kind(statement)).observe(time.perf_counter() - started)
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+@event.listens_for(Session, "before_commit")
+def _start_commit_timer(db):
+    db.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(Session, "after_commit", insert=True)  # Przed akcjami after_commit
+def _observe_commit(db):
+    started = db.info.pop("commit_started", None)
+    if started is not None:
+        commit_seconds.observe(time.perf_counter() - started)
+
+# ---------------------------
+# Akcje wykonywane po zatwierdzeniu transakcji
+# ---------------------------
+def after_commit(db, callback):
+    """
+    Rejestruje funkcję wywoływaną dopiero po udanym commicie sesji (np. notyfikacje).
+    Przy wycofaniu transakcji zarejestrowane funkcje są odrzucane.
+    Działa zarówno dla Session, jak i AsyncSession.
+    """
+    db.info.setdefault("after_commit", []).append(callback)
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(db):
+    for callback in db.info.pop("after_commit", []):
+        callback()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit(db):
+    db.info.pop("after_commit", None)
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from decouple import config
+from sqlalchemy import delete, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Awaitable, Callable, Optional, Tuple
+from database import models
+from database.database import AsyncSessionLocal, after_commit
+from database.unit_of_work import group_committer
+from utils.metrics import background_errors
+from utils.responses import error_response
+
+IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", default=86400, cast=int)  # Czas życia klucza (s)
+IDEMPOTENCY_CACHE_SIZE = config("IDEMPOTENCY_CACHE_SIZE", default=50000, cast=int)
+IDEMPOTENCY_PURGE_INTERVAL = config("IDEMPOTENCY_PURGE_INTERVAL", default=600, cast=int)  # Co ile sekund usuwać wygasłe klucze
+IDEMPOTENCY_PURGE_CHUNK = 1000
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+logger = logging.getLogger(__name__)
+
+
+def request_hash(endpoint: str, **params) -> str:
+    """
+    Skrót endpointu i parametrów żądania; ten sam klucz z innymi parametrami jest odrzucany.
+    """
+    payload = json.dumps({"endpoint": endpoint, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# ---------------------------
+# Magazyn kluczy idempotencji
+# ---------------------------
+class IdempotencyStore:
+    """
+    Magazyn odpowiedzi dla nagłówka Idempotency-Key.
+
+    Klucz jest zapisywany w tabeli `idempotency_keys` w tej samej transakcji
+    co zmiana salda, więc operacja i jej klucz są zatwierdzane razem albo wcale.
+    Zatwierdzone odpowiedzi trafiają do cache LRU w pamięci, dzięki czemu
+    powtórzone żądanie jest zwykle obsługiwane bez dostępu do bazy.
+    Klucze wygasają po IDEMPOTENCY_TTL sekundach.
+    """
+
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL, max_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[str, dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._purger: Optional[asyncio.Task] = None
+
+        # Statystyki
+        self.replays = 0
+        self.conflicts = 0
+        self.purged = 0
+
+    def _cached(self, user_id: int, key: str) -> Optional[Tuple[str, dict]]:
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            if entry[2] < time.time():
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return entry[0], entry[1]
+
+    def _remember(self, user_id: int, key: str, fingerprint: str, response: dict, created_at: float):
+        with self._lock:
+            self._entries[(user_id, key)] = (fingerprint, response, created_at + self.ttl)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def _stored(self, db: AsyncSession, user_id: int, key: str) -> Optional[Tuple[str, dict]]:
+        cached = self._cached(user_id, key)
+        if cached is not None:
+            return cached
+        row = await db.get(models.IdempotencyKey, (user_id, key))
+        if row is None:
+            return None
+        created_at = row.created_at.replace(tzinfo=timezone.utc).timestamp()
+        if created_at + self.ttl < time.time():
+            await db.delete(row)  # Wygasły, jeszcze nieusunięty: klucz zostanie zapisany od nowa
+            return None
+        response = json.loads(row.response)
+        self._remember(user_id, key, row.request_hash, response, created_at)
+        return row.request_hash, response
+
+    def _replay(self, stored: Tuple[str, dict], fingerprint: str) -> dict:
+        stored_fingerprint, response = stored
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            return error_response("Idempotency-Key already used for a different request", 422)
+        self.replays += 1
+        return response
+
+    async def run(self, user_id: int, key: Optional[str], fingerprint: str,
+                  work: Callable[[AsyncSession], Awaitable[dict]]) -> Tuple[dict, bool]:
+        """
+        Wykonuje operację przez group committer, chyba że klucz był już użyty.
+        Zwraca (odpowiedź, czy_powtórzona). Bez klucza operacja jest wykonywana zwykle.
+        """
+        if key is None:
+            return await group_committer.run(work), False
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return error_response("Idempotency-Key too long", 400), False
+
+        # Szybka ścieżka: powtórzenie obsłużone z pamięci, bez kolejki zapisu
+        cached = self._cached(user_id, key)
+        if cached is not None:
+            return self._replay(cached, fingerprint), True
+
+        replayed = False
+
+        async def idempotent_work(db: AsyncSession):
+            nonlocal replayed
+            # Ponowne sprawdzenie w transakcji: równoległe żądanie z tym kluczem mogło już zostać zatwierdzone
+            stored = await self._stored(db, user_id, key)
+            if stored is not None:
+                replayed = True
+                return self._replay(stored, fingerprint)
+
+            response = await work(db)
+            created_at = datetime.now(timezone.utc)
+            db.add(models.IdempotencyKey(
+                user_id=user_id,
+                key=key,
+                request_hash=fingerprint,
+                response=json.dumps(response),
+                created_at=created_at
+            ))
+            await db.flush()  # Widoczny dla kolejnych operacji tej samej partii group commit
+            after_commit(db, lambda: self._remember(user_id, key, fingerprint, response, created_at.timestamp()))
+            return response
+
+        response = await group_committer.run(idempotent_work)
+        return response, replayed
+
+    async def purge_expired(self, session_factory: Callable[[], AsyncSession] = AsyncSessionLocal) -> int:
+        """
+        Usuwa wygasłe klucze z bazy porcjami, aby nie blokować zapisów na długo.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        rowid = literal_column("rowid")
+        total = 0
+        async with session_factory() as db:
+            while True:
+                expired = select(rowid).select_from(models.IdempotencyKey).where(
+                    models.IdempotencyKey.created_at < cutoff
+                ).limit(IDEMPOTENCY_PURGE_CHUNK)
+                result = await db.execute(delete(models.IdempotencyKey).where(rowid.in_(expired)))
+                await db.commit()
+                total += result.rowcount
+                if result.rowcount < IDEMPOTENCY_PURGE_CHUNK:
+                    break
+        self.purged += total
+        return total
+
+    async def _purge_loop(self):
+        while True:
+            try:
+                await self.purge_expired()
+            except Exception:
+                background_errors.labels("idempotency_purge").inc()
+                logger.exception("Idempotency key purge failed")
+            await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
+
+    def start(self):
+        """
+        Uruchamia okresowe usuwanie wygasłych kluczy (wymaga działającej pętli zdarzeń).
+        """
+        if self._purger is None or self._purger.done():
+            self._purger = asyncio.get_running_loop().create_task(self._purge_loop())
+
+    async def stop(self):
+        if self._purger is not None:
+            self._purger.cancel()
+            self._purger = None
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._entries),
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "purged": self.purged,
+        }
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,143 @@
+"""
+Blokady kont w procesie (SQLite ignoruje `with_for_update()`).
+
+Konta są przypisane do stałej liczby pasków (ACCOUNT_LOCK_STRIPES), każdy
+pasek to sprawiedliwa blokada asyncio (oczekujący dostają ją w kolejności
+zgłoszenia). Operacja na kilku kontach bierze paski w kolejności rosnących
+numerów, więc dwie operacje nie mogą czekać na siebie nawzajem (brak
+zakleszczeń), a konta dzielące pasek są blokowane tylko raz.
+
+Blokada jest trzymana do zatwierdzenia transakcji: operacje na tym samym
+koncie są wykonywane po kolei, a operacje na niezwiązanych kontach biegną
+równolegle aż do wspólnego commitu (group commit). Blokady działają tylko
+w obrębie procesu.
+
+Każda zmiana `balance` lub `held` przechodzi przez `hold`: wpłaty, wypłaty,
+przelewy, operacje zbiorcze, przelewy oczekujące (utworzenie, decyzja,
+rozliczenie) oraz zlecenia stałe.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Iterable, List
+from decouple import config
+from utils.metrics import FAST_BUCKETS, registry
+
+ACCOUNT_LOCK_STRIPES = config("ACCOUNT_LOCK_STRIPES", default=1024, cast=int)
+ACCOUNT_LOCK_TIMEOUT = config("ACCOUNT_LOCK_TIMEOUT", default=5.0, cast=float)  # Maks. czas oczekiwania na blokady (s)
+
+
+class LockTimeout(Exception):
+    """
+    Blokady kont nie zostały uzyskane w wyznaczonym czasie.
+    """
+
+
+async def _acquire(lock: asyncio.Lock) -> bool:
+    """
+    Pobiera blokadę; zwraca True, jeśli trzeba było czekać. Wywołanie zaplanowane
+    przed `acquire()` wykonuje się tylko wtedy, gdy zadanie oddało sterowanie pętli.
+    """
+    suspended = []
+    handle = asyncio.get_running_loop().call_soon(suspended.append, True)
+    try:
+        await lock.acquire()
+    finally:
+        handle.cancel()
+    return bool(suspended)
+
+
+class AccountLockManager:
+    """
+    Paskowany menedżer blokad kont z kolejnością pobierania, limitem czasu
+    i statystykami rywalizacji.
+    """
+
+    def __init__(self, stripes: int = ACCOUNT_LOCK_STRIPES, timeout: float = ACCOUNT_LOCK_TIMEOUT):
+        self.stripes = stripes
+        self.timeout = timeout
+        self._locks = [asyncio.Lock() for _ in range(stripes)]  # asyncio.Lock obsługuje oczekujących FIFO
+
+        # Statystyki
+        self.acquisitions = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.held = 0
+
+    def stripes_for(self, account_ids: Iterable[int]) -> List[int]:
+        """
+        Zwraca numery pasków kont w kolejności pobierania (rosnąco, bez powtórzeń).
+        """
+        return sorted({account_id % self.stripes for account_id in account_ids})
+
+    @asynccontextmanager
+    async def hold(self, account_ids: Iterable[int], timeout: float = None):
+        """
+        Blokuje podane konta na czas bloku `async with`.
+        Zgłasza LockTimeout, jeśli wszystkich blokad nie uda się uzyskać w `timeout`;
+        już uzyskane blokady są wtedy zwalniane.
+        """
+        deadline = time.perf_counter() + (self.timeout if timeout is None else timeout)
+        started = time.perf_counter()
+        acquired = []
+        waited = False
+        try:
+            for stripe in self.stripes_for(account_ids):
+                lock = self._locks[stripe]
+                self.waiting += 1
+                try:
+                    waited |= await asyncio.wait_for(_acquire(lock), max(deadline - time.perf_counter(), 0))
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise LockTimeout(f"Timed out waiting for account lock (stripe {stripe})")
+                finally:
+                    self.waiting -= 1
+                acquired.append(lock)
+        except BaseException:
+            for lock in reversed(acquired):
+                lock.release()
+            raise
+
+        self.acquisitions += 1
+        self.contended += waited
+        lock_wait_seconds.observe(time.perf_counter() - started)
+        self.held += 1
+        held_since = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.held -= 1
+            lock_hold_seconds.observe(time.perf_counter() - held_since)
+            for lock in reversed(acquired):
+                lock.release()
+
+    def stats(self) -> dict:
+        return {
+            "stripes": self.stripes,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "contention_ratio": round(self.contended / self.acquisitions, 4) if self.acquisitions else 0.0,
+            "timeouts": self.timeouts,
+            "waiting": self.waiting,
+            "held": self.held,
+        }
+
+
+lock_wait_seconds = registry.histogram(
+    "account_lock_wait_seconds", "Time spent acquiring account locks", buckets=FAST_BUCKETS
+)
+lock_hold_seconds = registry.histogram(
+    "account_lock_hold_seconds", "Time account locks are held (until commit)", buckets=FAST_BUCKETS
+)
+
+account_locks = AccountLockManager()
+
+registry.counter("account_lock_acquisitions_total", "Account lock acquisitions",
+                 function=lambda: account_locks.acquisitions)
+registry.counter("account_lock_contended_total", "Account lock acquisitions that had to wait",
+                 function=lambda: account_locks.contended)
+registry.counter("account_lock_timeouts_total", "Account lock acquisitions that timed out",
+                 function=lambda: account_locks.timeouts)
+registry.gauge("account_lock_waiting", "Operations waiting for an account lock",
+               function=lambda: account_locks.waiting)
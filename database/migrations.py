@@ -0,0 +1,143 @@
+"""
+Migracje danych uruchamiane ręcznie (nowe kolumny tworzy `ensure_columns`).
+
+backfill-ledger: uzupełnia kolumny kwoty, konta drugiej strony i kierunku
+w starszych logach na podstawie odszyfrowanego opisu operacji. Logi są
+przetwarzane porcjami po id (paginacja keyset), a każda porcja jest
+zatwierdzana osobno, więc serwer może zapisywać w trakcie migracji.
+Migrację można przerwać i uruchomić ponownie.
+
+rebuild-rollups: przelicza dzienne zestawienia z tabeli logów (po
+backfill-ledger lub dla historii sprzed wprowadzenia zestawień).
+
+archive-logs: przenosi miesiące spoza okna retencji do archiwów tylko do
+odczytu (database/partitions.py). Obie powyższe migracje dotyczą tylko
+gorącej tabeli, więc starszą bazę należy zmigrować przed archiwizacją.
+
+Użycie:
+    python -m database.migrations backfill-ledger [--chunk-size 2000] [--pause 0.01]
+    python -m database.migrations rebuild-rollups [--since 2025-01-01]
+    python -m database.migrations archive-logs [--retention-months 12]
+"""
+import argparse
+import logging
+import re
+import time
+from datetime import date
+from typing import Optional, Tuple
+from cryptography.fernet import InvalidToken
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.engine import Engine
+from database import models
+from database.database import engine as default_engine
+from database.partitions import LOG_RETENTION_MONTHS, archive_logs
+from database.rollups import rebuild_rollups
+from utils.security import decrypt_data
+
+BACKFILL_CHUNK_SIZE = 2000
+
+logger = logging.getLogger(__name__)
+
+# Opisy zapisywane przez log_operation -> (kwota, konto drugiej strony, kierunek)
+LEDGER_PATTERNS = [
+    (re.compile(r"^Deposited (\d+)"), None, "in"),
+    (re.compile(r"^Withdrew (\d+)"), None, "out"),
+    (re.compile(r"^Transferred (\d+) to account (\d+)"), 2, "out"),
+    (re.compile(r"^Received (\d+) from account (\d+)"), 2, "in"),
+    (re.compile(r"^Pending transfer (?:\d+ )?of (\d+) to account (\d+)"), 2, None),  # Blokada, saldo bez zmian (starsze opisy bez numeru)
+    (re.compile(r"^Recurring transfer (?:\d+ )?of (\d+) to account (\d+)"), 2, None),  # Zlecenie lub nieudane wykonanie
+]
+
+
+def parse_ledger(details: str) -> Optional[Tuple[int, Optional[int], Optional[str]]]:
+    """
+    Zwraca (kwota, konto drugiej strony, kierunek) odczytane z opisu operacji
+    albo None, jeśli opis nie zawiera kwoty.
+    """
+    for pattern, counterparty_group, direction in LEDGER_PATTERNS:
+        match = pattern.match(details)
+        if match:
+            counterparty = int(match.group(counterparty_group)) if counterparty_group else None
+            return int(match.group(1)), counterparty, direction
+    return None
+
+
+def backfill_log_ledger(engine: Engine = default_engine, chunk_size: int = BACKFILL_CHUNK_SIZE,
+                        pause: float = 0.0) -> dict:
+    """
+    Uzupełnia kolumny amount/counterparty_account_id/direction logów, w których są puste.
+    """
+    stats = {"scanned": 0, "updated": 0, "unparsed": 0, "undecryptable": 0}
+    statement = (
+        update(models.Log)
+        .where(models.Log.id == bindparam("log_id"))
+        .values(amount=bindparam("amount"), counterparty_account_id=bindparam("counterparty"),
+                direction=bindparam("direction"))
+    )
+    last_id = 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(models.Log.id, models.Log.details)
+                .where(models.Log.id > last_id, models.Log.amount.is_(None))
+                .order_by(models.Log.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            updates = []
+            for row in rows:
+                try:
+                    parsed = parse_ledger(decrypt_data(row.details)) if row.details else None
+                except InvalidToken:
+                    stats["undecryptable"] += 1
+                    continue
+                if parsed is None:
+                    stats["unparsed"] += 1
+                    continue
+                amount, counterparty, direction = parsed
+                updates.append({"log_id": row.id, "amount": amount, "counterparty": counterparty,
+                                "direction": direction})
+            if updates:
+                connection.execute(statement, updates)
+
+        stats["scanned"] += len(rows)
+        stats["updated"] += len(updates)
+        logger.info("Backfilled logs up to id %d: %d/%d updated", last_id, stats["updated"], stats["scanned"])
+        if pause:
+            time.sleep(pause)  # Okno dla zapisów serwera między porcjami
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-ledger", help="uzupełnij kolumny kwot w starszych logach")
+    backfill.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    backfill.add_argument("--pause", type=float, default=0.0, help="przerwa między porcjami (s)")
+
+    rebuild = commands.add_parser("rebuild-rollups", help="przelicz dzienne zestawienia z logów")
+    rebuild.add_argument("--since", type=date.fromisoformat, default=None, help="pierwszy przeliczany dzień (YYYY-MM-DD)")
+
+    archive = commands.add_parser("archive-logs", help="przenieś starsze miesiące logów do archiwów")
+    archive.add_argument("--retention-months", type=int, default=LOG_RETENTION_MONTHS,
+                         help="miesiące pozostające w gorącej tabeli (z bieżącym)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.command == "backfill-ledger":
+        print(backfill_log_ledger(chunk_size=args.chunk_size, pause=args.pause))
+    elif args.command == "rebuild-rollups":
+        print(rebuild_rollups(default_engine, since=args.since))
+    else:
+        print(archive_logs(retention_months=args.retention_months))
+
+
+if __name__ == "__main__":
+    main()
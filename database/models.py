@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Index, DateTime
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, Index, Date, DateTime
 from sqlalchemy.orm import relationship
 from database.database import Base
 from datetime import datetime, timezone
@@ -18,7 +18,8 @@ class User(Base):
 class Account(Base):
     __tablename__ = "accounts"
     id = Column(Integer, primary_key=True, index=True)  # Indeks dla klucza głównego
-    balance = Column(Integer, default=0)  # Domyślne saldo 0
+    balance = Column(Integer, default=0)  # Domyślne saldo 0 (saldo księgowe)
+    held = Column(Integer, default=0, server_default="0", nullable=False)  # Środki zablokowane przez przelewy oczekujące
     owner_id = Column(Integer, ForeignKey("users.id"), index=True)  # Indeks dla owner_id
     owner = relationship("User", back_populates="accounts")  # Relacja z tabelą `users`
 
@@ -27,20 +28,86 @@ class Account(Base):
         Index("ix_owner_id_balance", "owner_id", "balance"),  # Indeks wielopolowy
     )
 
+    @property
+    def available(self) -> int:
+        """
+        Saldo dostępne: saldo księgowe pomniejszone o środki zablokowane.
+        """
+        return (self.balance or 0) - (self.held or 0)
+
 class Log(Base):
     __tablename__ = "logs"
-    id = Column(Integer, primary_key=True, index=True)  # Indeks dla klucza głównego
-    operation = Column(String, index=True)  # Indeks dla rodzaju operacji
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)  # Poprawione na timezone-aware datetime
-    account_id = Column(Integer, ForeignKey("accounts.id"), index=True)  # Indeks dla account_id
-    details = Column(String, nullable=True)  # Szczegóły operacji (opcjonalne)
+    # Gorąca partycja logów (okno retencji); starsze miesiące są w archiwach (database/partitions.py)
+    id = Column(Integer, primary_key=True)  # Klucz główny to rowid, bez osobnego indeksu
+    operation = Column(String)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))  # Poprawione na timezone-aware datetime
+    account_id = Column(Integer, ForeignKey("accounts.id"))
+    details = Column(String, nullable=True)  # Szczegóły operacji (opcjonalne, szyfrowane)
+    amount = Column(Integer, nullable=True)  # Kwota operacji (jawnie, do filtrowania i sum)
+    counterparty_account_id = Column(Integer, nullable=True)  # Drugie konto przelewu
+    direction = Column(String, nullable=True)  # "in" / "out"; NULL, gdy saldo się nie zmienia (np. blokada)
     account = relationship("Account", back_populates="logs")  # Relacja z tabelą `accounts`
 
-    # Dodanie indeksów wielopolowych
+    # Tylko indeksy używane przez odczyty (każdy kolejny spowalnia zapis logu)
+    __table_args__ = (
+        Index("ix_account_id_timestamp", "account_id", "timestamp", "id"),  # Filtrowanie po koncie, dacie i paginacja keyset
+        Index("ix_account_id_amount_direction", "account_id", "amount", "direction"),  # Zakresy kwot i sumy (indeks pokrywający)
+    )
+
+class PendingTransfer(Base):
+    __tablename__ = "pending_transfers"
+    id = Column(Integer, primary_key=True, index=True)  # Indeks dla klucza głównego
+    from_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False, index=True)  # Konto źródłowe (środki zablokowane)
+    to_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)  # Konto docelowe
+    amount = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending / approved / rejected / settled
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    decided_at = Column(DateTime, nullable=True)  # Zatwierdzenie lub odrzucenie
+    settled_at = Column(DateTime, nullable=True)
+
+    # Rozliczanie pobiera zatwierdzone przelewy w kolejności ID
     __table_args__ = (
-        Index("ix_account_id_operation", "account_id", "operation"),  # Indeks wielopolowy
+        Index("ix_pending_status_id", "status", "id"),
     )
 
+class RecurringTransfer(Base):
+    __tablename__ = "recurring_transfers"
+    id = Column(Integer, primary_key=True, index=True)  # Indeks dla klucza głównego
+    from_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False, index=True)  # Konto źródłowe
+    to_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)  # Konto docelowe
+    amount = Column(Integer, nullable=False)
+    frequency = Column(String, nullable=False)  # daily / weekly / monthly
+    next_run_at = Column(DateTime, nullable=False)  # Termin następnego wykonania (UTC)
+    anchor_day = Column(Integer, nullable=True)  # Dzień miesiąca zleceń miesięcznych (termin przycięty do krótszego miesiąca wraca na ten dzień)
+    active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    # Harmonogram wczytuje tylko zlecenia z najbliższego okna czasowego
+    __table_args__ = (
+        Index("ix_recurring_active_next_run_at", "active", "next_run_at"),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # Klucze są unikalne w obrębie użytkownika
+    key = Column(String, primary_key=True)  # Wartość nagłówka Idempotency-Key
+    request_hash = Column(String, nullable=False)  # Skrót parametrów żądania (wykrywa ponowne użycie klucza)
+    response = Column(Text, nullable=False)  # Zapisana odpowiedź (JSON)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)  # Do wygaszania (TTL)
+
+class AccountDailyTotal(Base):
+    __tablename__ = "account_daily_totals"
+    # Klucz (konto, dzień, operacja): zestawienie konta w zakresie dat to jeden zakres klucza głównego
+    account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # Dzień operacji (UTC)
+    operation = Column(String, primary_key=True)
+    inflow = Column(Integer, nullable=False, default=0)  # Suma kwot z kierunkiem "in"
+    outflow = Column(Integer, nullable=False, default=0)  # Suma kwot z kierunkiem "out"
+    operation_count = Column(Integer, nullable=False, default=0)  # Liczba logów (także bez kwoty)
+
+    # Wiersze przechowywane w kolejności klucza (bez osobnego indeksu)
+    __table_args__ = {"sqlite_with_rowid": False}
+
 # Relacja między `accounts` a `logs`
 Account.logs = relationship("Log", back_populates="account")
 
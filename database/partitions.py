@@ -0,0 +1,326 @@
+"""
+Podział logów operacji na miesiące: gorąca tabela i archiwa.
+
+Miesiące z okna retencji (LOG_RETENTION_MONTHS, wraz z bieżącym) są
+w tabeli `logs`. Starsze miesiące są przenoszone do archiwów: osobnych
+plików SQLite `logs_YYYY_MM.db` w katalogu LOG_ARCHIVE_DIR, otwieranych
+tylko do odczytu. Archiwum jest zapisywane raz, w kolejności (konto, czas,
+id), do tabeli WITHOUT ROWID z takim kluczem głównym i kompaktowane
+(VACUUM), więc logi konta z danego miesiąca to jeden zakres klucza.
+
+Gorąca tabela zawiera tylko okno retencji, więc koszt zapisu i rozmiar
+jej indeksów nie rosną z długością historii. Odczyty sprawdzają tylko
+partycje nakładające się na żądany zakres dat (`LogPartitions.plan`).
+
+Archiwizację wykonuje raz na dobę proces z LOG_ARCHIVER=True (ustawione
+w dokładnie jednym procesie; domyślnie wyłączone) albo:
+    python -m database.migrations archive-logs [--retention-months 12]
+Przebiegi są dodatkowo wykluczane blokadą pliku `.archive.lock` w katalogu
+archiwów, więc równoległe uruchomienie tylko pomija przebieg.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, PrimaryKeyConstraint, String, Table,
+    and_, create_engine, delete, func, insert, select, tuple_
+)
+from sqlalchemy.engine import Engine
+from database import models
+from database.database import engine as default_engine
+from utils.metrics import background_errors, registry
+
+LOG_ARCHIVE_DIR = config("LOG_ARCHIVE_DIR", default="log_archive")
+LOG_RETENTION_MONTHS = config("LOG_RETENTION_MONTHS", default=12, cast=int)  # Miesiące w gorącej tabeli (z bieżącym)
+LOG_ARCHIVER = config("LOG_ARCHIVER", default=False, cast=bool)  # Czy ten proces archiwizuje logi (tylko jeden proces)
+LOG_ARCHIVE_INTERVAL = config("LOG_ARCHIVE_INTERVAL", default=86400, cast=int)  # Co ile sekund sprawdzać okno retencji
+ARCHIVE_CHUNK_SIZE = 5000  # Logów kopiowanych / usuwanych w jednej transakcji
+ARCHIVE_LOCK_FILE = ".archive.lock"
+TEMPORARY_PATTERN = re.compile(r"^logs_\d{4}_\d{2}\.db\.\d+\.tmp$")  # Archiwum w budowie (z PID procesu)
+
+logger = logging.getLogger(__name__)
+
+# Tabela `logs` w pliku archiwum: klucz główny (konto, czas, id), bez indeksów dodatkowych
+archive_metadata = MetaData()
+archived_logs = Table(
+    "logs", archive_metadata,
+    Column("account_id", Integer, nullable=False),
+    Column("timestamp", DateTime, nullable=False),
+    Column("id", Integer, nullable=False),
+    Column("operation", String),
+    Column("details", String),
+    Column("amount", Integer),
+    Column("counterparty_account_id", Integer),
+    Column("direction", String),
+    PrimaryKeyConstraint("account_id", "timestamp", "id"),
+    sqlite_with_rowid=False,
+)
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _as_datetime(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+# ---------------------------
+# Katalog archiwów
+# ---------------------------
+class LogArchive:
+    """
+    Archiwum logów z jednego miesiąca, otwierane tylko do odczytu.
+    """
+
+    def __init__(self, month: date, path: str):
+        self.month = month
+        self.path = path
+        self.start = _as_datetime(month)
+        self.end = _as_datetime(add_months(month, 1))
+        self._engine: Optional[Engine] = None
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(
+                f"sqlite:///file:{os.path.abspath(self.path)}?mode=ro&uri=true",
+                connect_args={"check_same_thread": False}
+            )
+        return self._engine
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        return (start is None or start < self.end) and (end is None or end >= self.start)
+
+    def dispose(self):
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+class LogPartitions:
+    """
+    Lista archiwów w katalogu. Katalog jest wczytywany ponownie po zmianie
+    (np. archiwizacji w innym procesie), więc każdy proces widzi nowe archiwa.
+    """
+    FILE_PATTERN = re.compile(r"^logs_(\d{4})_(\d{2})\.db$")
+
+    def __init__(self, directory: str = LOG_ARCHIVE_DIR):
+        self.directory = directory
+        self._archives: Dict[date, LogArchive] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_name(month: date) -> str:
+        return f"logs_{month.year:04d}_{month.month:02d}.db"
+
+    def _rescan(self):
+        found = {}
+        for name in os.listdir(self.directory):
+            match = self.FILE_PATTERN.match(name)
+            if match:
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                found[month] = self._archives.get(month) or LogArchive(month, os.path.join(self.directory, name))
+        for month, archive in self._archives.items():
+            if month not in found:
+                archive.dispose()
+        self._archives = found
+
+    def archives(self) -> List[LogArchive]:
+        """
+        Zwraca archiwa od najstarszego.
+        """
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._rescan()
+                    self._mtime = mtime
+        return [self._archives[month] for month in sorted(self._archives)]
+
+    def archived_until(self) -> Optional[datetime]:
+        """
+        Początek pierwszego niezarchiwizowanego miesiąca (None, gdy nie ma archiwów).
+        """
+        archives = self.archives()
+        return archives[-1].end if archives else None
+
+    def plan(self, start: Optional[datetime] = None,
+             end: Optional[datetime] = None) -> Tuple[bool, Optional[datetime], List[LogArchive]]:
+        """
+        Zwraca partycje nakładające się na zakres [start, end]: (czy czytać gorącą tabelę,
+        dolna granica gorącej tabeli, archiwa od najnowszego).
+        Logi z zarchiwizowanych miesięcy, których usuwanie z gorącej tabeli jeszcze
+        trwa, są pomijane przez dolną granicę, więc nie pojawiają się podwójnie.
+        """
+        archives = self.archives()
+        hot_from = archives[-1].end if archives else None
+        read_hot = hot_from is None or end is None or end >= hot_from
+        return read_hot, hot_from, [archive for archive in reversed(archives) if archive.overlaps(start, end)]
+
+
+log_partitions = LogPartitions()
+
+registry.gauge("log_archive_partitions", "Monthly read-only log archives", function=lambda: len(log_partitions.archives()))
+
+
+# ---------------------------
+# Archiwizacja miesięcy spoza okna retencji
+# ---------------------------
+def _copy_month(engine: Engine, path: str, start: datetime, end: datetime, chunk_size: int) -> int:
+    """
+    Kopiuje logi z miesiąca do nowego pliku archiwum w kolejności klucza archiwum.
+    Źródło jest czytane porcjami (paginacja keyset), każda w krótkiej transakcji,
+    aby nie blokować zapisów serwera na czas kopiowania całego miesiąca.
+    """
+    log = models.Log.__table__
+    columns = [log.c[column.name] for column in archived_logs.c]
+    key = tuple_(log.c.account_id, log.c.timestamp, log.c.id)
+    archive_engine = create_engine(f"sqlite:///{path}")
+    copied = 0
+    try:
+        archive_metadata.create_all(archive_engine)
+        last = None
+        while True:
+            query = (
+                select(*columns)
+                .where(log.c.account_id.is_not(None), log.c.timestamp >= start, log.c.timestamp < end)
+                .order_by(log.c.account_id, log.c.timestamp, log.c.id)
+                .limit(chunk_size)
+            )
+            if last is not None:
+                query = query.where(key > tuple_(*last))
+            with engine.connect() as source:
+                rows = source.execute(query).all()
+            if not rows:
+                break
+            with archive_engine.begin() as target:
+                target.execute(insert(archived_logs), [dict(row._mapping) for row in rows])
+            copied += len(rows)
+            last = (rows[-1].account_id, rows[-1].timestamp, rows[-1].id)
+
+        # Kompaktowanie: strony zapisane w kolejności klucza, bez wolnego miejsca
+        with archive_engine.connect() as target:
+            target.exec_driver_sql("VACUUM")
+    finally:
+        archive_engine.dispose()
+    return copied
+
+
+def _delete_month(engine: Engine, start: datetime, end: datetime, chunk_size: int) -> int:
+    log = models.Log.__table__
+    in_month = and_(log.c.account_id.is_not(None), log.c.timestamp >= start, log.c.timestamp < end)
+    deleted = 0
+    while True:
+        with engine.begin() as connection:
+            ids = select(log.c.id).where(in_month).limit(chunk_size).scalar_subquery()
+            count = connection.execute(delete(log).where(log.c.id.in_(ids))).rowcount
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+def archive_logs(engine: Engine = default_engine, partitions: LogPartitions = log_partitions,
+                 retention_months: int = LOG_RETENTION_MONTHS, now: datetime = None,
+                 chunk_size: int = ARCHIVE_CHUNK_SIZE) -> dict:
+    """
+    Przenosi miesiące starsze niż okno retencji z tabeli `logs` do archiwów.
+
+    Archiwum jest budowane w pliku tymczasowym i dopiero gotowe przemianowywane
+    na docelową nazwę, a logi są usuwane z gorącej tabeli po jego utworzeniu.
+    Przerwaną archiwizację można uruchomić ponownie: jeśli archiwum miesiąca
+    już istnieje, z gorącej tabeli usuwane są tylko pozostałe logi.
+    """
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -(max(retention_months, 1) - 1))
+    stats = {"months": [], "archived": 0, "deleted": 0}
+    os.makedirs(partitions.directory, exist_ok=True)
+    with open(os.path.join(partitions.directory, ARCHIVE_LOCK_FILE), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            stats["skipped"] = True  # Archiwizacja trwa w innym procesie
+            return stats
+        _remove_temporary(partitions.directory)
+        _archive_months(engine, partitions, cutoff, chunk_size, stats)
+    return stats
+
+
+def _remove_temporary(directory: str):
+    """
+    Usuwa archiwa w budowie pozostawione przez przerwane przebiegi (wywoływane pod blokadą pliku).
+    """
+    for name in os.listdir(directory):
+        if TEMPORARY_PATTERN.match(name):
+            os.remove(os.path.join(directory, name))
+            logger.info("Removed unfinished log archive %s", name)
+
+
+def _archive_months(engine: Engine, partitions: LogPartitions, cutoff: date, chunk_size: int, stats: dict):
+    with engine.connect() as connection:
+        first = connection.execute(select(func.min(models.Log.timestamp))).scalar()
+    if first is None:
+        return
+
+    month = month_start(first)
+    while month < cutoff:
+        start, end = _as_datetime(month), _as_datetime(add_months(month, 1))
+        path = os.path.join(partitions.directory, LogPartitions.file_name(month))
+        if not os.path.exists(path):
+            temporary = f"{path}.{os.getpid()}.tmp"
+            copied = _copy_month(engine, temporary, start, end, chunk_size)
+            if not copied:
+                os.remove(temporary)
+                month = add_months(month, 1)
+                continue
+            os.chmod(temporary, 0o444)
+            os.replace(temporary, path)
+            stats["months"].append(month.isoformat()[:7])
+            stats["archived"] += copied
+        stats["deleted"] += _delete_month(engine, start, end, chunk_size)
+        month = add_months(month, 1)
+
+
+class LogArchiver:
+    """
+    Okresowa archiwizacja logów w tle (praca na bazie w osobnym wątku).
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                stats = await asyncio.to_thread(archive_logs)
+                if stats["months"]:
+                    logger.info("Archived logs: %s", stats)
+            except Exception:
+                background_errors.labels("log_archiver").inc()
+                logger.exception("Log archiving failed")
+            await asyncio.sleep(LOG_ARCHIVE_INTERVAL)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+log_archiver = LogArchiver()
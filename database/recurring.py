@@ -0,0 +1,306 @@
+"""
+Harmonogram przelewów cyklicznych (zleceń stałych).
+
+Terminy zleceń z najbliższego okna czasowego (RECURRING_WINDOW) są trzymane
+w kopcu (min-heap) w pamięci. Pętla harmonogramu śpi do najbliższego terminu,
+a nie odpytuje tabeli co takt. Tabela jest czytana tylko przy wczytywaniu
+kolejnego okna (zakres po indeksie na `next_run_at`) oraz dla zleceń, których
+termin właśnie minął.
+
+Zaległe zlecenia (np. po przestoju serwera) trafiają do kopca przy starcie
+i są wykonywane za każdy pominięty okres, maksymalnie RECURRING_MAX_CATCHUP razy.
+Wykonanie odbywa się partiami przez group committer, posortowane według konta
+źródłowego. Każde zlecenie jest najpierw zajmowane warunkowym UPDATE terminu
+(`WHERE next_run_at = <odczytany termin>`); wykonywane są tylko zlecenia,
+dla których UPDATE zmienił wiersz. Pierwszy UPDATE otwiera transakcję z blokadą
+zapisu SQLite, więc salda są czytane już pod tą blokadą, a zlecenie nie zostanie
+wykonane dwa razy, nawet jeśli harmonogram działa w kilku workerach. Konta
+zleceń z partii są blokowane (account_locks) do zatwierdzenia transakcji.
+Zlecenia z partii, której nie udało się zatwierdzić (np. "database is locked"),
+wracają do kopca i są ponawiane.
+
+Zlecenia miesięczne pamiętają dzień miesiąca (`anchor_day`): termin przycięty
+do końca krótszego miesiąca wraca na właściwy dzień w kolejnym miesiącu.
+
+Harmonogram jest domyślnie wyłączony; RECURRING_SCHEDULER=True należy ustawić
+w dokładnie jednym procesie (pozostałe workery tylko obsługują żądania).
+"""
+import asyncio
+import calendar
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decouple import config
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
+from database import crud, models
+from database.database import AsyncSessionLocal
+from database.locks import account_locks
+from database.unit_of_work import group_committer
+from utils.event_bus import event_bus
+from utils.metrics import background_errors
+
+logger = logging.getLogger(__name__)
+
+RECURRING_SCHEDULER = config("RECURRING_SCHEDULER", default=False, cast=bool)  # Czy ten proces wykonuje zlecenia (tylko jeden proces)
+RECURRING_WINDOW = config("RECURRING_WINDOW", default=3600, cast=int)  # Horyzont wczytywania terminów (s)
+RECURRING_BATCH_SIZE = config("RECURRING_BATCH_SIZE", default=500, cast=int)  # Maks. liczba zleceń w jednej transakcji
+RECURRING_MAX_CATCHUP = config("RECURRING_MAX_CATCHUP", default=31, cast=int)  # Maks. liczba zaległych wykonań zlecenia
+RECURRING_FREQUENCIES = ("daily", "weekly", "monthly")
+
+
+def advance(moment: datetime, frequency: str, anchor_day: Optional[int] = None) -> datetime:
+    """
+    Zwraca termin kolejnego wykonania zlecenia o danej częstotliwości.
+    Dla zleceń miesięcznych `anchor_day` to docelowy dzień miesiąca
+    (domyślnie dzień z `moment`, dla zleceń sprzed wprowadzenia kolumny).
+    """
+    if frequency == "daily":
+        return moment + timedelta(days=1)
+    if frequency == "weekly":
+        return moment + timedelta(weeks=1)
+    # Miesięcznie: dzień zakotwiczenia lub ostatni dzień krótszego miesiąca
+    year, month = (moment.year, moment.month + 1) if moment.month < 12 else (moment.year + 1, 1)
+    day = min(anchor_day or moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+def as_utc(moment: datetime) -> datetime:
+    # SQLite zwraca daty bez strefy czasowej; wszystkie terminy są zapisywane w UTC
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class RecurringScheduler:
+    """
+    Wykonuje przelewy cykliczne w ich terminach.
+    """
+
+    def __init__(self, window: int = RECURRING_WINDOW, batch_size: int = RECURRING_BATCH_SIZE):
+        self.window = window
+        self.batch_size = batch_size
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}  # Aktualny termin zlecenia; starsze wpisy w kopcu są pomijane
+        self._loaded_until: Optional[float] = None  # Koniec wczytanego okna
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Statystyki
+        self.executed = 0
+        self.failed = 0
+        self.batches = 0
+        self.windows_loaded = 0
+
+    # ---------------------------
+    # Kopiec terminów
+    # ---------------------------
+    def _push(self, recurring_id: int, due: float):
+        if self._scheduled.get(recurring_id) == due:
+            return
+        self._scheduled[recurring_id] = due
+        heapq.heappush(self._heap, (due, recurring_id))
+
+    def _peek(self) -> Optional[float]:
+        # Usunięcie nieaktualnych wpisów (zlecenie przełożone lub zakończone)
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: float) -> List[int]:
+        due = []
+        while len(due) < self.batch_size:
+            head = self._peek()
+            if head is None or head > now:
+                break
+            _, recurring_id = heapq.heappop(self._heap)
+            del self._scheduled[recurring_id]
+            due.append(recurring_id)
+        return due
+
+    def add(self, recurring_id: int, next_run_at: datetime):
+        """
+        Dodaje nowe lub przełożone zlecenie. Zlecenia spoza wczytanego okna
+        zostaną wczytane razem z kolejnym oknem.
+        """
+        due = as_utc(next_run_at).timestamp()
+        if self._loaded_until is None or due >= self._loaded_until:
+            return
+        head = self._peek()
+        self._push(recurring_id, due)
+        if self._wakeup is not None and (head is None or due < head):
+            self._wakeup.set()
+
+    async def _load_window(self):
+        """
+        Wczytuje terminy z kolejnego okna; przy pierwszym wczytaniu także wszystkie zaległe.
+        """
+        start = self._loaded_until
+        end = max(time.time(), start or 0) + self.window
+        query = select(models.RecurringTransfer.id, models.RecurringTransfer.next_run_at).where(
+            models.RecurringTransfer.active.is_(True),
+            models.RecurringTransfer.next_run_at < datetime.fromtimestamp(end, timezone.utc)
+        )
+        if start is not None:
+            query = query.where(models.RecurringTransfer.next_run_at >= datetime.fromtimestamp(start, timezone.utc))
+        async with AsyncSessionLocal() as db:
+            for recurring_id, next_run_at in (await db.execute(query)):
+                self._push(recurring_id, as_utc(next_run_at).timestamp())
+        self._loaded_until = end
+        self.windows_loaded += 1
+
+    # ---------------------------
+    # Wykonywanie zleceń
+    # ---------------------------
+    async def _execute(self, recurring_ids: List[int]):
+        now = datetime.now(timezone.utc)
+        recurring = models.RecurringTransfer.__table__
+
+        # Zlecenia wraz z kontami (niezmiennymi), które trzeba zablokować przed transakcją
+        candidates = []
+        async with AsyncSessionLocal() as db:
+            for start in range(0, len(recurring_ids), crud.IN_CLAUSE_CHUNK):
+                candidates.extend(await db.execute(
+                    select(recurring).where(recurring.c.id.in_(recurring_ids[start:start + crud.IN_CLAUSE_CHUNK]))
+                ))
+        locked_accounts = {c.from_account_id for c in candidates} | {c.to_account_id for c in candidates}
+
+        async def work(db: AsyncSession):
+            # Zajęcie zleceń: termin jest przesuwany tylko, jeśli nie zmienił go inny worker
+            transfers, rescheduled = [], []
+            for transfer in candidates:
+                if not transfer.active:
+                    continue
+                runs, next_run_at = 0, as_utc(transfer.next_run_at)
+                while next_run_at <= now:
+                    runs += 1
+                    next_run_at = advance(next_run_at, transfer.frequency, transfer.anchor_day)
+                if not runs:
+                    rescheduled.append((transfer.id, next_run_at))  # Jeszcze nie minął
+                    continue
+                claimed = await db.execute(
+                    update(recurring)
+                    .where(recurring.c.id == transfer.id, recurring.c.next_run_at == transfer.next_run_at)
+                    .values(next_run_at=next_run_at)
+                )
+                if claimed.rowcount == 1:
+                    transfers.append((transfer, min(runs, RECURRING_MAX_CATCHUP)))
+                    rescheduled.append((transfer.id, next_run_at))
+
+            # Salda czytane po zajęciu zleceń, pod blokadą zapisu tej transakcji
+            account_ids = {t.from_account_id for t, _ in transfers} | {t.to_account_id for t, _ in transfers}
+            accounts = await crud.get_accounts_async(db, account_ids, for_update=True)
+
+            by_source = defaultdict(list)
+            for transfer, runs in transfers:
+                by_source[transfer.from_account_id].append((transfer, runs))
+
+            entries, executed, failed, changed = [], 0, 0, set()
+            for from_account_id in sorted(by_source):
+                source = accounts.get(from_account_id)
+                for transfer, runs in sorted(by_source[from_account_id], key=lambda item: (item[0].next_run_at, item[0].id)):
+                    target = accounts.get(transfer.to_account_id)
+                    for _ in range(runs):
+                        if source is None or target is None or source.available < transfer.amount:
+                            failed += 1
+                            entries.append(crud.ledger_entry(
+                                from_account_id, "recurring_transfer_failed",
+                                f"Recurring transfer {transfer.id} of {transfer.amount} to account {transfer.to_account_id} failed",
+                                transfer.amount, transfer.to_account_id
+                            ))
+                        else:
+                            source.balance -= transfer.amount
+                            target.balance += transfer.amount
+                            changed.update((source.id, target.id))
+                            executed += 1
+                            entries.append(crud.ledger_entry(
+                                from_account_id, "transfer",
+                                f"Transferred {transfer.amount} to account {transfer.to_account_id} (recurring {transfer.id})",
+                                transfer.amount, transfer.to_account_id, "out"
+                            ))
+                            entries.append(crud.ledger_entry(
+                                transfer.to_account_id, "transfer",
+                                f"Received {transfer.amount} from account {from_account_id} (recurring {transfer.id})",
+                                transfer.amount, from_account_id, "in"
+                            ))
+
+            await crud.log_operations_async(db, entries)
+            return executed, failed, sorted(changed), rescheduled
+
+        async with account_locks.hold(locked_accounts):
+            executed, failed, changed, rescheduled = await group_committer.run(work)
+        self.batches += 1
+        self.executed += executed
+        self.failed += failed
+        for recurring_id, next_run_at in rescheduled:
+            self.add(recurring_id, next_run_at)
+        if changed:
+            event_bus.publish("notifications", {
+                "message": f"Executed {executed} recurring transfers",
+                "account_ids": changed
+            })
+
+    async def _run(self):
+        while True:
+            try:
+                if self._loaded_until is None or time.time() >= self._loaded_until:
+                    await self._load_window()
+
+                now = time.time()
+                due = self._pop_due(now)
+                if due:
+                    try:
+                        await self._execute(due)
+                    except Exception:
+                        # Nic nie zostało zatwierdzone: zlecenia wracają do kopca i są ponawiane po przerwie
+                        for recurring_id in due:
+                            self._push(recurring_id, now)
+                        raise
+                    continue
+
+                head = self._peek()
+                timeout = min(head if head is not None else self._loaded_until, self._loaded_until) - now
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                background_errors.labels("recurring_scheduler").inc()
+                logger.exception("Recurring transfer scheduler error")
+                await asyncio.sleep(1)
+
+    def start(self):
+        """
+        Uruchamia harmonogram (wymaga działającej pętli zdarzeń).
+        """
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        head = self._peek()
+        return {
+            "scheduled": len(self._scheduled),
+            "next_due_in_seconds": round(head - time.time(), 3) if head is not None else None,
+            "executed": self.executed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "windows_loaded": self.windows_loaded,
+        }
+
+
+recurring_scheduler = RecurringScheduler()
+
+
+# Nowe zlecenia z dowolnego workera trafiają do harmonogramu każdego workera
+event_bus.subscribe("recurring", lambda data: recurring_scheduler.add(
+    data["id"], datetime.fromisoformat(data["next_run_at"])
+))
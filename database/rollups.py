@@ -0,0 +1,124 @@
+"""
+Dzienne zestawienia operacji kont (tabela account_daily_totals).
+
+Każdy zapis logu zwiększa w tej samej transakcji wiersz (konto, dzień,
+operacja): wpływy, wypływy i liczbę operacji. Logi dodawane przez ORM
+(`log_operation`) są zliczane przy flushu sesji, a logi wstawiane
+zbiorczo (`log_operations_async`) przez `rollup_statement`. Zestawienie
+konta za dowolny okres jest więc odczytem zakresu klucza głównego,
+niezależnym od długości historii.
+
+`rebuild_rollups` przelicza zestawienia z tabeli logów (np. po migracji
+backfill-ledger albo dla baz sprzed wprowadzenia zestawień):
+    python -m database.migrations rebuild-rollups [--since 2025-01-01]
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import case, delete, event, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from database import models
+from database.partitions import log_partitions
+
+REBUILD_DAYS_PER_TRANSACTION = 31  # Krótsze transakcje przy przeliczaniu długiej historii
+
+Totals = Dict[Tuple[int, date, str], list]  # (konto, dzień, operacja) -> [wpływy, wypływy, liczba]
+
+
+def accumulate(totals: Totals, account_id: int, timestamp: datetime, operation: str,
+               amount: Optional[int], direction: Optional[str]):
+    """
+    Dodaje jeden log do zestawień zbieranych w pamięci.
+    """
+    row = totals[(account_id, timestamp.date(), operation)]
+    if direction == "in":
+        row[0] += amount or 0
+    elif direction == "out":
+        row[1] += amount or 0
+    row[2] += 1
+
+
+def new_totals() -> Totals:
+    return defaultdict(lambda: [0, 0, 0])
+
+
+def rollup_statement(totals: Totals):
+    """
+    Zwraca wielowierszowy UPSERT dodający zebrane sumy do zestawień.
+    """
+    table = models.AccountDailyTotal.__table__
+    statement = sqlite_insert(table).values([
+        {"account_id": account_id, "day": day, "operation": operation,
+         "inflow": inflow, "outflow": outflow, "operation_count": count}
+        for (account_id, day, operation), (inflow, outflow, count) in totals.items()
+    ])
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.account_id, table.c.day, table.c.operation],
+        set_={
+            "inflow": table.c.inflow + statement.excluded.inflow,
+            "outflow": table.c.outflow + statement.excluded.outflow,
+            "operation_count": table.c.operation_count + statement.excluded.operation_count,
+        },
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _rollup_new_logs(db, flush_context):
+    totals = new_totals()
+    for obj in db.new:
+        if isinstance(obj, models.Log):
+            accumulate(totals, obj.account_id, obj.timestamp, obj.operation, obj.amount, obj.direction)
+    if totals:
+        db.connection().execute(rollup_statement(totals))
+
+
+# ---------------------------
+# Przeliczenie z tabeli logów
+# ---------------------------
+def rebuild_rollups(engine: Engine, since: Optional[date] = None,
+                    days_per_transaction: int = REBUILD_DAYS_PER_TRANSACTION) -> dict:
+    """
+    Przelicza zestawienia od dnia `since` (domyślnie od pierwszego logu)
+    porcjami dni; każda porcja jest usuwana i wyliczana na nowo w jednej
+    transakcji, więc logi zapisywane w trakcie nie są liczone podwójnie.
+    Zestawienia zarchiwizowanych miesięcy nie są przeliczane (archiwa się nie zmieniają).
+    """
+    log = models.Log
+    table = models.AccountDailyTotal.__table__
+    with engine.connect() as connection:
+        first, last = connection.execute(select(func.min(log.timestamp), func.max(log.timestamp))).one()
+    if first is None:
+        return {"days": 0, "rows": 0}
+
+    day = max(since, first.date()) if since else first.date()
+    archived_until = log_partitions.archived_until()
+    if archived_until:
+        day = max(day, archived_until.date())
+    stats = {"days": 0, "rows": 0}
+    while day <= last.date():
+        end = day + timedelta(days=days_per_transaction)
+        start_at, end_at = datetime.combine(day, datetime.min.time()), datetime.combine(end, datetime.min.time())
+        day_column = func.date(log.timestamp)
+        aggregated = (
+            select(
+                log.account_id,
+                day_column,
+                log.operation,
+                func.coalesce(func.sum(case((log.direction == "in", log.amount), else_=0)), 0),
+                func.coalesce(func.sum(case((log.direction == "out", log.amount), else_=0)), 0),
+                func.count(),
+            )
+            .where(log.timestamp >= start_at, log.timestamp < end_at, log.account_id.is_not(None))
+            .group_by(log.account_id, day_column, log.operation)
+        )
+        with engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.day >= day, table.c.day < end))
+            result = connection.execute(insert(table).from_select(
+                ["account_id", "day", "operation", "inflow", "outflow", "operation_count"], aggregated
+            ))
+        stats["days"] += (min(end, last.date() + timedelta(days=1)) - day).days
+        stats["rows"] += result.rowcount
+        day = end
+    return stats
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from decouple import config
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from database import crud, models
+from database.database import AsyncSessionLocal
+from database.locks import account_locks
+from database.unit_of_work import group_committer
+from utils.event_bus import event_bus
+from utils.metrics import background_errors
+
+logger = logging.getLogger(__name__)
+
+PENDING_SETTLER = config("PENDING_SETTLER", default=False, cast=bool)  # Czy ten proces rozlicza przelewy (tylko jeden proces)
+SETTLE_INTERVAL = config("SETTLE_INTERVAL", default=1.0, cast=float)  # Maks. odstęp między przebiegami (s)
+SETTLE_BATCH_SIZE = config("SETTLE_BATCH_SIZE", default=1000, cast=int)  # Maks. liczba przelewów w jednej transakcji
+
+
+# ---------------------------
+# Rozliczanie zatwierdzonych przelewów oczekujących
+# ---------------------------
+class PendingSettler:
+    """
+    Rozlicza zatwierdzone przelewy oczekujące partiami.
+
+    Każdy przebieg pobiera do `batch_size` zatwierdzonych przelewów (indeks
+    na (status, id)) i w jednej transakcji przenosi środki: obciąża saldo
+    księgowe źródła, zwalnia blokadę i uznaje konto docelowe. Przebieg jest
+    uruchamiany po zatwierdzeniu przelewów (`wake`) lub co SETTLE_INTERVAL.
+
+    Przelewy są zajmowane warunkowym UPDATE (`WHERE status = 'approved'`),
+    a rozliczane są tylko wiersze zwrócone przez ten UPDATE, więc przy kilku
+    workerach przelew nie zostanie rozliczony dwa razy. Konta kandydatów są
+    blokowane (account_locks) do zatwierdzenia transakcji, tak jak przy
+    wpłatach i przelewach.
+
+    Rozliczanie jest domyślnie wyłączone; PENDING_SETTLER=True należy ustawić
+    w dokładnie jednym procesie. Przelewy zatwierdzone w innych workerach są
+    rozliczane w ciągu SETTLE_INTERVAL.
+    """
+
+    def __init__(self, batch_size: int = SETTLE_BATCH_SIZE, interval: float = SETTLE_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Statystyki
+        self.settled = 0
+        self.batches = 0
+
+    async def settle_batch(self) -> int:
+        """
+        Rozlicza jedną partię zatwierdzonych przelewów. Zwraca liczbę rozliczonych.
+        """
+        now = datetime.now(timezone.utc)
+        pending = models.PendingTransfer.__table__
+
+        # Kandydaci wraz z kontami (niezmiennymi), które trzeba zablokować przed transakcją
+        async with AsyncSessionLocal() as db:
+            candidates = (await db.execute(
+                select(pending.c.id, pending.c.from_account_id, pending.c.to_account_id)
+                .where(pending.c.status == "approved")
+                .order_by(pending.c.id)
+                .limit(self.batch_size)
+            )).all()
+        if not candidates:
+            return 0
+        candidate_ids = [candidate.id for candidate in candidates]
+        locked_accounts = {c.from_account_id for c in candidates} | {c.to_account_id for c in candidates}
+
+        async def work(db: AsyncSession):
+            # Zajęcie przelewów: UPDATE otwiera transakcję zapisu; przelewy rozliczone
+            # w międzyczasie przez inny worker nie spełniają już warunku statusu
+            transfers = (await db.execute(
+                update(pending)
+                .where(pending.c.id.in_(candidate_ids), pending.c.status == "approved")
+                .values(status="settled", settled_at=now)
+                .returning(pending.c.id, pending.c.from_account_id, pending.c.to_account_id, pending.c.amount)
+            )).all()
+            if not transfers:
+                return 0, []
+            transfers.sort(key=lambda transfer: transfer.id)
+
+            account_ids = {t.from_account_id for t in transfers} | {t.to_account_id for t in transfers}
+            accounts = await crud.get_accounts_async(db, account_ids, for_update=True)
+
+            entries = []
+            for transfer in transfers:
+                source = accounts[transfer.from_account_id]
+                target = accounts[transfer.to_account_id]
+                source.held -= transfer.amount
+                source.balance -= transfer.amount
+                target.balance += transfer.amount
+                entries.append(crud.ledger_entry(
+                    source.id, "transfer", f"Transferred {transfer.amount} to account {target.id} (pending {transfer.id})",
+                    transfer.amount, target.id, "out"
+                ))
+                entries.append(crud.ledger_entry(
+                    target.id, "transfer", f"Received {transfer.amount} from account {source.id} (pending {transfer.id})",
+                    transfer.amount, source.id, "in"
+                ))
+
+            await crud.log_operations_async(db, entries)
+            return len(transfers), sorted(account_ids)
+
+        async with account_locks.hold(locked_accounts):
+            settled, changed = await group_committer.run(work)
+        if settled:
+            self.settled += settled
+            self.batches += 1
+            event_bus.publish("notifications", {
+                "message": f"Settled {settled} pending transfers",
+                "account_ids": changed
+            })
+        return settled
+
+    async def _run(self):
+        while True:
+            try:
+                # Kolejne partie od razu, dopóki są zaległe przelewy
+                while await self.settle_batch() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                background_errors.labels("pending_settler").inc()
+                logger.exception("Pending transfer settlement failed")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def wake(self):
+        """
+        Uruchamia przebieg rozliczenia bez czekania na SETTLE_INTERVAL.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """
+        Uruchamia rozliczanie w tle (wymaga działającej pętli zdarzeń).
+        """
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "settled": self.settled,
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+        }
+
+
+settler = PendingSettler()
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import deque
+from decouple import config
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from database.database import AsyncSessionLocal
+from utils.metrics import registry
+
+# ---------------------------
+# Konfiguracja grupowego zatwierdzania
+# ---------------------------
+GROUP_COMMIT_WINDOW = config("GROUP_COMMIT_WINDOW", default=0.002, cast=float)  # Okno zbierania operacji (s)
+GROUP_COMMIT_MAX_BATCH = config("GROUP_COMMIT_MAX_BATCH", default=128, cast=int)  # Maks. liczba operacji w jednej transakcji
+
+
+# ---------------------------
+# Grupowe zatwierdzanie operacji
+# ---------------------------
+class GroupCommitter:
+    """
+    Jednostka pracy z grupowym zatwierdzaniem (group commit).
+
+    Każda operacja to korutyna `work(db)`, która wykonuje zmiany w sesji
+    asynchronicznej bez wywoływania `commit()`. Operacje nadchodzące w oknie
+    `window` są wykonywane przez jedno zadanie zapisujące w jednej sesji
+    i zatwierdzane jednym commitem (jednym fsync). Jeśli któraś operacja zgłosi
+    wyjątek, transakcja jest wycofywana, a operacje z partii są powtarzane
+    pojedynczo, aby błąd jednej nie wpływał na pozostałe.
+
+    Funkcje `work` powinny najpierw walidować dane, a dopiero potem modyfikować
+    obiekty, oraz zwracać zwykłe wartości (nie obiekty ORM).
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+                 window: float = GROUP_COMMIT_WINDOW, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Statystyki
+        self.operations = 0
+        self.commits = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=10000)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def run(self, work: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        """
+        Kolejkuje operację i zwraca jej wynik po zatwierdzeniu transakcji.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((work, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _commit_batch(self, batch: List[Tuple[Callable, asyncio.Future, float]]):
+        async with self.session_factory() as db:
+            try:
+                results = [await work(db) for work, _, _ in batch]
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    return
+                # Izolacja błędu: każda operacja w osobnej transakcji
+                self.retries += 1
+                for item in batch:
+                    await self._commit_batch([item])
+                return
+
+        self.commits += 1
+        self.operations += len(batch)
+        now = time.perf_counter()
+        for (_, future, submitted), result in zip(batch, results):
+            self.latencies.append(now - submitted)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """
+        Zwraca liczbę commitów (fsync) na operację oraz opóźnienia p50/p99.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "operations": self.operations,
+            "commits": self.commits,
+            "retries": self.retries,
+            "fsyncs_per_operation": round(self.commits / self.operations, 4) if self.operations else 0.0,
+            "latency_p50_ms": round(percentile(0.50) * 1000, 3),
+            "latency_p99_ms": round(percentile(0.99) * 1000, 3),
+        }
+
+
+group_committer = GroupCommitter()
+
+registry.counter("group_commit_operations_total", "Operations committed by the group committer",
+                 function=lambda: group_committer.operations)
+registry.counter("group_commit_commits_total", "Transactions committed by the group committer",
+                 function=lambda: group_committer.commits)
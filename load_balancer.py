@@ -1,52 +1,184 @@
 from fastapi import FastAPI, Request, HTTPException
-import requests
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from decouple import config
+import httpx
+from utils import assignment
 from utils.assignment import assign_server  # Import funkcji assign_server
-from typing import List
-import threading
+from utils.health import FAILURE_STATUS_CODES, BackendBusy, HealthMonitor
+from utils.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from typing import Dict, List, Optional
 import time
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 
-# Lista serwerów rozproszonych
-servers = [
-    {"url": "https://localhost:8001", "status": "healthy"},
-    {"url": "https://localhost:8002", "status": "healthy"},
-    {"url": "https://localhost:8003", "status": "healthy"}
-]
+# Stan serwerów rozproszonych (członkostwo wspólne z utils.assignment)
+health_monitor = HealthMonitor(assignment.servers)
+
+# ---------------------------
+# Metryki serwerów
+# ---------------------------
+upstream_seconds = registry.histogram(
+    "lb_upstream_response_seconds", "Time to upstream response headers", ("backend",)
+)
+registry.gauge("lb_backend_in_flight", "Requests in flight per backend", ("backend",),
+               function=lambda: {(url,): b.in_flight for url, b in health_monitor.backends.items()})
+registry.gauge("lb_backend_queued", "Requests waiting for a backend slot", ("backend",),
+               function=lambda: {(url,): b.queued for url, b in health_monitor.backends.items()})
+registry.gauge("lb_backend_available", "Whether the backend is healthy and its breaker admits traffic", ("backend",),
+               function=lambda: {(url,): int(b.available()) for url, b in health_monitor.backends.items()})
+registry.counter("lb_backend_rejected_total", "Requests rejected because the backend was busy", ("backend",),
+                 function=lambda: {(url,): b.rejected for url, b in health_monitor.backends.items()})
+
+# ---------------------------
+# Konfiguracja wyboru serwera
+# ---------------------------
+# hash    - zawsze serwer użytkownika z pierścienia (failover do następnika)
+# bounded - spójne haszowanie z ograniczonym obciążeniem: przy przeciążeniu serwera
+#           użytkownik trafia do kolejnego na pierścieniu
+# least   - serwer z najmniejszą liczbą żądań w toku (bez powinowactwa)
+LB_ROUTING = config("LB_ROUTING", default="hash")
+LB_LOAD_FACTOR = config("LB_LOAD_FACTOR", default=1.25, cast=float)  # Dopuszczalne obciążenie względem średniej (bounded)
+LB_RETRY_AFTER = 1  # Sekundy (nagłówek Retry-After przy przeciążeniu)
+
+# ---------------------------
+# Konfiguracja puli połączeń do serwerów
+# ---------------------------
+UPSTREAM_VERIFY_SSL = config("UPSTREAM_VERIFY_SSL", default=True, cast=bool)
+UPSTREAM_MAX_CONNECTIONS = config("UPSTREAM_MAX_CONNECTIONS", default=100, cast=int)
+UPSTREAM_MAX_KEEPALIVE = config("UPSTREAM_MAX_KEEPALIVE", default=20, cast=int)
+UPSTREAM_CONNECT_TIMEOUT = config("UPSTREAM_CONNECT_TIMEOUT", default=5.0, cast=float)
+UPSTREAM_READ_TIMEOUT = config("UPSTREAM_READ_TIMEOUT", default=30.0, cast=float)
+
+# Nagłówki hop-by-hop, których proxy nie może przekazywać dalej (RFC 7230, sekcja 6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Jedna pula połączeń keep-alive (HTTP/1.1 + TLS) na każdy serwer
+clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_client(server_url: str) -> httpx.AsyncClient:
+    """
+    Zwraca klienta HTTP z pulą połączeń dla danego serwera, tworząc go przy pierwszym użyciu.
+    """
+    client = clients.get(server_url)
+    if client is None:
+        client = httpx.AsyncClient(
+            base_url=server_url,
+            verify=UPSTREAM_VERIFY_SSL,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        )
+        clients[server_url] = client
+    return client
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    """
+    Zamyka pule połączeń do serwerów przy wyłączaniu load-balancera.
+    """
+    for client in clients.values():
+        await client.aclose()
+    clients.clear()
+
+
+def filter_headers(raw_headers) -> List[tuple]:
+    """
+    Usuwa nagłówki hop-by-hop oraz nagłówki wymienione w `Connection`.
+    """
+    connection_tokens = set()
+    for name, value in raw_headers:
+        if name.lower() == b"connection":
+            connection_tokens.update(token.strip().lower() for token in value.split(b","))
+    return [
+        (name, value)
+        for name, value in raw_headers
+        if name.lower().decode("latin-1") not in HOP_BY_HOP_HEADERS
+        and name.lower() not in connection_tokens
+    ]
 
 
 def get_healthy_servers() -> List[str]:
     """
-    Zwraca listę zdrowych serwerów.
+    Zwraca listę zdrowych serwerów, których wyłącznik przepuszcza ruch.
+    """
+    return health_monitor.available_servers()
+
+
+def choose_server(username: str, healthy_servers: List[str]) -> Optional[str]:
+    """
+    Wybiera serwer dla użytkownika zgodnie z trybem LB_ROUTING.
+    """
+    backends = health_monitor.backends
+    if LB_ROUTING == "least":
+        # Przy remisie kolejność z pierścienia użytkownika (zachowuje powinowactwo przy małym ruchu)
+        order = {url: i for i, url in enumerate(assignment.ring.iter_nodes(username))}
+        return min(healthy_servers, key=lambda url: (backends[url].load / backends[url].weight, order.get(url, 0)))
+    if LB_ROUTING == "bounded":
+        loads = {url: backends[url].load for url in healthy_servers}
+        return assignment.ring.get_bounded_node(username, loads, LB_LOAD_FACTOR)
+    return assign_server(username, healthy_servers)
+
+
+@app.on_event("startup")
+async def start_health_checks():
+    """
+    Uruchamia równoległe sprawdzanie stanu serwerów.
+    """
+    health_monitor.start(get_client)
+
+
+@app.on_event("shutdown")
+async def stop_health_checks():
+    await health_monitor.stop()
+
+
+@app.get("/health")
+def health_check():
+    """
+    Endpoint do sprawdzania statusu load-balancera.
     """
-    return [server["url"] for server in servers if server["status"] == "healthy"]
+    return {"status": "ok", "message": "Load balancer is running"}
 
 
-def monitor_servers():
+@app.get("/servers")
+def get_servers_status():
     """
-    Monitoruje stan serwerów, wykonując zapytania health check co 10 sekund.
+    Endpoint do uzyskania statusu wszystkich serwerów rozproszonych
+    (wynik sprawdzeń, stan wyłącznika, średnie opóźnienie i ostatni błąd).
     """
-    while True:
-        for server in servers:
-            try:
-                response = requests.get(f"{server['url']}/health", timeout=5)
-                if response.status_code == 200:
-                    server["status"] = "healthy"
-                else:
-                    server["status"] = "unhealthy"
-            except requests.exceptions.RequestException:
-                server["status"] = "unhealthy"
-        time.sleep(10)
+    return {"servers": health_monitor.states()}
 
 
-# Uruchomienie monitorowania serwerów w osobnym wątku
-threading.Thread(target=monitor_servers, daemon=True).start()
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Zwraca metryki load-balancera w formacie tekstowym Prometheusa.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
 
-@app.post("/{path:path}")
+# Proxy rejestrowane jako ostatnie, aby nie przesłaniało /health, /servers i /metrics
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
 async def proxy_request(path: str, request: Request):
     """
     Proxy: Rozdziela żądania klientów do zdrowych serwerów rozproszonych na podstawie użytkownika.
+    Treść żądania i odpowiedzi jest strumieniowana bez buforowania i bez ponownego parsowania.
     """
     username = request.headers.get("X-Username")  # Pobranie nazwy użytkownika z nagłówka
     if not username:
@@ -57,31 +189,81 @@ async def proxy_request(path: str, request: Request):
     if not healthy_servers:
         raise HTTPException(status_code=503, detail="No healthy servers available")
 
-    server_url = assign_server(username)  # Przypisanie serwera
-    if server_url not in healthy_servers:
-        raise HTTPException(status_code=503, detail=f"Assigned server {server_url} is not healthy")
+    # Przypisanie serwera; przy awarii właściciela wybierany jest kolejny zdrowy serwer na pierścieniu
+    server_url = choose_server(username, healthy_servers)
+    if not server_url:
+        raise HTTPException(status_code=503, detail="No healthy servers available")
 
+    # Limit żądań w toku: czekanie w kolejce serwera albo 503 (backpressure)
+    backend = health_monitor.backends[server_url]
+    trial = backend.begin()
     try:
-        body = await request.body()
-        headers = dict(request.headers)
-        response = requests.post(f"{server_url}/{path}", data=body, headers=headers)
-        return response.json()
-    except requests.exceptions.RequestException:
-        raise HTTPException(status_code=503, detail="Service unavailable")
+        await backend.acquire()
+    except BaseException as e:
+        backend.abandon(trial)
+        if isinstance(e, BackendBusy):
+            raise HTTPException(status_code=503, detail="Server busy, try again later",
+                                headers={"Retry-After": str(LB_RETRY_AFTER)})
+        raise
 
+    # Treść przekazywana strumieniowo tylko wtedy, gdy klient ją wysłał
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    headers = [
+        (name, value)
+        for name, value in filter_headers(request.headers.raw)
+        if name.lower() != b"host"
+    ]
 
-@app.get("/health")
-def health_check():
-    """
-    Endpoint do sprawdzania statusu load-balancera.
-    """
-    return {"status": "ok", "message": "Load balancer is running"}
+    client = get_client(server_url)
+    upstream_request = client.build_request(
+        request.method,
+        f"/{path}",
+        params=request.query_params.multi_items(),
+        headers=headers,
+        content=request.stream() if has_body else None,
+    )
+    started = time.perf_counter()
+    try:
+        upstream_response = await client.send(upstream_request, stream=True)
+    except httpx.RequestError as e:
+        backend.release()
+        backend.record_request(False, time.perf_counter() - started, trial, f"{type(e).__name__}: {e}")
+        raise HTTPException(status_code=503, detail="Service unavailable")
+    except BaseException:
+        backend.release()
+        backend.abandon(trial)
+        raise
+    latency = time.perf_counter() - started
+    upstream_seconds.labels(server_url).observe(latency)
+    # Błędy i opóźnienie rzeczywistych żądań sterują wyłącznikiem serwera
+    backend.record_request(
+        upstream_response.status_code not in FAILURE_STATUS_CODES,
+        latency,
+        trial,
+        f"upstream returned {upstream_response.status_code}"
+    )
 
+    # Miejsce na serwerze zwalniane po przesłaniu całej odpowiedzi (lub przerwaniu strumienia)
+    released = False
 
-@app.get("/servers")
-def get_servers_status():
-    """
-    Endpoint do uzyskania statusu wszystkich serwerów rozproszonych.
-    """
-    return {"servers": servers}
+    async def finish():
+        nonlocal released
+        if not released:
+            released = True
+            backend.release()
+        await upstream_response.aclose()
+
+    async def body():
+        try:
+            async for chunk in upstream_response.aiter_raw():
+                yield chunk
+        finally:
+            await finish()
 
+    response = StreamingResponse(
+        body(),
+        status_code=upstream_response.status_code,
+        background=BackgroundTask(finish),
+    )
+    response.raw_headers = filter_headers(upstream_response.headers.raw)
+    return response
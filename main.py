@@ -1,16 +1,35 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse
-from database.database import Base, engine
+from fastapi.responses import FileResponse, Response
+from database.cache import account_cache, invalidate_accounts
+from database.database import Base, engine, async_engine, drop_obsolete_indexes, ensure_columns, ensure_indexes
+from database.idempotency import idempotency_store
+from database.locks import account_locks
+from database.partitions import LOG_ARCHIVER, log_archiver
+from database.recurring import RECURRING_SCHEDULER, recurring_scheduler
+from database.settlement import PENDING_SETTLER, settler
 from routes import users, accounts, realtime  # Import routerów
 from decouple import config
+from utils.event_bus import event_bus
+from utils.hashing import hashing_stats, shutdown_hash_pool
+from utils.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from utils.notifications import hub
+from utils.peers import NODE_ID, peer_manager
 import uvicorn
-import asyncio
-import websockets
+import json
+import logging
 from typing import List
 
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # Bez wpisu na każde żądanie do backendów i peerów
+logger = logging.getLogger("main")
+
 # Aktualizacja struktury bazy danych
 Base.metadata.create_all(bind=engine)
-print("Zaktualizowano strukturę bazy danych.")
+ensure_columns()
+ensure_indexes()
+drop_obsolete_indexes()
+logger.info("Zaktualizowano strukturę bazy danych.")
 
 # Inicjalizacja aplikacji
 app = FastAPI(
@@ -18,6 +37,7 @@ app = FastAPI(
     description="API dla serwera bankowego",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
 
 # Rejestracja routerów
 app.include_router(users.router, prefix="/users", tags=["users"])
@@ -28,6 +48,13 @@ app.include_router(realtime.router, prefix="/realtime", tags=["realtime"])
 def root():
     return {"message": "Serwer bankowy działa!"}
 
+@app.get("/health")
+def health_check():
+    """
+    Endpoint sprawdzany przez load-balancer.
+    """
+    return {"status": "ok"}
+
 # Obsługa favicon
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
@@ -38,6 +65,11 @@ async def favicon():
 # ---------------------------
 active_connections: List[WebSocket] = []
 
+registry.gauge(
+    "websocket_connections", "Open WebSocket connections", ("endpoint",),
+    function=lambda: {("/sync",): len(active_connections), ("/realtime/ws",): len(hub.subscribers)}
+)
+
 @app.websocket("/sync")
 async def sync_endpoint(websocket: WebSocket):
     """
@@ -48,49 +80,111 @@ async def sync_endpoint(websocket: WebSocket):
     try:
         while True:
             data = await websocket.receive_text()  # Odbiór danych od jednego z serwerów
-            await broadcast(data)  # Rozesłanie danych do pozostałych serwerów
+            invalidate_accounts(changed_accounts(data))  # Konta zmienione na innym serwerze
     except WebSocketDisconnect:
         active_connections.remove(websocket)
 
-async def broadcast(message: str):
+def changed_accounts(data: str) -> List[int]:
     """
-    Wysyła wiadomość do wszystkich aktywnych połączeń WebSocket.
+    Zwraca ID kont, których dotyczą operacje w paczce replikacyjnej innego serwera.
+    Własne ramki (PEER_SERVERS może zawierać ten serwer) są pomijane, aby nie
+    usuwać z cache wpisów zapisanych właśnie przez ten serwer.
     """
-    for connection in active_connections:
-        try:
-            await connection.send_text(message)
-        except WebSocketDisconnect:
-            active_connections.remove(connection)
-
-# ---------------------------
-# Połączenia WebSocket z innymi serwerami
-# ---------------------------
-peer_servers = [
-    "ws://localhost:8001/sync",
-    "ws://localhost:8002/sync",
-    "ws://localhost:8003/sync"
-]
-
-async def connect_to_peers():
-    """
-    Łączy serwer z pozostałymi serwerami w sieci za pomocą WebSocketów.
-    """
-    for server in peer_servers:
-        try:
-            async with websockets.connect(server) as websocket:
-                print(f"Connected to peer: {server}")
-                while True:
-                    message = await websocket.recv()  # Odbiór danych z innego serwera
-                    print(f"Received message from {server}: {message}")
-        except Exception as e:
-            print(f"Could not connect to {server}: {e}")
+    try:
+        frame = json.loads(data)
+    except ValueError:
+        return []
+    if not isinstance(frame, dict) or frame.get("type") != "batch" or frame.get("origin") == NODE_ID:
+        return []
+    return [
+        message["account_id"] for message in frame.get("messages", [])
+        if isinstance(message, dict) and isinstance(message.get("account_id"), int)
+    ]
 
 @app.on_event("startup")
 async def startup_event():
     """
-    Funkcja uruchamiana przy starcie aplikacji. Rozpoczyna połączenia WebSocket.
+    Funkcja uruchamiana przy starcie aplikacji. Uruchamia szynę zdarzeń i połączenia WebSocket.
+    """
+    await event_bus.start()
+    peer_manager.start()
+    idempotency_store.start()
+    if RECURRING_SCHEDULER:
+        recurring_scheduler.start()
+    if PENDING_SETTLER:
+        settler.start()
+    if LOG_ARCHIVER:
+        log_archiver.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Funkcja uruchamiana przy zamykaniu aplikacji. Zamyka połączenia replikacyjne, szynę zdarzeń, pulę bazy i pulę bcrypt.
+    """
+    await peer_manager.stop()
+    await idempotency_store.stop()
+    await recurring_scheduler.stop()
+    await settler.stop()
+    await log_archiver.stop()
+    await event_bus.stop()
+    await async_engine.dispose()
+    shutdown_hash_pool()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Zwraca metryki w formacie tekstowym Prometheusa.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/hashing/metrics")
+def hash_metrics():
+    """
+    Zwraca obciążenie puli bcrypt i czas oczekiwania operacji w kolejce.
+    """
+    return hashing_stats()
+
+@app.get("/sync/metrics")
+def sync_metrics():
+    """
+    Zwraca głębokość kolejek i opóźnienie replikacji do pozostałych serwerów.
+    """
+    return peer_manager.metrics()
+
+@app.get("/cache/metrics")
+def cache_metrics():
+    """
+    Zwraca rozmiar i skuteczność cache kont.
+    """
+    return account_cache.stats()
+
+@app.get("/idempotency/metrics")
+def idempotency_metrics():
+    """
+    Zwraca liczbę powtórzonych żądań obsłużonych z magazynu kluczy idempotencji.
+    """
+    return idempotency_store.stats()
+
+@app.get("/locks/metrics")
+def lock_metrics():
+    """
+    Zwraca liczbę blokad kont, udział oczekiwań (rywalizacja) i przekroczenia czasu.
+    """
+    return account_locks.stats()
+
+@app.get("/recurring/metrics")
+def recurring_metrics():
+    """
+    Zwraca liczbę zaplanowanych i wykonanych przelewów cyklicznych.
+    """
+    return recurring_scheduler.stats()
+
+@app.get("/settlement/metrics")
+def settlement_metrics():
+    """
+    Zwraca liczbę rozliczonych przelewów oczekujących i partii rozliczeń.
     """
-    asyncio.create_task(connect_to_peers())
+    return settler.stats()
 
 if __name__ == "__main__":
     # Wczytaj ścieżki do certyfikatów z pliku .env
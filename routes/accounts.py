@@ -1,17 +1,30 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, Header, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from database import crud, database, models
-from utils.security import get_current_user
+from database.idempotency import idempotency_store, request_hash
+from database.locks import LockTimeout, account_locks
+from database.recurring import RECURRING_FREQUENCIES
+from database.settlement import settler
+from database.unit_of_work import group_committer
+from utils.event_bus import event_bus
+from routes.realtime import serve_notifications
+from utils.security import Principal, get_current_user
 from utils.responses import success_response, error_response
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from decouple import config
+from typing import List, Literal, Optional
+import base64
+import binascii
+import csv
+import io
+import json
+import zlib
 
 router = APIRouter()
 
-# ---------------------------
-# Lista aktywnych połączeń WebSocket
-# ---------------------------
-active_connections = []
-
 # ---------------------------
 # Endpoint WebSocket dla powiadomień w czasie rzeczywistym
 # ---------------------------
@@ -19,43 +32,40 @@ active_connections = []
 async def websocket_endpoint(websocket: WebSocket):
     """
     Utrzymuje połączenie WebSocket z klientami do powiadomień w czasie rzeczywistym.
+    Wymaga tokenu (nagłówek Authorization lub parametr `token`); powiadomienia
+    przychodzą po wiadomości {"subscribe": [account_id, ...]} dla własnych kont.
     """
-    await websocket.accept()
-    active_connections.append(websocket)
-    try:
-        while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
+    await serve_notifications(websocket)
 
 # ---------------------------
-# Powiadamianie wszystkich klientów WebSocket
+# Powiadamianie klientów WebSocket
 # ---------------------------
-async def notify_all(message: str):
+def notify_all(message: str, account_ids=None):
     """
-    Wysyła wiadomość do wszystkich aktywnych klientów WebSocket.
+    Kolejkuje wiadomość dla klientów WebSocket subskrybujących podane konta
+    (lub wszystkich klientów) we wszystkich workerach. Nie czeka na wysłanie.
     """
-    for connection in active_connections:
-        try:
-            await connection.send_text(message)
-        except WebSocketDisconnect:
-            active_connections.remove(connection)
+    event_bus.publish("notifications", {
+        "message": message,
+        "account_ids": list(account_ids) if account_ids is not None else None
+    })
 
 # ---------------------------
 # Pobieranie informacji o koncie
 # ---------------------------
 @router.get("/{account_id}")
-def get_account(account_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+def get_account(account_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(database.get_db)):
     """
     Pobiera informacje o koncie na podstawie jego ID, jeśli użytkownik ma do niego dostęp.
     """
-    account = crud.get_account(db, account_id)
+    account = crud.get_account_cached(db, account_id)
     if not account or account.owner_id != current_user.id:
         return error_response("Account not found or access denied", 403)
 
     return success_response({
         "id": account.id,
         "balance": account.balance,
+        "available": account.available,
         "owner_id": account.owner_id
     })
 
@@ -63,12 +73,12 @@ def get_account(account_id: int, current_user: models.User = Depends(get_current
 # Tworzenie nowego konta
 # ---------------------------
 @router.post("/")
-async def create_account(balance: int = 0, current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+async def create_account(balance: int = 0, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(database.get_async_db)):
     """
     Tworzy nowe konto dla zalogowanego użytkownika.
     """
-    account = crud.create_account(db, owner_id=current_user.id, balance=balance)
-    await notify_all(f"New account created for user {current_user.username}, account ID: {account.id}")
+    account = await crud.create_account_async(db, owner_id=current_user.id, balance=balance)
+    notify_all(f"New account created for user {current_user.username}, account ID: {account.id}", [account.id])
     return success_response({
         "account_id": account.id,
         "balance": account.balance
@@ -78,176 +88,709 @@ async def create_account(balance: int = 0, current_user: models.User = Depends(g
 # Pobieranie salda konta
 # ---------------------------
 @router.get("/{account_id}/balance")
-def get_balance(account_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+def get_balance(account_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(database.get_db)):
     """
     Pobiera saldo konta, jeśli użytkownik ma do niego dostęp.
     """
-    account = crud.get_account(db, account_id)
+    account = crud.get_account_cached(db, account_id)
     if not account or account.owner_id != current_user.id:
         return error_response("Account not found or access denied", 403)
 
-    return success_response({"balance": account.balance})
+    return success_response({"balance": account.balance, "available": account.available})
+
+# ---------------------------
+# Blokady kont dla zmian salda
+# ---------------------------
+async def run_locked(account_ids, owner_id: int, idempotency_key: Optional[str], fingerprint: str, apply):
+    """
+    Wykonuje operację (z obsługą Idempotency-Key) pod blokadami kont trzymanymi
+    do zatwierdzenia transakcji. Zwraca (odpowiedź, czy powtórzona).
+    """
+    try:
+        async with account_locks.hold(account_ids):
+            return await idempotency_store.run(owner_id, idempotency_key, fingerprint, apply)
+    except LockTimeout:
+        return error_response("Account is busy, try again later", 503), False
+
+async def commit_locked(account_ids, apply):
+    """
+    Wykonuje operację przez group committer pod blokadami kont trzymanymi
+    do zatwierdzenia transakcji (bez obsługi Idempotency-Key).
+    """
+    try:
+        async with account_locks.hold(account_ids):
+            return await group_committer.run(apply)
+    except LockTimeout:
+        return error_response("Account is busy, try again later", 503)
 
 # ---------------------------
 # Wpłata na konto
 # ---------------------------
 @router.post("/{account_id}/deposit")
-async def deposit(account_id: int, amount: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+async def deposit(
+    account_id: int,
+    amount: int,
+    current_user: Principal = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Wpłaca środki na konto użytkownika.
+    Zmiana salda i log operacji są zatwierdzane w jednej transakcji (group commit).
+    Powtórzenie z tym samym nagłówkiem Idempotency-Key zwraca zapisaną odpowiedź.
     """
     if amount <= 0:
         return error_response("Deposit amount must be greater than zero", 400)
 
-    account = db.query(models.Account).filter(models.Account.id == account_id).with_for_update().first()
-    if not account or account.owner_id != current_user.id:
-        return error_response("Account not found or access denied", 403)
+    owner_id = current_user.id
 
-    account.balance += amount
-    db.commit()
-    crud.log_operation(db, account_id, "deposit", f"Deposited {amount}")
-    await notify_all(f"Deposit of {amount} made to account ID: {account_id}")
+    async def apply(db: AsyncSession):
+        account = await crud.get_account_async(db, account_id, for_update=True)
+        if not account or account.owner_id != owner_id:
+            return error_response("Account not found or access denied", 403)
 
-    return success_response({
-        "new_balance": account.balance
-    }, "Deposit successful")
+        account.balance += amount
+        crud.log_operation(db, account_id, "deposit", f"Deposited {amount}", commit=False,
+                           amount=amount, direction="in")
+        return success_response({
+            "new_balance": account.balance
+        }, "Deposit successful")
+
+    fingerprint = request_hash("deposit", account_id=account_id, amount=amount)
+    result, replayed = await run_locked([account_id], owner_id, idempotency_key, fingerprint, apply)
+    if result["status"] == "success" and not replayed:
+        notify_all(f"Deposit of {amount} made to account ID: {account_id}", [account_id])
+    return result
 
 # ---------------------------
 # Wypłata z konta
 # ---------------------------
 @router.post("/{account_id}/withdraw")
-async def withdraw(account_id: int, amount: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+async def withdraw(
+    account_id: int,
+    amount: int,
+    current_user: Principal = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Wypłaca środki z konta użytkownika.
+    Zmiana salda i log operacji są zatwierdzane w jednej transakcji (group commit).
+    Powtórzenie z tym samym nagłówkiem Idempotency-Key zwraca zapisaną odpowiedź.
     """
     if amount <= 0:
         return error_response("Withdrawal amount must be greater than zero", 400)
 
-    account = db.query(models.Account).filter(models.Account.id == account_id).with_for_update().first()
-    if not account or account.owner_id != current_user.id:
-        return error_response("Account not found or access denied", 403)
-    if account.balance < amount:
-        return error_response("Insufficient funds", 400)
+    owner_id = current_user.id
 
-    account.balance -= amount
-    db.commit()
-    crud.log_operation(db, account_id, "withdraw", f"Withdrew {amount}")
-    await notify_all(f"Withdrawal of {amount} made from account ID: {account_id}")
+    async def apply(db: AsyncSession):
+        account = await crud.get_account_async(db, account_id, for_update=True)
+        if not account or account.owner_id != owner_id:
+            return error_response("Account not found or access denied", 403)
+        if account.available < amount:
+            return error_response("Insufficient funds", 400)
 
-    return success_response({
-        "new_balance": account.balance
-    }, "Withdrawal successful")
+        account.balance -= amount
+        crud.log_operation(db, account_id, "withdraw", f"Withdrew {amount}", commit=False,
+                           amount=amount, direction="out")
+        return success_response({
+            "new_balance": account.balance
+        }, "Withdrawal successful")
+
+    fingerprint = request_hash("withdraw", account_id=account_id, amount=amount)
+    result, replayed = await run_locked([account_id], owner_id, idempotency_key, fingerprint, apply)
+    if result["status"] == "success" and not replayed:
+        notify_all(f"Withdrawal of {amount} made from account ID: {account_id}", [account_id])
+    return result
 
 # ---------------------------
 # Przelew między kontami
 # ---------------------------
 @router.post("/transfer")
-async def transfer(from_account_id: int, to_account_id: int, amount: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+async def transfer(
+    from_account_id: int,
+    to_account_id: int,
+    amount: int,
+    current_user: Principal = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Przelewa środki z jednego konta użytkownika na inne.
+    Obie zmiany salda i oba logi są zatwierdzane w jednej transakcji (group commit).
+    Powtórzenie z tym samym nagłówkiem Idempotency-Key zwraca zapisaną odpowiedź.
     """
     if amount <= 0:
         return error_response("Transfer amount must be greater than zero", 400)
 
-    from_account = db.query(models.Account).filter(models.Account.id == from_account_id).with_for_update().first()
-    to_account = db.query(models.Account).filter(models.Account.id == to_account_id).with_for_update().first()
+    owner_id = current_user.id
+
+    async def apply(db: AsyncSession):
+        from_account = await crud.get_account_async(db, from_account_id, for_update=True)
+        to_account = await crud.get_account_async(db, to_account_id, for_update=True)
+
+        if not from_account or not to_account or from_account.owner_id != owner_id:
+            return error_response("Account not found or access denied", 403)
+        if from_account.available < amount:
+            return error_response("Insufficient funds", 400)
+
+        from_account.balance -= amount
+        to_account.balance += amount
+        crud.log_operation(db, from_account_id, "transfer", f"Transferred {amount} to account {to_account_id}", commit=False,
+                           amount=amount, counterparty_account_id=to_account_id, direction="out")
+        crud.log_operation(db, to_account_id, "transfer", f"Received {amount} from account {from_account_id}", commit=False,
+                           amount=amount, counterparty_account_id=from_account_id, direction="in")
+        return success_response({
+            "from_account_id": from_account_id,
+            "to_account_id": to_account_id,
+            "amount": amount
+        }, "Transfer successful")
+
+    fingerprint = request_hash("transfer", from_account_id=from_account_id, to_account_id=to_account_id, amount=amount)
+    result, replayed = await run_locked([from_account_id, to_account_id], owner_id, idempotency_key, fingerprint, apply)
+    if result["status"] == "success" and not replayed:
+        notify_all(f"Transfer of {amount} from account {from_account_id} to account {to_account_id}", [from_account_id, to_account_id])
+    return result
 
-    if not from_account or not to_account or from_account.owner_id != current_user.id:
-        return error_response("Account not found or access denied", 403)
-    if from_account.balance < amount:
-        return error_response("Insufficient funds", 400)
+# ---------------------------
+# Operacje zbiorcze
+# ---------------------------
+BATCH_MAX_OPERATIONS = config("BATCH_MAX_OPERATIONS", default=10000, cast=int)
 
-    from_account.balance -= amount
-    to_account.balance += amount
-    db.commit()
-    crud.log_operation(db, from_account_id, "transfer", f"Transferred {amount} to account {to_account_id}")
-    crud.log_operation(db, to_account_id, "transfer", f"Received {amount} from account {from_account_id}")
-    await notify_all(f"Transfer of {amount} from account {from_account_id} to account {to_account_id}")
+class BatchOperation(BaseModel):
+    type: Literal["deposit", "withdraw", "transfer"]
+    account_id: int  # Konto źródłowe przelewu
+    amount: int
+    to_account_id: Optional[int] = None  # Tylko dla przelewu
 
-    return success_response({
-        "from_account_id": from_account_id,
-        "to_account_id": to_account_id,
-        "amount": amount
-    }, "Transfer successful")
+class BatchRequest(BaseModel):
+    mode: Literal["atomic", "best_effort"] = "atomic"
+    operations: List[BatchOperation]
+
+def check_batch_operation(operation: BatchOperation):
+    """
+    Walidacja operacji niezależna od stanu kont. Zwraca błąd lub None.
+    """
+    if operation.amount <= 0:
+        return error_response("Amount must be greater than zero", 400)
+    if operation.type == "transfer":
+        if operation.to_account_id is None:
+            return error_response("Transfer requires to_account_id", 400)
+        if operation.to_account_id == operation.account_id:
+            return error_response("Cannot transfer to the same account", 400)
+    return None
+
+@router.post("/batch")
+async def batch_operations(batch: BatchRequest, current_user: Principal = Depends(get_current_user)):
+    """
+    Wykonuje wiele wpłat, wypłat i przelewów w jednej transakcji.
+
+    Operacje są walidowane razem i wykonywane w podanej kolejności na saldach
+    w pamięci; konta są blokowane (account_locks) w kolejności rosnących pasków
+    do zatwierdzenia transakcji, a logi zapisywane jednym INSERT. W trybie
+    "atomic" błąd dowolnej operacji odrzuca całą partię, w trybie
+    "best_effort" wykonywane są tylko poprawne operacje.
+    Zwraca wynik dla każdej operacji (w kolejności z żądania).
+    """
+    operations = batch.operations
+    if not operations:
+        return error_response("No operations given", 400)
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return error_response(f"Too many operations (max {BATCH_MAX_OPERATIONS})", 413)
+
+    owner_id = current_user.id
+    atomic = batch.mode == "atomic"
+    account_ids = set()
+    for operation in operations:
+        account_ids.add(operation.account_id)
+        if operation.to_account_id is not None:
+            account_ids.add(operation.to_account_id)
+
+    async def apply(db: AsyncSession):
+        accounts = await crud.get_accounts_async(db, account_ids, for_update=True)
+        balances = {account_id: account.balance for account_id, account in accounts.items()}
+
+        results, entries, failed = [], [], 0
+        for index, operation in enumerate(operations):
+            error = check_batch_operation(operation)
+            source = accounts.get(operation.account_id)
+            if error is None and (not source or source.owner_id != owner_id):
+                error = error_response("Account not found or access denied", 403)
+            if error is None and operation.type == "transfer" and operation.to_account_id not in accounts:
+                error = error_response("Destination account not found", 404)
+            if error is None and operation.type != "deposit" and balances[operation.account_id] - accounts[operation.account_id].held < operation.amount:
+                error = error_response("Insufficient funds", 400)
+            if error is not None:
+                failed += 1
+                results.append({"index": index, **error})
+                continue
+
+            amount = operation.amount
+            if operation.type == "deposit":
+                balances[operation.account_id] += amount
+                entries.append(crud.ledger_entry(operation.account_id, "deposit", f"Deposited {amount}",
+                                                 amount, direction="in"))
+                results.append({"index": index, "status": "success", "new_balance": balances[operation.account_id]})
+            elif operation.type == "withdraw":
+                balances[operation.account_id] -= amount
+                entries.append(crud.ledger_entry(operation.account_id, "withdraw", f"Withdrew {amount}",
+                                                 amount, direction="out"))
+                results.append({"index": index, "status": "success", "new_balance": balances[operation.account_id]})
+            else:
+                balances[operation.account_id] -= amount
+                balances[operation.to_account_id] += amount
+                entries.append(crud.ledger_entry(operation.account_id, "transfer",
+                                                 f"Transferred {amount} to account {operation.to_account_id}",
+                                                 amount, operation.to_account_id, "out"))
+                entries.append(crud.ledger_entry(operation.to_account_id, "transfer",
+                                                 f"Received {amount} from account {operation.account_id}",
+                                                 amount, operation.account_id, "in"))
+                results.append({"index": index, "status": "success", "new_balance": balances[operation.account_id]})
+
+        if atomic and failed:
+            # Nic nie zostało zmienione; wyniki pokazują, które operacje blokują partię
+            return {
+                **error_response(f"Batch rejected: {failed} operation(s) failed", 400),
+                "data": {"mode": batch.mode, "applied": 0, "failed": failed, "results": results},
+            }
+
+        changed = set()
+        for account_id, balance in balances.items():
+            if accounts[account_id].balance != balance:
+                accounts[account_id].balance = balance
+                changed.add(account_id)
+        await crud.log_operations_async(db, entries)
+        return success_response({
+            "mode": batch.mode,
+            "applied": len(operations) - failed,
+            "failed": failed,
+            "results": results,
+            "changed_accounts": sorted(changed),
+        }, "Batch processed")
+
+    result = await commit_locked(account_ids, apply)
+    changed = result["data"].pop("changed_accounts", None) if result["status"] == "success" else None
+    if changed:
+        # Jedno powiadomienie dla całej partii zamiast jednego na operację
+        notify_all(f"Batch of {result['data']['applied']} operations applied", changed)
+    return result
 
 # ---------------------------
 # Pobieranie logów operacji z filtrowaniem
 # ---------------------------
+LOGS_PAGE_SIZE = 50  # Domyślny rozmiar strony logów
+LOGS_MAX_PAGE_SIZE = 500  # Maksymalny rozmiar strony logów
+
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    """
+    Koduje pozycję (timestamp, id) ostatniego logu strony jako nieprzezroczysty kursor.
+    """
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{log_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Dekoduje kursor do pary (timestamp, id). Zgłasza ValueError dla niepoprawnego kursora.
+    """
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def parse_date_range(start_date: str = None, end_date: str = None):
+    """
+    Zamienia daty YYYY-MM-DD na zakres (start, koniec dnia end_date).
+    Zwraca (start, end, error_response lub None).
+    """
+    start_date_obj = end_date_obj = None
+    if start_date:
+        try:
+            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
+        except ValueError:
+            return None, None, error_response("Invalid start_date format. Use YYYY-MM-DD.", 400)
+    if end_date:
+        try:
+            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) - timedelta(microseconds=1)
+        except ValueError:
+            return None, None, error_response("Invalid end_date format. Use YYYY-MM-DD.", 400)
+    return start_date_obj, end_date_obj, None
+
+def log_to_dict(log: models.Log) -> dict:
+    return {
+        "id": log.id,
+        "account_id": log.account_id,
+        "operation": log.operation,
+        "timestamp": log.timestamp,
+        "details": log.details,
+        "amount": log.amount,
+        "counterparty_account_id": log.counterparty_account_id,
+        "direction": log.direction
+    }
+
 @router.get("/{account_id}/logs")
 def get_account_logs(
     account_id: int,
     start_date: str = None,
     end_date: str = None,
     operation_type: str = None,
-    current_user: models.User = Depends(get_current_user),
+    min_amount: int = None,
+    max_amount: int = None,
+    limit: int = LOGS_PAGE_SIZE,
+    cursor: str = None,
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ):
     """
     Pobiera logi operacji na koncie z możliwością filtrowania.
+    Wyniki są stronicowane (od najnowszych); `next_cursor` z odpowiedzi
+    przekazany jako `cursor` zwraca kolejną stronę.
     """
     account = crud.get_account(db, account_id)
     if not account or account.owner_id != current_user.id:
         return error_response("Account not found or access denied", 403)
 
-    logs = crud.get_logs_for_account(db, account_id)
+    # Filtrowanie według zakresu dat (end_date obejmuje cały dzień)
+    start_date_obj, end_date_obj, error = parse_date_range(start_date, end_date)
+    if error:
+        return error
 
-    # Filtrowanie według zakresu dat
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
-            logs = [log for log in logs if log.timestamp >= start_date_obj]
-        except ValueError:
-            return error_response("Invalid start_date format. Use YYYY-MM-DD.", 400)
+    if limit < 1 or limit > LOGS_MAX_PAGE_SIZE:
+        return error_response(f"limit must be between 1 and {LOGS_MAX_PAGE_SIZE}", 400)
 
-    if end_date:
+    cursor_value = None
+    if cursor:
         try:
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
-            logs = [log for log in logs if log.timestamp <= end_date_obj]
+            cursor_value = decode_cursor(cursor)
         except ValueError:
-            return error_response("Invalid end_date format. Use YYYY-MM-DD.", 400)
+            return error_response("Invalid cursor", 400)
+
+    # Pobranie o jeden log więcej, aby wiedzieć, czy istnieje kolejna strona
+    logs = crud.get_logs_for_account(
+        db, account_id,
+        start_date=start_date_obj,
+        end_date=end_date_obj,
+        operation_type=operation_type,
+        limit=limit + 1,
+        cursor=cursor_value,
+        min_amount=min_amount,
+        max_amount=max_amount
+    )
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1].timestamp, logs[-1].id)
+
+    return success_response({
+        "logs": [log_to_dict(log) for log in logs],
+        "next_cursor": next_cursor
+    }, "Logs retrieved successfully")
+
+# ---------------------------
+# Sumy operacji konta
+# ---------------------------
+@router.get("/{account_id}/totals")
+def get_account_totals(
+    account_id: int,
+    start_date: str = None,
+    end_date: str = None,
+    operation_type: str = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Zwraca sumy wpływów i wypływów konta w zakresie dat (liczone w SQL na kolumnach kwot).
+    """
+    account = crud.get_account(db, account_id)
+    if not account or account.owner_id != current_user.id:
+        return error_response("Account not found or access denied", 403)
+
+    start_date_obj, end_date_obj, error = parse_date_range(start_date, end_date)
+    if error:
+        return error
+
+    totals = crud.get_account_totals(db, account_id, start_date_obj, end_date_obj, operation_type)
+    return success_response({"account_id": account_id, **totals})
 
-    # Filtrowanie według rodzaju operacji
-    if operation_type:
-        logs = [log for log in logs if log.operation == operation_type]
+# ---------------------------
+# Zestawienie dzienne / miesięczne
+# ---------------------------
+SUMMARY_PERIODS = ("day", "month")
+
+@router.get("/{account_id}/summary")
+def get_account_summary(
+    account_id: int,
+    start_date: str = None,
+    end_date: str = None,
+    operation_type: str = None,
+    period: str = "day",
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Zwraca wpływy, wypływy i liczbę operacji konta w podziale na dni (lub miesiące)
+    i rodzaj operacji. Dane pochodzą z dziennych zestawień aktualizowanych razem
+    z logami, więc czas odpowiedzi nie zależy od długości historii.
+    """
+    account = crud.get_account(db, account_id)
+    if not account or account.owner_id != current_user.id:
+        return error_response("Account not found or access denied", 403)
+    if period not in SUMMARY_PERIODS:
+        return error_response("Invalid period. Use 'day' or 'month'", 400)
+
+    start_date_obj, end_date_obj, error = parse_date_range(start_date, end_date)
+    if error:
+        return error
+
+    rows = crud.get_account_summary(
+        db, account_id,
+        start_day=start_date_obj.date() if start_date_obj else None,
+        end_day=end_date_obj.date() if end_date_obj else None,
+        operation_type=operation_type,
+        period=period
+    )
+    inflow = sum(row["inflow"] for row in rows)
+    outflow = sum(row["outflow"] for row in rows)
+    return success_response({
+        "account_id": account_id,
+        "period": period,
+        "rows": rows,
+        "totals": {
+            "inflow": inflow,
+            "outflow": outflow,
+            "net": inflow - outflow,
+            "count": sum(row["count"] for row in rows)
+        }
+    })
 
-    return success_response(logs, "Logs retrieved successfully")
+# ---------------------------
+# Eksport wyciągu (strumieniowo)
+# ---------------------------
+EXPORT_CHUNK_SIZE = 1000  # Liczba logów pobieranych z bazy w jednej porcji
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_CSV_COLUMNS = ["id", "account_id", "operation", "timestamp", "details", "amount", "counterparty_account_id", "direction"]
+
+def export_rows(account_id: int, export_format: str, start_date=None, end_date=None, operation_type=None,
+                min_amount: int = None, max_amount: int = None):
+    """
+    Generuje kolejne linie wyciągu. Korzysta z własnej sesji, bo odpowiedź
+    jest wysyłana już po zamknięciu sesji żądania.
+    """
+    db = database.SessionLocal()
+    try:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_CSV_COLUMNS)
+        for log in crud.iter_logs_for_account(db, account_id, start_date, end_date, operation_type,
+                                              chunk_size=EXPORT_CHUNK_SIZE, min_amount=min_amount, max_amount=max_amount):
+            row = log_to_dict(log)
+            row["timestamp"] = log.timestamp.isoformat()
+            if export_format == "csv":
+                writer.writerow([row[column] for column in EXPORT_CSV_COLUMNS])
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield (json.dumps(row, ensure_ascii=False) + "\n").encode()
+    finally:
+        db.close()
+
+def gzip_stream(chunks):
+    """
+    Kompresuje strumień gzip bez buforowania całości.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> nagłówek gzip
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@router.get("/{account_id}/logs/export")
+def export_account_logs(
+    account_id: int,
+    format: str = "ndjson",
+    compress: bool = False,
+    start_date: str = None,
+    end_date: str = None,
+    operation_type: str = None,
+    min_amount: int = None,
+    max_amount: int = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Eksportuje pełny wyciąg operacji konta jako NDJSON lub CSV (opcjonalnie gzip).
+    Logi są pobierane porcjami i odszyfrowywane w trakcie wysyłania, więc zużycie
+    pamięci nie zależy od długości historii.
+    """
+    account = crud.get_account(db, account_id)
+    if not account or account.owner_id != current_user.id:
+        return error_response("Account not found or access denied", 403)
+    if format not in EXPORT_FORMATS:
+        return error_response("Invalid format. Use 'ndjson' or 'csv'", 400)
+
+    # Filtrowanie według zakresu dat (end_date obejmuje cały dzień)
+    start_date_obj, end_date_obj, error = parse_date_range(start_date, end_date)
+    if error:
+        return error
+
+    content = export_rows(account_id, format, start_date_obj, end_date_obj, operation_type, min_amount, max_amount)
+    media_type = EXPORT_FORMATS[format]
+    filename = f"statement_{account_id}.{format}"
+    if compress:
+        content = gzip_stream(content)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # ---------------------------
 # Przelew oczekujący
 # ---------------------------
 @router.post("/transfer/pending")
-def create_pending_transfer(
+async def create_pending_transfer(
     from_account_id: int,
     to_account_id: int,
     amount: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Tworzy przelew oczekujący na zatwierdzenie.
+    Kwota jest blokowana na koncie źródłowym (zmniejsza saldo dostępne, nie księgowe)
+    do czasu rozliczenia albo odrzucenia przelewu.
     """
     if amount <= 0:
         return error_response("Transfer amount must be greater than zero", 400)
+    if from_account_id == to_account_id:
+        return error_response("Cannot transfer to the same account", 400)
+
+    owner_id = current_user.id
+
+    async def apply(db: AsyncSession):
+        from_account = await crud.get_account_async(db, from_account_id, for_update=True)
+        to_account = await crud.get_account_async(db, to_account_id)
+
+        if not from_account or from_account.owner_id != owner_id:
+            return error_response("Source account not found or access denied", 403)
+        if not to_account:
+            return error_response("Destination account not found", 404)
+        if from_account.available < amount:
+            return error_response("Insufficient funds", 400)
+
+        from_account.held += amount
+        pending = await crud.create_pending_transfer_async(db, from_account_id, to_account_id, amount)
+
+        # Dodanie logu dla przelewu oczekującego
+        crud.log_operation(
+            db,
+            account_id=from_account_id,
+            operation="pending_transfer",
+            details=f"Pending transfer {pending.id} of {amount} to account {to_account_id}",
+            commit=False,
+            amount=amount,
+            counterparty_account_id=to_account_id
+        )
+        return success_response({
+            "pending_transfer_id": pending.id,
+            "available": from_account.available
+        }, "Pending transfer created successfully")
+
+    result = await commit_locked([from_account_id], apply)
+    if result["status"] == "success":
+        notify_all(f"Pending transfer of {amount} from account {from_account_id} to account {to_account_id}", [from_account_id])
+    return result
+
+class PendingDecision(BaseModel):
+    ids: List[int]
+
+async def decide_pending_transfers(ids: List[int], owner_id: int, approve: bool):
+    """
+    Zatwierdza lub odrzuca wiele przelewów oczekujących w jednej transakcji.
+    Odrzucenie od razu zwalnia blokadę środków; zatwierdzone przelewy rozlicza settler.
+    Zwraca wynik dla każdego ID (w kolejności z żądania, bez powtórzeń).
+    """
+    ids = list(dict.fromkeys(ids))
+    now = datetime.now(timezone.utc)
+
+    async def apply(db: AsyncSession):
+        transfers = await crud.get_pending_transfers_async(db, ids)
+        accounts = await crud.get_accounts_async(db, {t.from_account_id for t in transfers.values()}, for_update=True)
+
+        results, entries, decided, changed = [], [], 0, set()
+        for transfer_id in ids:
+            transfer = transfers.get(transfer_id)
+            if transfer is None or accounts[transfer.from_account_id].owner_id != owner_id:
+                results.append({"id": transfer_id, **error_response("Pending transfer not found or access denied", 404)})
+                continue
+            if transfer.status != "pending":
+                results.append({"id": transfer_id, **error_response(f"Pending transfer already {transfer.status}", 409)})
+                continue
+
+            transfer.decided_at = now
+            if approve:
+                transfer.status = "approved"
+            else:
+                transfer.status = "rejected"
+                accounts[transfer.from_account_id].held -= transfer.amount  # Zwolnienie blokady
+                changed.add(transfer.from_account_id)
+                entries.append(crud.ledger_entry(
+                    transfer.from_account_id, "pending_transfer_rejected",
+                    f"Pending transfer {transfer.id} of {transfer.amount} to account {transfer.to_account_id} rejected",
+                    transfer.amount, transfer.to_account_id
+                ))
+            decided += 1
+            results.append({"id": transfer_id, "status": "success"})
+
+        await crud.log_operations_async(db, entries)
+        return success_response({
+            "decided": decided,
+            "failed": len(ids) - decided,
+            "results": results,
+            "changed_accounts": sorted(changed),
+        }, "Pending transfers approved" if approve else "Pending transfers rejected")
+
+    # Konta źródłowe przelewów (niezmienne) do zablokowania na czas transakcji
+    async with database.AsyncSessionLocal() as db:
+        account_ids = {t.from_account_id for t in (await crud.get_pending_transfers_async(db, ids)).values()}
+    result = await commit_locked(account_ids, apply)
+    if result["status"] != "success":
+        return result
+    changed = result["data"].pop("changed_accounts")
+    if changed:
+        notify_all(f"Rejected {result['data']['decided']} pending transfers", changed)
+    return result
+
+@router.post("/transfer/pending/approve")
+async def approve_pending_transfers(decision: PendingDecision, current_user: Principal = Depends(get_current_user)):
+    """
+    Zatwierdza przelewy oczekujące o podanych ID; rozliczenie następuje w tle, partiami.
+    """
+    if not decision.ids:
+        return error_response("No pending transfer IDs given", 400)
+    if len(decision.ids) > BATCH_MAX_OPERATIONS:
+        return error_response(f"Too many pending transfer IDs (max {BATCH_MAX_OPERATIONS})", 413)
+
+    result = await decide_pending_transfers(decision.ids, current_user.id, approve=True)
+    if result["status"] == "success" and result["data"]["decided"]:
+        settler.wake()
+    return result
+
+@router.post("/transfer/pending/reject")
+async def reject_pending_transfers(decision: PendingDecision, current_user: Principal = Depends(get_current_user)):
+    """
+    Odrzuca przelewy oczekujące o podanych ID i zwalnia zablokowane środki.
+    """
+    if not decision.ids:
+        return error_response("No pending transfer IDs given", 400)
+    if len(decision.ids) > BATCH_MAX_OPERATIONS:
+        return error_response(f"Too many pending transfer IDs (max {BATCH_MAX_OPERATIONS})", 413)
 
-    from_account = crud.get_account(db, from_account_id)
-    to_account = crud.get_account(db, to_account_id)
-
-    if not from_account or from_account.owner_id != current_user.id:
-        return error_response("Source account not found or access denied", 403)
-    if not to_account:
-        return error_response("Destination account not found", 404)
-    if from_account.balance < amount:
-        return error_response("Insufficient funds", 400)
-
-    # Dodanie logu dla przelewu oczekującego
-    crud.log_operation(
-        db,
-        account_id=from_account_id,
-        operation="pending_transfer",
-        details=f"Pending transfer of {amount} to account {to_account_id}"
-    )
-
-    return success_response({}, "Pending transfer created successfully")
+    return await decide_pending_transfers(decision.ids, current_user.id, approve=False)
 
 # ---------------------------
 # Przelew cykliczny
@@ -258,16 +801,19 @@ def create_recurring_transfer(
     to_account_id: int,
     amount: int,
     frequency: str,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ):
     """
     Tworzy przelew cykliczny z określoną częstotliwością.
+    Pierwszy przelew jest wykonywany od razu, kolejne przez harmonogram w ich terminach.
     """
     if amount <= 0:
         return error_response("Transfer amount must be greater than zero", 400)
-    if frequency not in ["daily", "weekly", "monthly"]:
+    if frequency not in RECURRING_FREQUENCIES:
         return error_response("Invalid frequency. Use 'daily', 'weekly', or 'monthly'", 400)
+    if from_account_id == to_account_id:
+        return error_response("Cannot transfer to the same account", 400)
 
     from_account = crud.get_account(db, from_account_id)
     to_account = crud.get_account(db, to_account_id)
@@ -276,18 +822,33 @@ def create_recurring_transfer(
         return error_response("Source account not found or access denied", 403)
     if not to_account:
         return error_response("Destination account not found", 404)
-    if from_account.balance < amount:
+    if from_account.available < amount:
         return error_response("Insufficient funds", 400)
 
-    # Dodanie logu dla przelewu cyklicznego
+    recurring = crud.create_recurring_transfer(
+        db,
+        from_account_id=from_account_id,
+        to_account_id=to_account_id,
+        amount=amount,
+        frequency=frequency,
+        next_run_at=datetime.now(timezone.utc),
+        commit=False
+    )
+
+    # Dodanie logu dla przelewu cyklicznego (zatwierdzany razem ze zleceniem)
     crud.log_operation(
         db,
         account_id=from_account_id,
         operation="recurring_transfer",
-        details=f"Recurring transfer of {amount} to account {to_account_id} with frequency {frequency}"
+        details=f"Recurring transfer of {amount} to account {to_account_id} with frequency {frequency}",
+        amount=amount,
+        counterparty_account_id=to_account_id
     )
 
-    return success_response({}, "Recurring transfer created successfully")
-
-
+    # Harmonogram w każdym workerze dowiaduje się o nowym zleceniu
+    event_bus.publish("recurring", {"id": recurring.id, "next_run_at": recurring.next_run_at.isoformat()})
 
+    return success_response({
+        "recurring_transfer_id": recurring.id,
+        "next_run_at": recurring.next_run_at.isoformat()
+    }, "Recurring transfer created successfully")
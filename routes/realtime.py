@@ -1,14 +1,27 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket
+from database import crud
+from database.database import AsyncSessionLocal
+from utils.notifications import hub
+from utils.security import get_websocket_user
 
 router = APIRouter()
-active_connections = []
+
+async def serve_notifications(websocket: WebSocket):
+    """
+    Uwierzytelnia klienta i obsługuje jego subskrypcje powiadomień
+    (tylko dla kont należących do użytkownika z tokenu).
+    """
+    principal = await get_websocket_user(websocket)
+    if principal is None:
+        await websocket.close(code=1008)  # Policy violation: brak lub nieważny token
+        return
+
+    async def authorize(account_ids):
+        async with AsyncSessionLocal() as db:
+            return await crud.get_owned_account_ids_async(db, principal.id, account_ids)
+
+    await hub.serve(websocket, authorize)
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    active_connections.append(websocket)
-    try:
-        while True:
-            data = await websocket.receive_text()  # Odbieranie danych od klienta (opcjonalne)
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
+    await serve_notifications(websocket)
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import crud, models, database
-from utils.hashing import verify_password
-from utils.security import create_access_token, get_current_user
+from database import crud, database
+from utils.hashing import hash_password_async, verify_password_async
+from utils.security import Principal, create_access_token, get_current_user, invalidate_user_token, replace_user_token
 from utils.responses import success_response, error_response
 
 router = APIRouter()
@@ -26,11 +27,12 @@ def get_user(user_id: int, db: Session = Depends(database.get_db)):
 # Tworzenie użytkownika
 # ---------------------------
 @router.post("/")
-def create_user(username: str, password: str, full_name: str, pesel: str, db: Session = Depends(database.get_db)):
-    if db.query(models.User).filter(models.User.username == username).first():
+async def create_user(username: str, password: str, full_name: str, pesel: str, db: AsyncSession = Depends(database.get_async_db)):
+    if await crud.get_user_by_username_async(db, username):
         return error_response("Username already exists", 400)
 
-    user = crud.create_user(db, username, password, full_name, pesel)
+    hashed_password = await hash_password_async(password)  # bcrypt w puli procesów
+    user = await crud.create_user_async(db, username, hashed_password, full_name, pesel)
     return success_response({
         "id": user.id,
         "username": user.username,
@@ -41,9 +43,14 @@ def create_user(username: str, password: str, full_name: str, pesel: str, db: Se
 # Logowanie użytkownika
 # ---------------------------
 @router.post("/login")
-def login(username: str, password: str, db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user or not verify_password(password, user.password):
+async def login(username: str, password: str, db: AsyncSession = Depends(database.get_async_db)):
+    user = await crud.get_user_by_username_async(db, username)
+    if not user:
+        return error_response("Invalid username or password", 400)
+
+    # Weryfikacja bcrypt w puli procesów (z ponownym haszowaniem przestarzałych haseł)
+    valid, new_hash = await verify_password_async(password, user.password)
+    if not valid:
         return error_response("Invalid username or password", 400)
 
     if user.active_token:
@@ -52,8 +59,9 @@ def login(username: str, password: str, db: Session = Depends(database.get_db)):
     # Tworzenie tokenu
     access_token = create_access_token(data={"sub": user.username})
     user.active_token = access_token
-    db.commit()
-    db.refresh(user)
+    if new_hash:
+        user.password = new_hash
+    await db.commit()
 
     return success_response({
         "access_token": access_token,
@@ -70,19 +78,16 @@ def login(username: str, password: str, db: Session = Depends(database.get_db)):
 # Wylogowanie użytkownika
 # ---------------------------
 @router.post("/logout")
-def logout(current_user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
-    current_user.active_token = None
-    db.commit()
-    db.refresh(current_user)
+def logout(current_user: Principal = Depends(get_current_user), db: Session = Depends(database.get_db)):
+    invalidate_user_token(current_user, db)
     return success_response({}, "Logged out successfully")
 
 # ---------------------------
 # Odświeżanie tokenu użytkownika
 # ---------------------------
 @router.post("/refresh")
-def refresh_token(current_user: models.User = Depends(get_current_user)):
-    new_token = create_access_token(data={"sub": current_user.username})
-    current_user.active_token = new_token
+def refresh_token(current_user: Principal = Depends(get_current_user), db: Session = Depends(database.get_db)):
+    new_token = replace_user_token(current_user, db)
     return success_response({
         "access_token": new_token,
         "token_type": "bearer"
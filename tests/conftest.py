@@ -0,0 +1,69 @@
+"""
+Wspólna konfiguracja testów.
+
+Baza (./bank.db) i szyna zdarzeń używają ścieżek względnych i domyślnych
+katalogów, więc testy działają w osobnym katalogu roboczym, z tanim bcrypt
+i bez zadań w tle.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="bank-tests-")
+os.chdir(WORKDIR)
+os.environ.update({
+    "EVENT_BUS_DIR": os.path.join(WORKDIR, "bus"),
+    "LOG_ARCHIVE_DIR": os.path.join(WORKDIR, "log_archive"),
+    "BCRYPT_ROUNDS": "4",
+    "RECURRING_SCHEDULER": "False",
+    "PENDING_SETTLER": "False",
+    "LOG_ARCHIVER": "False",
+    "PEER_SERVERS": "",
+})
+
+_user_numbers = itertools.count(1)
+
+
+class BankUser:
+    """
+    Zalogowany użytkownik testowy z pomocniczymi wywołaniami API.
+    """
+
+    def __init__(self, client, username: str):
+        self.client = client
+        client.post("/users/", params={"username": username, "password": "pw", "full_name": username, "pesel": "00000000000"})
+        token = client.post("/users/login", params={"username": username, "password": "pw"}).json()["data"]["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def open_account(self, balance: int = 0) -> int:
+        return self.client.post("/accounts/", params={"balance": balance}, headers=self.headers).json()["data"]["account_id"]
+
+    def balance(self, account_id: int) -> int:
+        return self.client.get(f"/accounts/{account_id}/balance", headers=self.headers).json()["data"]["balance"]
+
+    def post(self, url: str, headers: dict = None, **kwargs):
+        return self.client.post(url, headers={**self.headers, **(headers or {})}, **kwargs).json()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(client):
+    return lambda: BankUser(client, f"user{next(_user_numbers)}")
+
+
+@pytest.fixture
+def bank_user(make_user) -> BankUser:
+    return make_user()
@@ -0,0 +1,73 @@
+import pytest
+
+from utils.assignment import HashRing, parse_servers
+
+NODES = {"https://a": 1, "https://b": 1, "https://c": 2}
+KEYS = [f"user{i}" for i in range(5000)]
+
+
+def test_parse_servers_weights():
+    assert parse_servers(["https://a/", "https://b=3"]) == [
+        {"url": "https://a", "weight": 1},
+        {"url": "https://b", "weight": 3},
+    ]
+
+
+@pytest.mark.parametrize("entry", ["https://a=0", "https://a=-1"])
+def test_parse_servers_rejects_weight_below_one(entry):
+    with pytest.raises(ValueError):
+        parse_servers([entry])
+
+
+def test_zero_weight_node_does_not_hang_and_gets_no_keys():
+    ring = HashRing({"https://a": 1, "https://b": 0}, vnodes=16)
+    assert {ring.get_node(key) for key in KEYS[:200]} == {"https://a"}
+    assert list(ring.iter_nodes("x")) == ["https://a"]
+
+
+def test_assignment_is_deterministic():
+    first, second = HashRing(NODES), HashRing(NODES)
+    assert [first.get_node(key) for key in KEYS] == [second.get_node(key) for key in KEYS]
+
+
+def test_weights_shift_share_of_keys():
+    ring = HashRing(NODES)
+    owners = [ring.get_node(key) for key in KEYS]
+    share = owners.count("https://c") / len(KEYS)
+    assert 0.4 < share < 0.6
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = HashRing(NODES)
+    before = {key: ring.get_node(key) for key in KEYS}
+    ring.add_node("https://d")
+    moved = {key for key in KEYS if ring.get_node(key) != before[key]}
+    assert moved
+    assert all(ring.get_node(key) == "https://d" for key in moved)
+    assert len(moved) / len(KEYS) < 0.35
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing(NODES)
+    before = {key: ring.get_node(key) for key in KEYS}
+    ring.remove_node("https://b")
+    for key in KEYS:
+        if before[key] != "https://b":
+            assert ring.get_node(key) == before[key]
+
+
+def test_failover_goes_to_next_successor_and_back():
+    ring = HashRing(NODES)
+    for key in KEYS[:500]:
+        order = list(ring.iter_nodes(key))
+        assert sorted(order) == sorted(NODES)
+        assert ring.get_healthy_node(key, NODES) == order[0]
+        assert ring.get_healthy_node(key, set(NODES) - {order[0]}) == order[1]
+    assert ring.get_healthy_node("user1", []) is None
+
+
+def test_bounded_load_skips_overloaded_owner():
+    ring = HashRing({"https://a": 1, "https://b": 1})
+    owner, successor = list(ring.iter_nodes("user1"))
+    assert ring.get_bounded_node("user1", {owner: 0, successor: 0}, 1.25) == owner
+    assert ring.get_bounded_node("user1", {owner: 10, successor: 0}, 1.25) == successor
@@ -0,0 +1,79 @@
+from database.locks import account_locks
+
+
+def batch(user, mode, operations):
+    return user.post("/accounts/batch", json={"mode": mode, "operations": operations})
+
+
+def test_atomic_batch_applies_all_operations(bank_user):
+    first, second = bank_user.open_account(100), bank_user.open_account(0)
+
+    result = batch(bank_user, "atomic", [
+        {"type": "deposit", "account_id": first, "amount": 50},
+        {"type": "transfer", "account_id": first, "to_account_id": second, "amount": 120},
+        {"type": "withdraw", "account_id": second, "amount": 20},
+    ])
+
+    assert result["status"] == "success"
+    assert (result["data"]["applied"], result["data"]["failed"]) == (3, 0)
+    assert [item["new_balance"] for item in result["data"]["results"]] == [150, 30, 100]
+    assert (bank_user.balance(first), bank_user.balance(second)) == (30, 100)
+
+
+def test_atomic_batch_with_a_failing_operation_changes_nothing(bank_user):
+    first, second = bank_user.open_account(100), bank_user.open_account(0)
+
+    result = batch(bank_user, "atomic", [
+        {"type": "deposit", "account_id": first, "amount": 50},
+        {"type": "transfer", "account_id": first, "to_account_id": second, "amount": 100},
+        {"type": "withdraw", "account_id": second, "amount": 500},
+    ])
+
+    assert result["status"] == "error"
+    assert (result["data"]["applied"], result["data"]["failed"]) == (0, 1)
+    assert result["data"]["results"][2]["index"] == 2
+    assert result["data"]["results"][2]["status"] == "error"
+    assert (bank_user.balance(first), bank_user.balance(second)) == (100, 0)
+
+
+def test_atomic_batch_rejects_operations_on_foreign_accounts(bank_user, make_user):
+    own, foreign = bank_user.open_account(100), make_user().open_account(100)
+
+    result = batch(bank_user, "atomic", [
+        {"type": "deposit", "account_id": own, "amount": 10},
+        {"type": "withdraw", "account_id": foreign, "amount": 10},
+    ])
+
+    assert result["status"] == "error"
+    assert result["data"]["results"][1]["code"] == 403
+    assert bank_user.balance(own) == 100
+
+
+def test_best_effort_batch_applies_only_valid_operations(bank_user):
+    account = bank_user.open_account(100)
+
+    result = batch(bank_user, "best_effort", [
+        {"type": "withdraw", "account_id": account, "amount": 30},
+        {"type": "withdraw", "account_id": account, "amount": 500},
+        {"type": "deposit", "account_id": account, "amount": 0},
+        {"type": "deposit", "account_id": account, "amount": 5},
+    ])
+
+    assert result["status"] == "success"
+    assert (result["data"]["applied"], result["data"]["failed"]) == (2, 2)
+    assert [item["status"] for item in result["data"]["results"]] == ["success", "error", "error", "success"]
+    assert bank_user.balance(account) == 75
+
+
+def test_empty_batch_is_rejected(bank_user):
+    assert batch(bank_user, "atomic", [])["code"] == 400
+
+
+def test_batch_takes_account_locks(bank_user):
+    first, second = bank_user.open_account(100), bank_user.open_account(0)
+    before = account_locks.stats()["acquisitions"]
+
+    batch(bank_user, "atomic", [{"type": "transfer", "account_id": first, "to_account_id": second, "amount": 10}])
+
+    assert account_locks.stats()["acquisitions"] == before + 1
+    assert account_locks.stats()["held"] == 0
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import socket
+import time
+
+from database.cache import ACCOUNT_INVALIDATE_CHUNK, AccountCache, CachedAccount
+from utils.event_bus import EVENT_BUS_MAX_DATAGRAM, EventBus
+
+
+def test_entries_expire_after_ttl():
+    cache = AccountCache(ttl=0.05)
+    cache.put(CachedAccount(1, 1, 100))
+    assert cache.get(1).balance == 100
+    time.sleep(0.06)
+    assert cache.get(1) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_clear_drops_entries_and_blocks_stale_fill():
+    cache = AccountCache()
+    cache.put(CachedAccount(1, 1, 100))
+    generation = cache.generation
+    cache.clear()
+    cache.fill(CachedAccount(2, 1, 50), generation)  # Odczyt rozpoczęty przed wyczyszczeniem
+    assert (cache.get(1), cache.get(2)) == (None, None)
+
+
+def test_largest_invalidation_chunk_fits_in_one_datagram():
+    event = {"channel": "accounts", "origin": 2 ** 22, "seq": 10 ** 12,
+             "data": {"origin": 2 ** 22, "invalidate": [10 ** 10] * ACCOUNT_INVALIDATE_CHUNK}}
+    assert len(json.dumps(event).encode()) <= EVENT_BUS_MAX_DATAGRAM
+
+
+def test_receiver_reports_gaps_corrupt_and_marker_events(tmp_path):
+    async def run():
+        bus = EventBus(str(tmp_path / "bus"))
+        received, losses = [], []
+        bus.subscribe("accounts", lambda data: received.append(data["n"]))
+        bus.on_loss("accounts", lambda: losses.append(len(received)))
+        await bus.start()
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for datagram in (
+                {"channel": "accounts", "origin": 1, "seq": 1, "data": {"n": 1}},
+                {"channel": "accounts", "origin": 1, "seq": 2, "data": {"n": 2}},
+                {"channel": "accounts", "origin": 1, "seq": 4, "data": {"n": 4}},  # Luka: zdarzenie 3 utracone
+                {"channel": "accounts", "origin": 2, "seq": 7, "data": {"n": 5}},  # Pierwsze od nowego workera
+                {"channel": "accounts", "origin": 1, "seq": 5},  # Zdarzenie za duże na datagram
+            ):
+                sender.sendto(json.dumps(datagram).encode(), bus.path)
+            sender.sendto(b'{"channel": "acc', bus.path)  # Obcięty datagram
+            await asyncio.sleep(0.1)
+        finally:
+            sender.close()
+            await bus.stop()
+        return received, losses
+
+    received, losses = asyncio.run(run())
+    assert received == [1, 2, 4, 5]
+    assert losses == [2, 4, 4]
+
+
+def test_oversized_event_is_sent_as_loss_marker(tmp_path):
+    async def run():
+        directory = tmp_path / "bus"
+        bus = EventBus(str(directory))
+        local = []
+        bus.subscribe("accounts", lambda data: local.append(len(data["invalidate"])))
+        await bus.start()
+        peer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        peer.bind(str(directory / "peer.sock"))
+        try:
+            bus.publish("accounts", {"invalidate": list(range(100000))})
+            event = json.loads(peer.recv(EVENT_BUS_MAX_DATAGRAM))
+        finally:
+            peer.close()
+            await bus.stop()
+        return local, event, bus.stats()
+
+    local, event, stats = asyncio.run(run())
+    assert local == [100000]  # Lokalni subskrybenci dostają pełne zdarzenie
+    assert event == {"channel": "accounts", "origin": event["origin"], "seq": 1}
+    assert stats["dropped"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+import multiprocessing
+import os
+import time
+
+from utils.event_bus import EVENT_BUS_PEER_REFRESH, EventBus
+
+WORKERS = 4
+
+
+def _worker(directory: str, workers: int, barrier, results):
+    async def run():
+        bus = EventBus(directory)
+        received = []
+        bus.subscribe("test", lambda data: received.append(data["from"]))
+        await bus.start()
+        barrier.wait()
+        await asyncio.sleep(EVENT_BUS_PEER_REFRESH + 0.1)  # Wszystkie gniazda już istnieją
+        bus.publish("test", {"from": os.getpid()})
+        deadline = time.monotonic() + 5
+        while len(received) < workers and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        barrier.wait()
+        await bus.stop()
+        results.put((os.getpid(), sorted(received)))
+
+    asyncio.run(run())
+
+
+def test_every_worker_receives_every_event(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(WORKERS)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(str(tmp_path / "bus"), WORKERS, barrier, results))
+        for _ in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=10)
+        assert process.exitcode == 0
+
+    pids = sorted(pid for pid, _ in collected)
+    assert pids == sorted(process.pid for process in processes)
+    for pid, received in collected:
+        assert received == pids, f"worker {pid} received {received}"
+
+
+def test_channels_are_isolated(tmp_path):
+    async def run():
+        bus = EventBus(str(tmp_path / "bus"))
+        seen = []
+        bus.subscribe("a", lambda data: seen.append(("a", data["n"])))
+        bus.subscribe("b", lambda data: seen.append(("b", data["n"])))
+        await bus.start()
+        try:
+            bus.publish("a", {"n": 1})
+            bus.publish("b", {"n": 2})
+            await asyncio.sleep(0.1)
+        finally:
+            await bus.stop()
+        return seen
+
+    assert sorted(asyncio.run(run())) == [("a", 1), ("b", 2)]
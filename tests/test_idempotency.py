@@ -0,0 +1,52 @@
+def test_replay_returns_stored_response_and_applies_once(bank_user):
+    account = bank_user.open_account(100)
+    key = {"Idempotency-Key": "deposit-1"}
+
+    first = bank_user.post(f"/accounts/{account}/deposit", params={"amount": 50}, headers=key)
+    second = bank_user.post(f"/accounts/{account}/deposit", params={"amount": 50}, headers=key)
+
+    assert first["status"] == "success"
+    assert second == first
+    assert bank_user.balance(account) == 150
+
+
+def test_replayed_transfer_moves_money_once(bank_user):
+    source, target = bank_user.open_account(100), bank_user.open_account(0)
+    params = {"from_account_id": source, "to_account_id": target, "amount": 30}
+    key = {"Idempotency-Key": "transfer-1"}
+
+    responses = [bank_user.post("/accounts/transfer", params=params, headers=key) for _ in range(3)]
+
+    assert responses[0]["status"] == "success"
+    assert responses[1:] == [responses[0]] * 2
+    assert (bank_user.balance(source), bank_user.balance(target)) == (70, 30)
+
+
+def test_same_key_with_different_parameters_is_rejected(bank_user):
+    account = bank_user.open_account(100)
+    key = {"Idempotency-Key": "withdraw-1"}
+
+    assert bank_user.post(f"/accounts/{account}/withdraw", params={"amount": 10}, headers=key)["status"] == "success"
+    conflict = bank_user.post(f"/accounts/{account}/withdraw", params={"amount": 20}, headers=key)
+
+    assert conflict["status"] == "error"
+    assert conflict["code"] == 422
+    assert bank_user.balance(account) == 90
+
+
+def test_keys_are_scoped_per_user(bank_user, make_user):
+    other = make_user()
+    first, second = bank_user.open_account(0), other.open_account(0)
+    key = {"Idempotency-Key": "shared-key"}
+
+    assert bank_user.post(f"/accounts/{first}/deposit", params={"amount": 5}, headers=key)["status"] == "success"
+    assert other.post(f"/accounts/{second}/deposit", params={"amount": 7}, headers=key)["status"] == "success"
+    assert (bank_user.balance(first), other.balance(second)) == (5, 7)
+
+
+def test_requests_without_key_are_not_deduplicated(bank_user):
+    account = bank_user.open_account(0)
+
+    for _ in range(2):
+        assert bank_user.post(f"/accounts/{account}/deposit", params={"amount": 10})["status"] == "success"
+    assert bank_user.balance(account) == 20
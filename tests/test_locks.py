@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from database.locks import AccountLockManager, LockTimeout
+
+
+def test_stripes_are_sorted_and_deduplicated():
+    locks = AccountLockManager(stripes=8)
+    assert locks.stripes_for([13, 2, 5, 10, 2]) == [2, 5]
+
+
+def test_uncontended_acquisition_is_not_counted_as_contended():
+    async def scenario():
+        locks = AccountLockManager(stripes=8)
+        async with locks.hold([1, 2]):
+            pass
+        return locks.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["acquisitions"], stats["contended"], stats["waiting"], stats["held"]) == (1, 0, 0, 0)
+
+
+def test_timeout_releases_partially_acquired_locks():
+    async def scenario():
+        locks = AccountLockManager(stripes=8)
+        async with locks.hold([2]):
+            with pytest.raises(LockTimeout):
+                async with locks.hold([1, 2], timeout=0.05):
+                    pass
+            assert not locks._locks[1].locked()  # Pasek 1 zwolniony po przekroczeniu czasu
+        async with locks.hold([1, 2], timeout=0.05):
+            pass
+        return locks.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["timeouts"], stats["acquisitions"], stats["waiting"]) == (1, 2, 0)
+
+
+def test_waiters_are_served_in_arrival_order():
+    async def scenario():
+        locks = AccountLockManager(stripes=8)
+        order = []
+
+        async def worker(number):
+            async with locks.hold([3]):
+                order.append(number)
+                await asyncio.sleep(0)
+
+        async with locks.hold([3]):
+            tasks = [asyncio.create_task(worker(number)) for number in range(5)]
+            await asyncio.sleep(0.01)
+            assert locks.stats()["waiting"] == 5
+        await asyncio.gather(*tasks)
+        return order, locks.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == [0, 1, 2, 3, 4]
+    assert (stats["acquisitions"], stats["contended"]) == (6, 5)
+
+
+def test_opposite_account_order_does_not_deadlock():
+    async def scenario():
+        locks = AccountLockManager(stripes=8, timeout=1.0)
+        balances = {1: 0, 2: 0}
+
+        async def transfer(source, target):
+            for _ in range(50):
+                async with locks.hold([source, target]):
+                    balances[source] -= 1
+                    await asyncio.sleep(0)
+                    balances[target] += 1
+
+        await asyncio.gather(*(transfer(1, 2) if i % 2 else transfer(2, 1) for i in range(8)))
+        return balances, locks.stats()
+
+    balances, stats = asyncio.run(scenario())
+    assert balances == {1: 0, 2: 0}
+    assert (stats["acquisitions"], stats["timeouts"], stats["held"]) == (400, 0, 0)
@@ -0,0 +1,57 @@
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from utils.metrics import Metric, MetricsMiddleware, Registry
+
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        Metric("x", "abstract metric")
+
+
+def _route_counts(registry: Registry) -> dict:
+    counts = {}
+    for line in registry.render().splitlines():
+        if line.startswith("http_request_duration_seconds_count"):
+            labels, value = line.rsplit(" ", 1)
+            route = labels.split('route="', 1)[1].split('"', 1)[0]
+            counts[route] = counts.get(route, 0) + int(float(value))
+    return counts
+
+
+def test_route_label_includes_router_prefixes_and_mounts():
+    router = APIRouter()
+
+    @router.get("/{account_id}/balance")
+    def balance(account_id: int):
+        return {}
+
+    @router.get("/files/{name:path}")
+    def files(name: str):
+        return {}
+
+    outer = APIRouter()
+    outer.include_router(router, prefix="/inner")
+    sub = FastAPI()
+    sub.include_router(router, prefix="/x")
+
+    app = FastAPI()
+    app.include_router(router, prefix="/accounts")
+    app.include_router(outer, prefix="/v1")
+    app.mount("/sub", sub)
+    registry = Registry()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    client = TestClient(app)
+    for url in ("/accounts/5/balance", "/accounts/6/balance", "/v1/inner/7/balance",
+                "/sub/x/9/balance", "/accounts/files/a/b/c", "/missing"):
+        client.get(url)
+
+    assert _route_counts(registry) == {
+        "/accounts/{account_id}/balance": 2,
+        "/v1/inner/{account_id}/balance": 1,
+        "/sub/x/{account_id}/balance": 1,
+        "/accounts/files/{name:path}": 1,
+        "unmatched": 1,
+    }
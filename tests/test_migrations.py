@@ -0,0 +1,59 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+from database import models
+from database.migrations import backfill_log_ledger, parse_ledger
+from utils.security import encrypt_data
+
+# Każdy format opisu zapisany kiedykolwiek przez log_operation
+LEDGER_CASES = [
+    ("Deposited 100", (100, None, "in")),
+    ("Withdrew 40", (40, None, "out")),
+    ("Transferred 25 to account 7", (25, 7, "out")),
+    ("Transferred 25 to account 7 (pending 3)", (25, 7, "out")),
+    ("Transferred 25 to account 7 (recurring 4)", (25, 7, "out")),
+    ("Received 25 from account 2", (25, 2, "in")),
+    ("Received 25 from account 2 (pending 3)", (25, 2, "in")),
+    ("Received 25 from account 2 (recurring 4)", (25, 2, "in")),
+    ("Pending transfer of 60 to account 9", (60, 9, None)),
+    ("Pending transfer 12 of 60 to account 9", (60, 9, None)),
+    ("Pending transfer 12 of 60 to account 9 rejected", (60, 9, None)),
+    ("Recurring transfer of 15 to account 8 with frequency monthly", (15, 8, None)),
+    ("Recurring transfer 5 of 15 to account 8 failed", (15, 8, None)),
+]
+
+
+@pytest.mark.parametrize("details, expected", LEDGER_CASES)
+def test_parse_ledger_legacy_formats(details, expected):
+    assert parse_ledger(details) == expected
+
+
+@pytest.mark.parametrize("details", ["", "Account created", "Transferred to account 7"])
+def test_parse_ledger_without_amount(details):
+    assert parse_ledger(details) is None
+
+
+def test_backfill_fills_ledger_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'ledger.db')}")
+    models.Base.metadata.create_all(engine)
+    logs = [details for details, _ in LEDGER_CASES] + ["Account created"]
+    with engine.begin() as connection:
+        connection.execute(insert(models.Log), [
+            {"account_id": 1, "operation": "test", "details": encrypt_data(details)} for details in logs
+        ] + [{"account_id": 1, "operation": "test", "details": "not-a-token"}])
+
+    stats = backfill_log_ledger(engine, chunk_size=4)
+    assert (stats["updated"], stats["unparsed"], stats["undecryptable"]) == (len(LEDGER_CASES), 1, 1)
+
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(models.Log.amount, models.Log.counterparty_account_id, models.Log.direction)
+            .order_by(models.Log.id)
+        ).all()
+    assert [tuple(row) for row in rows[:len(LEDGER_CASES)]] == [expected for _, expected in LEDGER_CASES]
+
+    # Ponowne uruchomienie pomija uzupełnione logi
+    assert backfill_log_ledger(engine)["updated"] == 0
+    engine.dispose()
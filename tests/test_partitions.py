@@ -0,0 +1,49 @@
+import fcntl
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, func, insert, select
+
+from database import models
+from database.partitions import ARCHIVE_LOCK_FILE, LogPartitions, archive_logs
+
+NOW = datetime(2024, 6, 15, tzinfo=timezone.utc)
+
+
+def make_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'logs.db')}")
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.Log), [
+            {"account_id": 1, "operation": "test", "details": "x", "timestamp": datetime(2024, month, 10)}
+            for month in (1, 2, 6)
+        ])
+    return engine
+
+
+def test_archive_removes_unfinished_temporary_files(tmp_path):
+    engine, partitions = make_engine(tmp_path), LogPartitions(os.path.join(tmp_path, "archive"))
+    os.makedirs(partitions.directory)
+    stale = os.path.join(partitions.directory, "logs_2023_12.db.4242.tmp")
+    open(stale, "w").close()
+
+    stats = archive_logs(engine, partitions, retention_months=3, now=NOW)
+
+    assert not os.path.exists(stale)
+    assert (stats["months"], stats["archived"], stats["deleted"]) == (["2024-01", "2024-02"], 2, 2)
+    assert sorted(os.listdir(partitions.directory)) == [ARCHIVE_LOCK_FILE, "logs_2024_01.db", "logs_2024_02.db"]
+    engine.dispose()
+
+
+def test_archive_is_skipped_while_another_process_holds_the_lock(tmp_path):
+    engine, partitions = make_engine(tmp_path), LogPartitions(os.path.join(tmp_path, "archive"))
+    os.makedirs(partitions.directory)
+
+    with open(os.path.join(partitions.directory, ARCHIVE_LOCK_FILE), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        stats = archive_logs(engine, partitions, retention_months=3, now=NOW)
+
+    assert stats["skipped"] and stats["archived"] == 0
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count(models.Log.id))).scalar() == 3
+    engine.dispose()
@@ -0,0 +1,24 @@
+from database.locks import account_locks
+from database.settlement import settler
+
+
+def test_pending_transfer_lifecycle_goes_through_account_locks(client, bank_user):
+    source, target = bank_user.open_account(100), bank_user.open_account(0)
+    before = account_locks.stats()["acquisitions"]
+
+    approved = bank_user.post("/accounts/transfer/pending",
+                              params={"from_account_id": source, "to_account_id": target, "amount": 30})
+    rejected = bank_user.post("/accounts/transfer/pending",
+                              params={"from_account_id": source, "to_account_id": target, "amount": 20})
+    assert (approved["data"]["available"], rejected["data"]["available"]) == (70, 50)
+
+    reject = bank_user.post("/accounts/transfer/pending/reject", json={"ids": [rejected["data"]["pending_transfer_id"]]})
+    approve = bank_user.post("/accounts/transfer/pending/approve", json={"ids": [approved["data"]["pending_transfer_id"]]})
+    assert (reject["data"]["decided"], approve["data"]["decided"]) == (1, 1)
+
+    assert client.portal.call(settler.settle_batch) == 1
+    assert (bank_user.balance(source), bank_user.balance(target)) == (70, 30)
+
+    stats = account_locks.stats()
+    assert stats["acquisitions"] - before == 5  # Dwa utworzenia, dwie decyzje, rozliczenie
+    assert stats["held"] == 0
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from datetime import datetime
+
+from database.locks import account_locks
+from database.recurring import RecurringScheduler, advance, recurring_scheduler
+from utils.metrics import background_errors
+
+
+def test_monthly_schedule_returns_to_anchor_day():
+    moment = datetime(2025, 1, 31, 9, 0)
+    february = advance(moment, "monthly", 31)
+    assert february == datetime(2025, 2, 28, 9, 0)
+    assert advance(february, "monthly", 31) == datetime(2025, 3, 31, 9, 0)
+
+
+def test_due_orders_are_retried_after_a_failed_execution(monkeypatch):
+    scheduler = RecurringScheduler()
+    calls = []
+
+    async def execute(recurring_ids):
+        calls.append(sorted(recurring_ids))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(scheduler, "_execute", execute)
+    errors = background_errors.labels("recurring_scheduler")
+    errors_before = errors.value
+
+    async def run():
+        scheduler._loaded_until = time.time() + 3600  # Okno już wczytane: bez dostępu do bazy
+        scheduler._push(1, time.time() - 60)
+        scheduler._push(2, time.time() - 30)
+        scheduler.start()
+        deadline = time.monotonic() + 5
+        while len(calls) < 2 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert calls == [[1, 2], [1, 2]]
+    assert errors.value == errors_before + 1
+    assert scheduler.stats()["scheduled"] == 0
+
+
+def test_due_order_runs_once_under_account_locks(client, bank_user):
+    source, target = bank_user.open_account(100), bank_user.open_account(0)
+    created = bank_user.post("/accounts/transfer/recurring", params={
+        "from_account_id": source, "to_account_id": target, "amount": 25, "frequency": "monthly"
+    })
+    recurring_id = created["data"]["recurring_transfer_id"]
+    before = account_locks.stats()["acquisitions"]
+
+    client.portal.call(recurring_scheduler._execute, [recurring_id])
+    client.portal.call(recurring_scheduler._execute, [recurring_id])  # Termin już przesunięty: bez wykonania
+
+    assert (bank_user.balance(source), bank_user.balance(target)) == (75, 25)
+    assert account_locks.stats()["acquisitions"] - before == 2
@@ -0,0 +1,78 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database.unit_of_work import GroupCommitter
+
+metadata = MetaData()
+items = Table("items", metadata, Column("id", Integer, primary_key=True), Column("value", Integer))
+
+
+def run_scenario(tmp_path, scenario, **options):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp_path, 'uow.db')}")
+        async with engine.begin() as connection:
+            await connection.run_sync(metadata.create_all)
+        committer = GroupCommitter(async_sessionmaker(engine, expire_on_commit=False), **options)
+        try:
+            results = await scenario(committer)
+            async with engine.connect() as connection:
+                values = sorted((await connection.execute(select(items.c.value))).scalars())
+        finally:
+            await engine.dispose()
+        return results, values, committer.stats()
+
+    return asyncio.run(main())
+
+
+def insert_value(value):
+    async def work(db):
+        if value < 0:
+            raise ValueError(f"invalid value {value}")
+        await db.execute(insert(items).values(value=value))
+        return value
+    return work
+
+
+def test_concurrent_operations_share_one_commit(tmp_path):
+    async def scenario(committer):
+        return await asyncio.gather(*(committer.run(insert_value(i)) for i in range(20)))
+
+    results, values, stats = run_scenario(tmp_path, scenario, window=0.05)
+    assert results == list(range(20))
+    assert values == list(range(20))
+    assert (stats["operations"], stats["commits"], stats["retries"]) == (20, 1, 0)
+
+
+def test_batch_size_is_limited(tmp_path):
+    async def scenario(committer):
+        return await asyncio.gather(*(committer.run(insert_value(i)) for i in range(10)))
+
+    _, values, stats = run_scenario(tmp_path, scenario, window=0.05, max_batch=4)
+    assert values == list(range(10))
+    assert (stats["operations"], stats["commits"]) == (10, 3)
+
+
+def test_failing_operation_is_retried_alone_and_others_commit(tmp_path):
+    async def scenario(committer):
+        return await asyncio.gather(*(committer.run(insert_value(value)) for value in (1, 2, -3, 4, 5)),
+                                    return_exceptions=True)
+
+    results, values, stats = run_scenario(tmp_path, scenario, window=0.05)
+    assert results[:2] + results[3:] == [1, 2, 4, 5]
+    assert isinstance(results[2], ValueError)
+    assert values == [1, 2, 4, 5]  # Zmiany z wycofanej partii nie zostały zatwierdzone dwukrotnie
+    assert (stats["operations"], stats["commits"], stats["retries"]) == (4, 4, 1)
+
+
+def test_committer_keeps_working_after_a_failure(tmp_path):
+    async def scenario(committer):
+        with pytest.raises(ValueError):
+            await committer.run(insert_value(-1))
+        return await committer.run(insert_value(7))
+
+    result, values, stats = run_scenario(tmp_path, scenario, window=0.0)
+    assert (result, values, stats["commits"]) == (7, [7], 1)
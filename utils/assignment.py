@@ -1,22 +1,169 @@
+import bisect
 import hashlib
+import math
+from decouple import config, Csv
+from typing import Dict, Iterable, Iterator, List, Optional
 
+# ---------------------------
 # Lista serwerów rozproszonych
-servers = [
-    "https://localhost:8443",
-    "https://localhost:8444",
-    "https://localhost:8445"
-]
+# ---------------------------
+# Wspólne źródło członkostwa dla load-balancera i przydziału użytkowników.
+# Format CLUSTER_SERVERS: "url[=waga],url[=waga],..."
+CLUSTER_SERVERS = config(
+    "CLUSTER_SERVERS",
+    default="https://localhost:8001,https://localhost:8002,https://localhost:8003",
+    cast=Csv()
+)
+
+# Liczba wirtualnych węzłów na jednostkę wagi serwera
+VIRTUAL_NODES = config("VIRTUAL_NODES", default=160, cast=int)
+
+
+def parse_servers(entries: Iterable[str]) -> List[dict]:
+    """
+    Zamienia wpisy "url[=waga]" na listę słowników z adresem i wagą serwera.
+    Zgłasza ValueError dla wagi mniejszej niż 1 (serwer bez pozycji na pierścieniu).
+    """
+    parsed = []
+    for entry in entries:
+        url, _, weight = entry.partition("=")
+        weight = int(weight) if weight else 1
+        if weight < 1:
+            raise ValueError(f"Server weight must be at least 1: {entry!r}")
+        parsed.append({"url": url.rstrip("/"), "weight": weight})
+    return parsed
+
+
+servers = parse_servers(CLUSTER_SERVERS)
+
+
+def hash_key(key: str) -> int:
+    """
+    Zwraca 64-bitową pozycję klucza na pierścieniu.
+    """
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+# ---------------------------
+# Pierścień spójnego haszowania
+# ---------------------------
+class HashRing:
+    """
+    Pierścień spójnego haszowania z ważonymi węzłami wirtualnymi.
+
+    Pozycje są przechowywane w posortowanej liście, a dla każdej pozycji
+    wyliczana jest z góry kolejność kolejnych (różnych) serwerów na pierścieniu,
+    więc wyszukiwanie to jedno `bisect` również przy przełączaniu awaryjnym.
+    """
+
+    def __init__(self, nodes: Dict[str, int], vnodes: int = VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.nodes: Dict[str, int] = dict(nodes)
+        self._build()
+
+    def _build(self):
+        points = []
+        for url, weight in self.nodes.items():
+            for i in range(self.vnodes * weight):
+                points.append((hash_key(f"{url}#{i}"), url))
+        points.sort()
+
+        self._keys = [point for point, _ in points]
+        owners = [url for _, url in points]
+
+        # Kolejność różnych serwerów zgodnie z ruchem wskazówek zegara od każdej pozycji
+        # (liczone są tylko serwery, które mają pozycje na pierścieniu)
+        self._successors: List[tuple] = [()] * len(owners)
+        node_count = len(set(owners))
+        for i in range(len(owners)):
+            order, seen = [], set()
+            j = i
+            while len(seen) < node_count:
+                if owners[j] not in seen:
+                    seen.add(owners[j])
+                    order.append(owners[j])
+                j = (j + 1) % len(owners)
+            self._successors[i] = tuple(order)
+
+    def add_node(self, url: str, weight: int = 1):
+        """
+        Dodaje serwer do pierścienia.
+        """
+        self.nodes[url] = weight
+        self._build()
+
+    def remove_node(self, url: str):
+        """
+        Usuwa serwer z pierścienia.
+        """
+        self.nodes.pop(url, None)
+        self._build()
+
+    def _index(self, key: str) -> int:
+        index = bisect.bisect(self._keys, hash_key(key))
+        return index if index < len(self._keys) else 0
+
+    def get_node(self, key: str) -> Optional[str]:
+        """
+        Zwraca serwer, do którego należy klucz.
+        """
+        if not self._keys:
+            return None
+        return self._successors[self._index(key)][0]
+
+    def iter_nodes(self, key: str) -> Iterator[str]:
+        """
+        Zwraca kolejne różne serwery na pierścieniu, zaczynając od właściciela klucza.
+        """
+        if not self._keys:
+            return iter(())
+        return iter(self._successors[self._index(key)])
+
+    def get_healthy_node(self, key: str, healthy: Iterable[str]) -> Optional[str]:
+        """
+        Zwraca pierwszy zdrowy serwer, zaczynając od właściciela klucza (deterministyczny failover).
+        """
+        healthy = set(healthy)
+        for url in self.iter_nodes(key):
+            if url in healthy:
+                return url
+        return None
+
+    def get_bounded_node(self, key: str, loads: Dict[str, int], load_factor: float) -> Optional[str]:
+        """
+        Spójne haszowanie z ograniczonym obciążeniem: zwraca pierwszy serwer
+        (od właściciela klucza), którego obciążenie jest poniżej
+        ceil(load_factor * średnie obciążenie) z uwzględnieniem wag.
+        `loads` zawiera liczbę żądań w toku dla dostępnych serwerów.
+        """
+        if not loads:
+            return None
+        total_weight = sum(self.nodes.get(url, 1) for url in loads)
+        total_load = sum(loads.values()) + 1  # Z uwzględnieniem przydzielanego żądania
+        for url in self.iter_nodes(key):
+            if url not in loads:
+                continue
+            capacity = math.ceil(load_factor * total_load * self.nodes.get(url, 1) / total_weight)
+            if loads[url] < capacity:
+                return url
+        return None
+
+
+ring = HashRing({server["url"]: server["weight"] for server in servers})
+
 
 def hash_user(username: str) -> int:
     """
-    Hashuje nazwę użytkownika i zwraca indeks serwera.
+    Hashuje nazwę użytkownika i zwraca jego pozycję na pierścieniu.
     """
-    hash_value = int(hashlib.md5(username.encode()).hexdigest(), 16)
-    return hash_value % len(servers)
+    return hash_key(username)
+
 
-def assign_server(username: str) -> str:
+def assign_server(username: str, healthy_servers: Optional[Iterable[str]] = None) -> Optional[str]:
     """
-    Przydziela użytkownika do serwera na podstawie funkcji hashującej.
+    Przydziela użytkownika do serwera na podstawie pierścienia spójnego haszowania.
+    Jeśli podano listę zdrowych serwerów, zwraca pierwszy zdrowy następnik.
     """
-    server_index = hash_user(username)
-    return servers[server_index]
+    if healthy_servers is None:
+        return ring.get_node(username)
+    return ring.get_healthy_node(username, healthy_servers)
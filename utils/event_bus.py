@@ -0,0 +1,203 @@
+"""
+Lokalna szyna zdarzeń między workerami (pub/sub na gniazdach Unix).
+
+Każdy worker wiąże własne gniazdo datagramowe w katalogu EVENT_BUS_DIR,
+a publikacja wysyła zdarzenie do wszystkich gniazd z tego katalogu i od razu
+dostarcza je lokalnym subskrybentom. Nie ma osobnego brokera: gniazda
+martwych workerów są usuwane przy pierwszej nieudanej wysyłce.
+
+Dostarczenie nie jest gwarantowane (pełny bufor odbiorcy). Zdarzenia mają
+numery kolejne w ramach kanału, więc odbiorca wykrywa lukę, a także
+zdarzenie zbyt duże na jeden datagram lub uszkodzone, i wywołuje funkcje
+zarejestrowane przez `on_loss` (np. czyszczące cały cache).
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from decouple import config
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.metrics import background_errors
+
+EVENT_BUS_DIR = config("EVENT_BUS_DIR", default=os.path.join(tempfile.gettempdir(), "bankapp-bus"))
+EVENT_BUS_PEER_REFRESH = 1.0  # Co ile sekund odświeżać listę gniazd workerów
+EVENT_BUS_MAX_DATAGRAM = 65536
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """
+    Szyna zdarzeń publish/subscribe łącząca workery działające na jednym hoście.
+    """
+
+    def __init__(self, directory: str = EVENT_BUS_DIR):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._socket: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self._loss_handlers: Dict[str, List[Callable[[], None]]] = defaultdict(list)
+        self._sequence: Dict[str, int] = defaultdict(int)  # Numer ostatniego zdarzenia wysłanego na kanał
+        self._last_seen: Dict[Tuple[int, str], int] = {}  # (worker, kanał) -> numer ostatniego odebranego
+        self._peers: List[str] = []
+        self._peers_refreshed = 0.0
+        self._lock = threading.Lock()
+
+        # Statystyki
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.lost = 0
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None]):
+        """
+        Rejestruje funkcję wywoływaną (w wątku pętli zdarzeń) dla zdarzeń z kanału.
+        """
+        self._handlers[channel].append(handler)
+
+    def on_loss(self, channel: str, handler: Callable[[], None]):
+        """
+        Rejestruje funkcję wywoływaną, gdy zdarzenie z kanału mogło nie dotrzeć do tego workera.
+        """
+        self._loss_handlers[channel].append(handler)
+
+    async def start(self):
+        """
+        Wiąże gniazdo tego workera i zaczyna odbierać zdarzenia.
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)  # Tylko użytkownik serwera może publikować
+        self.path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.setblocking(False)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._socket.fileno(), self._on_readable)
+
+    async def stop(self):
+        if self._socket is not None:
+            self._loop.remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+        self._loop = None
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._socket.recv(EVENT_BUS_MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            try:
+                event = json.loads(data)
+                channel, origin, sequence = event["channel"], event["origin"], event["seq"]
+            except (ValueError, TypeError, KeyError):
+                # Uszkodzony lub obcięty datagram: kanał nieznany, więc utrata na wszystkich
+                self._lost(list(self._loss_handlers))
+                continue
+            self.received += 1
+            previous = self._last_seen.get((origin, channel))
+            self._last_seen[(origin, channel)] = sequence
+            if (previous is not None and sequence != previous + 1) or "data" not in event:
+                self._lost([channel])
+            if "data" in event:
+                self._dispatch(channel, event["data"])
+
+    def _lost(self, channels: List[str]):
+        self.lost += 1
+        for channel in channels:
+            for handler in self._loss_handlers.get(channel, []):
+                try:
+                    handler()
+                except Exception:
+                    background_errors.labels("event_bus").inc()
+                    logger.exception("Event bus loss handler for %s failed", channel)
+
+    def _dispatch(self, channel: str, data: dict):
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(data)
+            except Exception:
+                background_errors.labels("event_bus").inc()
+                logger.exception("Event bus handler for %s failed", channel)
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_refreshed > EVENT_BUS_PEER_REFRESH:
+            try:
+                entries = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".sock")]
+            except FileNotFoundError:
+                entries = []
+            self._peers = [path for path in entries if path != self.path]
+            self._peers_refreshed = now
+        return self._peers
+
+    def publish(self, channel: str, data: dict):
+        """
+        Publikuje zdarzenie: od razu dla lokalnych subskrybentów i przez gniazda
+        dla pozostałych workerów. Bezpieczne także z wątków puli.
+        """
+        self.published += 1
+
+        # Lokalni subskrybenci zawsze w wątku pętli zdarzeń
+        loop = self._loop
+        if loop is None:
+            self._dispatch(channel, data)
+        else:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                self._dispatch(channel, data)
+            else:
+                loop.call_soon_threadsafe(self._dispatch, channel, data)
+
+        if self._socket is None:
+            return
+
+        with self._lock:
+            self._sequence[channel] += 1
+            event = {"channel": channel, "origin": os.getpid(), "seq": self._sequence[channel]}
+            payload = json.dumps({**event, "data": data}).encode()
+            if len(payload) > EVENT_BUS_MAX_DATAGRAM:
+                # Zdarzenie nie zmieści się w datagramie: odbiorcy dostają tylko informację o utracie
+                self.dropped += 1
+                payload = json.dumps(event).encode()
+            for path in list(self._peer_paths()):
+                try:
+                    self._socket.sendto(payload, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker nie działa: usunięcie osieroconego gniazda
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                    self._peers.remove(path)
+                except (BlockingIOError, OSError):
+                    # Bufor odbiorcy pełny: zdarzenie dla tego workera jest tracone
+                    self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "workers": len(self._peers) + 1,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "lost": self.lost,
+        }
+
+
+event_bus = EventBus()
+
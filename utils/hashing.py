@@ -1,9 +1,134 @@
 from passlib.context import CryptContext
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from decouple import config
+from fastapi import HTTPException
+from typing import Optional, Tuple
+from utils.metrics import registry
+from utils.responses import error_response
+import asyncio
+import os
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+
+# Hasła z inną liczbą rund niż BCRYPT_ROUNDS są oznaczane do ponownego haszowania przy logowaniu
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# ---------------------------
+# Konfiguracja puli procesów bcrypt
+# ---------------------------
+HASH_WORKERS = config("HASH_WORKERS", default=min(4, os.cpu_count() or 1), cast=int)
+HASH_MAX_PENDING = config("HASH_MAX_PENDING", default=64, cast=int)  # Maks. liczba operacji w toku i w kolejce
+HASH_RETRY_AFTER = 1  # Sekundy (nagłówek Retry-After przy przeciążeniu)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+_queue_waits = deque(maxlen=10000)
+_rejected = 0
+
+# ---------------------------
+# Metryki
+# ---------------------------
+bcrypt_seconds = registry.histogram("bcrypt_duration_seconds", "bcrypt hash and verify time", ("operation",))
+bcrypt_queue_seconds = registry.histogram("bcrypt_queue_wait_seconds", "Time bcrypt operations wait for a worker")
+registry.gauge("bcrypt_pending", "bcrypt operations running or queued", function=lambda: _pending)
+registry.counter("bcrypt_rejected_total", "bcrypt operations rejected (pool busy)", function=lambda: _rejected)
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    with bcrypt_seconds.labels("hash").time():
+        return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with bcrypt_seconds.labels("verify").time():
+        return pwd_context.verify(plain_password, hashed_password)
+
+# ---------------------------
+# Funkcje wykonywane w procesach puli
+# ---------------------------
+# Zwracają (czas rozpoczęcia, czas trwania, wynik)
+def _timed_hash(password: str) -> Tuple[float, float, str]:
+    started_at, started = time.time(), time.perf_counter()
+    result = pwd_context.hash(password)
+    return started_at, time.perf_counter() - started, result
+
+def _timed_verify_and_update(plain_password: str, hashed_password: str) -> Tuple[float, float, Tuple[bool, Optional[str]]]:
+    started_at, started = time.time(), time.perf_counter()
+    result = pwd_context.verify_and_update(plain_password, hashed_password)
+    return started_at, time.perf_counter() - started, result
+
+# ---------------------------
+# Asynchroniczne haszowanie z kontrolą dopuszczenia
+# ---------------------------
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+async def _submit(operation: str, function, *args):
+    """
+    Uruchamia funkcję w puli procesów bcrypt. Gdy kolejka jest pełna,
+    od razu zwraca 503 zamiast blokować wątki serwera.
+    """
+    global _pending, _rejected
+    if _pending >= HASH_MAX_PENDING:
+        _rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail=error_response("Authentication service busy, try again later", 503),
+            headers={"Retry-After": str(HASH_RETRY_AFTER)}
+        )
+
+    _pending += 1
+    submitted_at = time.time()
+    try:
+        started_at, duration, result = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), function, *args
+        )
+    finally:
+        _pending -= 1
+    queue_wait = max(0.0, started_at - submitted_at)
+    _queue_waits.append(queue_wait)
+    bcrypt_queue_seconds.observe(queue_wait)
+    bcrypt_seconds.labels(operation).observe(duration)
+    return result
+
+async def hash_password_async(password: str) -> str:
+    """
+    Haszuje hasło w puli procesów bcrypt.
+    """
+    return await _submit("hash", _timed_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Weryfikuje hasło w puli procesów bcrypt.
+    Zwraca (poprawne, nowy_hash), gdzie nowy_hash jest ustawiony, jeśli hasło wymaga ponownego haszowania.
+    """
+    return await _submit("verify", _timed_verify_and_update, plain_password, hashed_password)
+
+def hashing_stats() -> dict:
+    """
+    Zwraca liczbę operacji w toku, odrzuconych oraz czas oczekiwania w kolejce (p50/p99).
+    """
+    waits = sorted(_queue_waits)
+
+    def percentile(p):
+        if not waits:
+            return 0.0
+        return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+    return {
+        "workers": HASH_WORKERS,
+        "pending": _pending,
+        "max_pending": HASH_MAX_PENDING,
+        "rejected": _rejected,
+        "queue_wait_p50_ms": round(percentile(0.50) * 1000, 3),
+        "queue_wait_p99_ms": round(percentile(0.99) * 1000, 3),
+    }
+
+def shutdown_hash_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
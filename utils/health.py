@@ -0,0 +1,280 @@
+import asyncio
+import random
+import time
+from collections import deque
+from decouple import config
+from typing import Callable, Dict, Iterable, List, Optional
+import httpx
+
+# ---------------------------
+# Konfiguracja sprawdzania stanu serwerów
+# ---------------------------
+HEALTH_CHECK_INTERVAL = config("HEALTH_CHECK_INTERVAL", default=2.0, cast=float)  # Odstęp między sprawdzeniami (s)
+HEALTH_CHECK_JITTER = config("HEALTH_CHECK_JITTER", default=0.2, cast=float)  # Losowe odchylenie odstępu (ułamek)
+HEALTH_CHECK_TIMEOUT = config("HEALTH_CHECK_TIMEOUT", default=1.0, cast=float)
+HEALTH_RISE = config("HEALTH_RISE", default=2, cast=int)  # Udanych sprawdzeń, by uznać serwer za zdrowy
+HEALTH_FALL = config("HEALTH_FALL", default=3, cast=int)  # Nieudanych sprawdzeń, by uznać serwer za niezdrowy
+
+# ---------------------------
+# Konfiguracja wyłącznika (circuit breaker)
+# ---------------------------
+BREAKER_FAILURES = config("BREAKER_FAILURES", default=5, cast=int)  # Kolejnych błędów żądań, które otwierają wyłącznik
+BREAKER_SLOW_SECONDS = config("BREAKER_SLOW_SECONDS", default=5.0, cast=float)  # Wolniejsza odpowiedź liczy się jako błąd
+BREAKER_OPEN_SECONDS = config("BREAKER_OPEN_SECONDS", default=10.0, cast=float)  # Czas do próby ponownego ruchu
+BREAKER_HALF_OPEN_REQUESTS = config("BREAKER_HALF_OPEN_REQUESTS", default=1, cast=int)  # Równoległe żądania próbne
+
+# ---------------------------
+# Konfiguracja limitów współbieżności
+# ---------------------------
+BACKEND_MAX_IN_FLIGHT = config("BACKEND_MAX_IN_FLIGHT", default=100, cast=int)  # Maks. liczba żądań w toku na serwer
+BACKEND_QUEUE_SIZE = config("BACKEND_QUEUE_SIZE", default=200, cast=int)  # Maks. liczba żądań czekających na serwer
+BACKEND_QUEUE_TIMEOUT = config("BACKEND_QUEUE_TIMEOUT", default=2.0, cast=float)  # Maks. czas oczekiwania w kolejce (s)
+
+FAILURE_STATUS_CODES = {502, 503, 504}  # Odpowiedzi serwera traktowane jak awaria węzła
+LATENCY_EWMA_ALPHA = 0.2
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class BackendBusy(Exception):
+    """
+    Serwer osiągnął limit żądań w toku, a kolejka jest pełna lub czas oczekiwania minął.
+    """
+
+
+class Backend:
+    """
+    Stan jednego serwera: wynik sprawdzeń z progami rise/fall oraz wyłącznik
+    sterowany błędami i opóźnieniem rzeczywistych żądań.
+
+    Serwer otrzymuje ruch, gdy jest zdrowy i wyłącznik nie jest otwarty.
+    Otwarty wyłącznik po BREAKER_OPEN_SECONDS przechodzi w stan półotwarty
+    i przepuszcza pojedyncze żądania próbne; HEALTH_RISE udanych zamyka go,
+    a błąd otwiera ponownie.
+    """
+
+    def __init__(self, url: str, weight: int = 1, max_in_flight: int = BACKEND_MAX_IN_FLIGHT,
+                 queue_size: int = BACKEND_QUEUE_SIZE, queue_timeout: float = BACKEND_QUEUE_TIMEOUT):
+        self.url = url
+        self.weight = weight
+        self.status = "healthy"
+        self.rise = 0
+        self.fall = 0
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        self.breaker = CLOSED
+        self.failures = 0
+        self.trial_successes = 0
+        self.trials_in_flight = 0
+        self.opened_at = 0.0
+        self.latency_ewma: Optional[float] = None
+
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self.rejected = 0
+
+    # ---------------------------
+    # Limit współbieżności z kolejką
+    # ---------------------------
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def load(self) -> int:
+        return self.in_flight + len(self._waiters)
+
+    async def acquire(self):
+        """
+        Zajmuje miejsce na żądanie do serwera. Gdy limit jest osiągnięty, czeka
+        w kolejce FIFO najwyżej `queue_timeout`; przy pełnej kolejce lub po
+        upływie czasu zgłasza BackendBusy.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise BackendBusy(self.url)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Miejsce przekazane w ostatniej chwili: zwrot
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise BackendBusy(self.url)
+            raise
+
+    def release(self):
+        """
+        Zwalnia miejsce; jest ono przekazywane bezpośrednio pierwszemu czekającemu.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # in_flight bez zmian: miejsce przechodzi na czekającego
+                return
+        self.in_flight -= 1
+
+    # ---------------------------
+    # Sprawdzenia aktywne
+    # ---------------------------
+    def record_probe(self, ok: bool, error: Optional[str] = None):
+        self.last_check = time.time()
+        if ok:
+            self.fall = 0
+            self.rise += 1
+            if self.status != "healthy" and self.rise >= HEALTH_RISE:
+                self.status = "healthy"
+        else:
+            self.last_error = error
+            self.rise = 0
+            self.fall += 1
+            if self.status == "healthy" and self.fall >= HEALTH_FALL:
+                self.status = "unhealthy"
+
+    # ---------------------------
+    # Wyłącznik (obserwacja ruchu)
+    # ---------------------------
+    def _open(self):
+        self.breaker = OPEN
+        self.opened_at = time.monotonic()
+        self.trial_successes = 0
+
+    def available(self) -> bool:
+        """
+        Czy serwer może teraz przyjąć żądanie (bez rezerwowania miejsca próbnego).
+        """
+        if self.status != "healthy":
+            return False
+        if self.breaker == OPEN and time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS:
+            self.breaker = HALF_OPEN
+            self.trials_in_flight = 0
+        if self.breaker == OPEN:
+            return False
+        if self.breaker == HALF_OPEN:
+            return self.trials_in_flight < BREAKER_HALF_OPEN_REQUESTS
+        return True
+
+    def begin(self) -> bool:
+        """
+        Rejestruje początek żądania; zwraca True, jeśli jest to żądanie próbne.
+        """
+        if self.breaker == HALF_OPEN:
+            self.trials_in_flight += 1
+            return True
+        return False
+
+    def abandon(self, trial: bool):
+        """
+        Żądanie przerwane bez wyniku (np. rozłączenie klienta) zwalnia miejsce próbne.
+        """
+        if trial:
+            self.trials_in_flight = max(0, self.trials_in_flight - 1)
+
+    def record_request(self, ok: bool, latency: float, trial: bool = False, error: Optional[str] = None):
+        self.abandon(trial)
+        self.latency_ewma = latency if self.latency_ewma is None else (
+            LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma
+        )
+        if ok and latency > BREAKER_SLOW_SECONDS:
+            ok, error = False, f"slow response ({latency:.2f} s)"
+
+        if ok:
+            self.failures = 0
+            if self.breaker == HALF_OPEN:
+                self.trial_successes += 1
+                if self.trial_successes >= HEALTH_RISE:
+                    self.breaker = CLOSED
+            return
+
+        self.last_error = error
+        self.failures += 1
+        if self.breaker == HALF_OPEN or (self.breaker == CLOSED and self.failures >= BREAKER_FAILURES):
+            self._open()
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "status": self.status,
+            "breaker": self.breaker,
+            "consecutive_failures": self.failures,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "rejected": self.rejected,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
+
+
+class HealthMonitor:
+    """
+    Równoległe, asynchroniczne sprawdzanie stanu serwerów.
+
+    Każdy serwer ma własną pętlę sprawdzeń z losowym przesunięciem, więc
+    wolny lub martwy serwer nie opóźnia sprawdzania pozostałych, a
+    sprawdzenia z wielu load-balancerów nie zbiegają się w czasie.
+    """
+
+    def __init__(self, servers: Iterable[dict], interval: float = HEALTH_CHECK_INTERVAL,
+                 jitter: float = HEALTH_CHECK_JITTER, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.backends: Dict[str, Backend] = {
+            server["url"]: Backend(server["url"], server.get("weight", 1)) for server in servers
+        }
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self._tasks: List[asyncio.Task] = []
+
+    def _delay(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def probe(self, backend: Backend, client: httpx.AsyncClient):
+        try:
+            response = await client.get("/health", timeout=self.timeout)
+            backend.record_probe(response.status_code == 200, f"health check returned {response.status_code}")
+        except Exception as e:
+            # Każdy błąd to nieudane sprawdzenie; wyjątek nie może zakończyć zadania _watch
+            backend.record_probe(False, f"{type(e).__name__}: {e}")
+
+    async def _watch(self, backend: Backend, get_client: Callable[[str], httpx.AsyncClient]):
+        await asyncio.sleep(random.uniform(0, self.interval))  # Rozłożenie startu sprawdzeń
+        while True:
+            await self.probe(backend, get_client(backend.url))
+            await asyncio.sleep(self._delay())
+
+    def start(self, get_client: Callable[[str], httpx.AsyncClient]):
+        """
+        Uruchamia pętle sprawdzeń (wymaga działającej pętli zdarzeń).
+        """
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._watch(backend, get_client)) for backend in self.backends.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def available_servers(self) -> List[str]:
+        return [url for url, backend in self.backends.items() if backend.available()]
+
+    def states(self) -> List[dict]:
+        return [backend.as_dict() for backend in self.backends.values()]
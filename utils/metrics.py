@@ -0,0 +1,328 @@
+"""
+Metryki w formacie tekstowym Prometheusa (bez zależności zewnętrznych).
+
+Liczniki i histogramy są aktualizowane w gorących ścieżkach, więc każda
+seria (kombinacja etykiet) ma własną, krótko trzymaną blokadę, a wartości
+wymagające zliczania (np. głębokość kolejek) są odczytywane dopiero przy
+pobraniu /metrics przez funkcje przekazane w `function`.
+
+Rejestr jest lokalny dla procesu: przy wielu workerach każdy udostępnia
+własne metryki.
+"""
+import abc
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# Przedziały histogramów (s): żądania HTTP oraz krótkie operacje (zapytania, szyfrowanie)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Wartość funkcji zbierającej: liczba albo {wartości etykiet: liczba}
+Sample = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ---------------------------
+# Typy metryk
+# ---------------------------
+class Metric(abc.ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], Sample]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.function = function
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """
+        Tworzy wartość jednej serii (kombinacji etykiet).
+        """
+
+    def labels(self, *values) -> object:
+        """
+        Zwraca serię dla podanych wartości etykiet (tworzoną przy pierwszym użyciu).
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(value) for value in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _series(self) -> Iterable[Tuple[Tuple[str, ...], object]]:
+        seen = set()
+        for values, child in list(self._children.items()):
+            if id(child) not in seen:
+                seen.add(id(child))
+                yield tuple(str(value) for value in values), child
+
+    def _collect_function(self) -> List[str]:
+        try:
+            sample = self.function()
+        except Exception:
+            return []
+        if not isinstance(sample, dict):
+            sample = {(): sample}
+        return [
+            f"{self.name}{_format_labels(self.label_names, values)} {_format_value(value)}"
+            for values, value in sample.items()
+        ]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        if self.function is not None:
+            return lines + self._collect_function()
+        for values, child in self._series():
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self, name: str, label_names: Sequence[str], values: Sequence[str]) -> List[str]:
+        return [f"{name}{_format_labels(label_names, values)} {_format_value(self.value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Ostatni: powyżej największego progu
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def render(self, name: str, label_names: Sequence[str], values: Sequence[str]) -> List[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(label_names, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(label_names, values)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(label_names, values)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: _HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+
+# ---------------------------
+# Rejestr metryk
+# ---------------------------
+class Registry:
+    """
+    Zbiór metryk procesu renderowany do formatu tekstowego Prometheusa.
+    Ponowna rejestracja tej samej nazwy zwraca istniejącą metrykę.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = (),
+                function: Optional[Callable[[], Sample]] = None) -> Counter:
+        return self._register(Counter(name, documentation, labels, function))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (),
+              function: Optional[Callable[[], Sample]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Błędy zadań w tle (pętle harmonogramu, rozliczania, archiwizacji, szyny zdarzeń)
+background_errors = registry.counter("background_task_errors_total", "Failures of background tasks", ("task",))
+
+
+# ---------------------------
+# Czas obsługi żądań HTTP
+# ---------------------------
+class MetricsMiddleware:
+    """
+    Middleware ASGI mierzące czas obsługi żądań HTTP (do wysłania całej odpowiedzi).
+
+    Etykietą jest szablon ścieżki (np. /accounts/{account_id}/balance), a nie
+    sama ścieżka, więc liczba serii nie rośnie z liczbą kont. Połączenia
+    WebSocket są przepuszczane bez pomiaru.
+    """
+
+    def __init__(self, app, registry: Registry = registry, prefix: str = "http"):
+        self.app = app
+        self.duration = registry.histogram(
+            f"{prefix}_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+        )
+        self.in_progress = registry.gauge(f"{prefix}_requests_in_progress", "HTTP requests being served")
+
+    def _route_template(self, scope) -> str:
+        """
+        Zwraca pełny szablon ścieżki dopasowanej trasy. `scope["route"].path` nie
+        zawiera ścieżki montowania sub-aplikacji (Mount), więc brakującym prefiksem
+        jest początek ścieżki żądania przed fragmentem dopasowanym przez trasę.
+        Gdy `route.path` zawiera już prefiks z `include_router`, ten początek
+        jest pusty (albo równy ścieżce montowania).
+        """
+        route = scope.get("route")
+        template = getattr(route, "path", None)
+        if template is None:
+            return "unmatched"
+        try:
+            matched = route.url_path_for(route.name, **scope.get("path_params", {}))
+        except Exception:
+            return template
+        path = scope["path"]
+        if not path.endswith(matched):
+            return template
+        return path[:len(path) - len(matched)] + template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        in_progress = self.in_progress.labels()
+        in_progress.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            self.duration.labels(
+                scope["method"], self._route_template(scope), status
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from decouple import config
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+from utils.event_bus import event_bus
+from utils.metrics import registry
+
+# Maks. liczba niewysłanych powiadomień na połączenie; przepełnienie rozłącza klienta
+NOTIFY_QUEUE_SIZE = config("NOTIFY_QUEUE_SIZE", default=256, cast=int)
+
+
+class Subscriber:
+    """
+    Połączenie klienta WebSocket z własną kolejką wysyłki i listą subskrybowanych kont.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.accounts: Set[int] = set()  # Bez subskrypcji klient nie otrzymuje żadnych zdarzeń
+        self.sender: Optional[asyncio.Task] = None
+
+    def wants(self, account_ids: Optional[Set[int]]) -> bool:
+        return account_ids is not None and not self.accounts.isdisjoint(account_ids)
+
+
+class ConnectionHub:
+    """
+    Rozsyłanie powiadomień do klientów WebSocket.
+
+    `publish` nie czeka na klientów: wiadomość trafia do ograniczonej kolejki
+    każdego zainteresowanego połączenia, a osobne zadanie na połączenie
+    wysyła ją dalej. Klient, którego kolejka się przepełni, jest rozłączany,
+    więc wolny odbiorca nie wstrzymuje pozostałych.
+
+    Klient (uwierzytelniony przez endpoint) wysyła {"subscribe": [id, ...]}
+    lub {"unsubscribe": [id, ...]}; subskrypcja obejmuje tylko konta, które
+    przepuści funkcja `authorize` (konta właściciela tokenu). Bez subskrypcji
+    klient nie otrzymuje żadnych zdarzeń.
+    """
+
+    def __init__(self, queue_size: int = NOTIFY_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[WebSocket, Subscriber] = {}
+        self.delivered = 0
+        self.dropped_slow = 0
+
+    async def _send_loop(self, subscriber: Subscriber):
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                await subscriber.websocket.send_text(message)
+                self.delivered += 1
+        except Exception:
+            # Zerwane połączenie: pętla odbierająca w serve() posprząta
+            self.subscribers.pop(subscriber.websocket, None)
+
+    @staticmethod
+    async def _handle_command(subscriber: Subscriber, data: str,
+                              authorize: Callable[[Set[int]], Awaitable[Set[int]]]):
+        try:
+            command = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(command, dict):
+            return
+        try:
+            requested = {int(account_id) for account_id in command.get("subscribe", [])}
+            removed = {int(account_id) for account_id in command.get("unsubscribe", [])}
+        except (TypeError, ValueError):
+            return
+        subscriber.accounts.difference_update(removed)
+        if requested:
+            allowed = await authorize(requested)
+            subscriber.accounts.update(allowed)
+            try:
+                subscriber.queue.put_nowait(json.dumps({
+                    "subscribed": sorted(allowed),
+                    "denied": sorted(requested - allowed),
+                }))
+            except asyncio.QueueFull:
+                pass
+
+    async def serve(self, websocket: WebSocket, authorize: Callable[[Set[int]], Awaitable[Set[int]]]):
+        """
+        Obsługuje połączenie klienta aż do jego rozłączenia.
+        `authorize` zwraca podzbiór kont, które klient może subskrybować.
+        """
+        await websocket.accept()
+        subscriber = Subscriber(websocket, self.queue_size)
+        subscriber.sender = asyncio.create_task(self._send_loop(subscriber))
+        self.subscribers[websocket] = subscriber
+        try:
+            while True:
+                await self._handle_command(subscriber, await websocket.receive_text(), authorize)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            self.subscribers.pop(websocket, None)
+            subscriber.sender.cancel()
+
+    def _drop(self, subscriber: Subscriber):
+        self.dropped_slow += 1
+        self.subscribers.pop(subscriber.websocket, None)
+        subscriber.sender.cancel()
+        asyncio.create_task(self._close(subscriber.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # "Try again later"
+        except Exception:
+            pass
+
+    def publish(self, message: str, account_ids: Optional[Iterable[int]] = None):
+        """
+        Kolejkuje wiadomość dla klientów subskrybujących którekolwiek z podanych kont.
+        Musi być wywoływane w wątku pętli zdarzeń.
+        """
+        account_ids = set(account_ids) if account_ids is not None else None
+        for subscriber in list(self.subscribers.values()):
+            if not subscriber.wants(account_ids):
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.subscribers),
+            "queued": sum(subscriber.queue.qsize() for subscriber in self.subscribers.values()),
+            "delivered": self.delivered,
+            "dropped_slow": self.dropped_slow,
+        }
+
+
+hub = ConnectionHub()
+
+registry.gauge("notification_queue_depth", "Notifications queued for WebSocket clients",
+               function=lambda: sum(subscriber.queue.qsize() for subscriber in hub.subscribers.values()))
+registry.counter("notifications_dropped_slow_total", "WebSocket clients disconnected for falling behind",
+                 function=lambda: hub.dropped_slow)
+
+
+# Powiadomienia z dowolnego workera trafiają do klientów połączonych z tym workerem
+event_bus.subscribe("notifications", lambda data: hub.publish(data["message"], data.get("account_ids")))
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from decouple import config, Csv
+from typing import List, Optional
+import websockets
+from utils.metrics import registry
+
+# ---------------------------
+# Konfiguracja replikacji między serwerami
+# ---------------------------
+PEER_SERVERS = config(
+    "PEER_SERVERS",
+    default="ws://localhost:8001/sync,ws://localhost:8002/sync,ws://localhost:8003/sync",
+    cast=Csv()
+)
+PEER_QUEUE_SIZE = config("PEER_QUEUE_SIZE", default=10000, cast=int)  # Maks. liczba wiadomości w kolejce na serwer
+PEER_BATCH_SIZE = config("PEER_BATCH_SIZE", default=200, cast=int)  # Maks. liczba wiadomości w jednej ramce
+PEER_FLUSH_INTERVAL = config("PEER_FLUSH_INTERVAL", default=0.05, cast=float)  # Maks. czas oczekiwania na zapełnienie ramki (s)
+PEER_RECONNECT_MIN = config("PEER_RECONNECT_MIN", default=0.5, cast=float)
+PEER_RECONNECT_MAX = config("PEER_RECONNECT_MAX", default=30.0, cast=float)
+
+# Identyfikator tego serwera w ramkach replikacji
+NODE_ID = config("NODE_ID", default=uuid.uuid4().hex[:12])
+
+
+# ---------------------------
+# Połączenie z pojedynczym serwerem
+# ---------------------------
+class PeerLink:
+    """
+    Trwałe połączenie WebSocket z jednym serwerem.
+
+    Wiadomości trafiają do ograniczonej kolejki (przy przepełnieniu odrzucane są
+    najstarsze), a pętla wysyłająca łączy je w ramki wysyłane po zebraniu
+    `batch_size` wiadomości lub po upływie `flush_interval`.
+    """
+
+    def __init__(self, url: str, queue_size: int = PEER_QUEUE_SIZE, batch_size: int = PEER_BATCH_SIZE,
+                 flush_interval: float = PEER_FLUSH_INTERVAL):
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = deque(maxlen=queue_size)  # Elementy: (czas dodania, wiadomość)
+        self.inflight: List[tuple] = []  # Ramka do ponownego wysłania po zerwaniu połączenia
+        self.wakeup = asyncio.Event()
+        self.connected = False
+        self.seq = 0
+
+        # Statystyki
+        self.sent_batches = 0
+        self.sent_messages = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+
+    def enqueue(self, message: dict):
+        """
+        Dodaje wiadomość do kolejki. Musi być wywoływane w wątku pętli zdarzeń.
+        """
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((time.monotonic(), message))
+        self.wakeup.set()
+
+    async def _next_batch(self) -> List[tuple]:
+        """
+        Czeka na wiadomości i zwraca ramkę zapełnioną rozmiarem lub czasem.
+        """
+        while not self.queue:
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(self.queue) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+        return [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+    async def _send(self, websocket, batch: List[tuple]):
+        self.seq += 1
+        frame = json.dumps({
+            "type": "batch",
+            "origin": NODE_ID,
+            "seq": self.seq,
+            "sent_at": time.time(),
+            "messages": [message for _, message in batch],
+        })
+        await websocket.send(frame)
+        self.sent_batches += 1
+        self.sent_messages += len(batch)
+
+    @staticmethod
+    async def _discard_incoming(websocket):
+        # Odczyt ewentualnych ramek od drugiej strony zapobiega zatrzymaniu nadawcy
+        async for _ in websocket:
+            pass
+
+    async def run(self):
+        """
+        Utrzymuje połączenie (z wykładniczym opóźnieniem ponownych prób) i wysyła ramki.
+        """
+        delay = PEER_RECONNECT_MIN
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    self.connected = True
+                    delay = PEER_RECONNECT_MIN
+                    reader = asyncio.create_task(self._discard_incoming(websocket))
+                    try:
+                        while True:
+                            if not self.inflight:
+                                self.inflight = await self._next_batch()
+                            await self._send(websocket, self.inflight)
+                            self.inflight = []
+                    finally:
+                        reader.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                self.connected = False
+
+            self.reconnects += 1
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, PEER_RECONNECT_MAX)
+
+    def metrics(self) -> dict:
+        """
+        Zwraca głębokość kolejki, opóźnienie najstarszej niewysłanej wiadomości i liczniki.
+        """
+        oldest = self.inflight[0][0] if self.inflight else (self.queue[0][0] if self.queue else None)
+        return {
+            "url": self.url,
+            "connected": self.connected,
+            "queue_depth": len(self.queue) + len(self.inflight),
+            "lag_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "sent_batches": self.sent_batches,
+            "sent_messages": self.sent_messages,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+
+# ---------------------------
+# Menedżer połączeń z serwerami
+# ---------------------------
+class PeerManager:
+    """
+    Zarządza trwałymi połączeniami ze wszystkimi serwerami i rozsyła do nich wiadomości.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.links = [PeerLink(url) for url in urls]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """
+        Uruchamia pętle wysyłające. Wywoływane przy starcie aplikacji.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(link.run()) for link in self.links]
+        for link in self.links:
+            link.wakeup.set()  # Wiadomości zebrane przed startem
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def _enqueue(self, message: dict):
+        for link in self.links:
+            link.enqueue(message)
+
+    def publish(self, message: dict):
+        """
+        Kolejkuje wiadomość do wszystkich serwerów bez blokowania.
+        Bezpieczne także z wątków puli (synchroniczne endpointy).
+        """
+        loop = self._loop
+        if loop is None:
+            self._enqueue(message)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._enqueue(message)
+        else:
+            loop.call_soon_threadsafe(self._enqueue, message)
+
+    def metrics(self) -> dict:
+        links = [link.metrics() for link in self.links]
+        return {
+            "node_id": NODE_ID,
+            "queue_depth": sum(link["queue_depth"] for link in links),
+            "max_lag_seconds": max((link["lag_seconds"] for link in links), default=0.0),
+            "peers": links,
+        }
+
+
+peer_manager = PeerManager(PEER_SERVERS)
+
+registry.gauge(
+    "peer_queue_depth", "Replication messages not yet sent to a peer", ("peer",),
+    function=lambda: {(link.url,): len(link.queue) + len(link.inflight) for link in peer_manager.links}
+)
+registry.gauge(
+    "peer_connected", "Whether the replication link to a peer is connected", ("peer",),
+    function=lambda: {(link.url,): int(link.connected) for link in peer_manager.links}
+)
+registry.counter(
+    "peer_dropped_messages_total", "Replication messages dropped on queue overflow", ("peer",),
+    function=lambda: {(link.url,): link.dropped for link in peer_manager.links}
+)
@@ -2,12 +2,19 @@ from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from decouple import config
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, WebSocket
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from database.database import get_db
+from database.database import SessionLocal, get_db
 from database.models import User
 from cryptography.fernet import Fernet
+from collections import OrderedDict
+from typing import Optional
+from utils.event_bus import event_bus
+from utils.metrics import FAST_BUCKETS, registry
 from utils.responses import success_response, error_response  # Import spójnych odpowiedzi
+import threading
+import time
 
 # Konfiguracja JWT
 SECRET_KEY = config("SECRET_KEY")  # Klucz wczytany z pliku .env
@@ -18,23 +25,35 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 ENCRYPTION_KEY = config("ENCRYPTION_KEY").encode()  # Klucz szyfrowania z pliku .env
 cipher = Fernet(ENCRYPTION_KEY)
 
+# Cache zweryfikowanych użytkowników (klucz: token)
+PRINCIPAL_CACHE_SIZE = config("PRINCIPAL_CACHE_SIZE", default=10000, cast=int)
+PRINCIPAL_CACHE_TTL = config("PRINCIPAL_CACHE_TTL", default=60, cast=int)  # Sekundy
+
 # OAuth2 konfiguracja
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 # ---------------------------
 # Szyfrowanie i deszyfrowanie danych
 # ---------------------------
+fernet_seconds = registry.histogram(
+    "fernet_duration_seconds", "Fernet encryption and decryption time", ("operation",), FAST_BUCKETS
+)
+_encrypt_seconds = fernet_seconds.labels("encrypt")
+_decrypt_seconds = fernet_seconds.labels("decrypt")
+
 def encrypt_data(data: str) -> str:
     """
     Szyfruje dane za pomocą AES.
     """
-    return cipher.encrypt(data.encode()).decode()
+    with _encrypt_seconds.time():
+        return cipher.encrypt(data.encode()).decode()
 
 def decrypt_data(data: str) -> str:
     """
     Deszyfruje dane zaszyfrowane za pomocą AES.
     """
-    return cipher.decrypt(data.encode()).decode()
+    with _decrypt_seconds.time():
+        return cipher.decrypt(data.encode()).decode()
 
 # ---------------------------
 # Tworzenie tokenu JWT
@@ -65,13 +84,85 @@ def verify_access_token(token: str):
     except JWTError:
         raise HTTPException(status_code=401, detail=error_response("Invalid or expired token", 401))
 
+# ---------------------------
+# Zweryfikowany użytkownik (principal)
+# ---------------------------
+class Principal:
+    """
+    Zweryfikowany użytkownik niezwiązany z sesją bazy danych.
+    PESEL jest odszyfrowywany dopiero przy pierwszym odczycie.
+    """
+
+    def __init__(self, id: int, username: str, full_name: str, encrypted_pesel: Optional[str], token: str):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.token = token
+        self._encrypted_pesel = encrypted_pesel
+        self._pesel = None
+
+    @property
+    def pesel(self) -> Optional[str]:
+        if self._pesel is None and self._encrypted_pesel:
+            self._pesel = decrypt_data(self._encrypted_pesel)
+        return self._pesel
+
+# ---------------------------
+# Cache zweryfikowanych użytkowników
+# ---------------------------
+class PrincipalCache:
+    """
+    Ograniczony cache LRU z czasem życia wpisów, kluczowany tokenem.
+    Wpis wygasa po PRINCIPAL_CACHE_TTL lub wraz z tokenem (co nastąpi wcześniej).
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: int = PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (wygaśnięcie, principal)
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, principal: Principal, token_expires_at: float):
+        with self._lock:
+            self._entries[principal.token] = (min(time.time() + self.ttl, token_expires_at), principal)
+            self._entries.move_to_end(principal.token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: Optional[str]):
+        with self._lock:
+            self._entries.pop(token, None)
+
+principal_cache = PrincipalCache()
+
+# Wylogowanie w jednym workerze usuwa token z cache wszystkich workerów
+event_bus.subscribe("auth", lambda data: principal_cache.invalidate(data.get("token")))
+
 # ---------------------------
 # Pobieranie obecnie zalogowanego użytkownika
 # ---------------------------
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
     """
     Pobiera obecnie zalogowanego użytkownika na podstawie tokenu JWT.
+    Zweryfikowany użytkownik jest zapamiętywany w cache, więc kolejne żądania
+    z tym samym tokenem nie dekodują JWT ani nie odpytują bazy.
     """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     payload = verify_access_token(token)
     username = payload.get("sub")
     if not username:
@@ -83,26 +174,59 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     if user.active_token != token:
         raise HTTPException(status_code=401, detail=error_response("Token not associated with user", 401))
 
-    # Odszyfrowanie PESEL
-    if user.pesel:
-        encrypted_pesel = str(user.pesel)  # Jawne pobranie wartości jako str
-        decrypted_pesel = decrypt_data(encrypted_pesel)
-        user.pesel = decrypted_pesel  # Nadpisanie odszyfrowaną wartością
+    principal = Principal(user.id, user.username, user.full_name, user.pesel, token)
+    principal_cache.put(principal, payload["exp"])
+    return principal
+
+# ---------------------------
+# Uwierzytelnianie połączeń WebSocket
+# ---------------------------
+def _websocket_principal(token: str) -> Optional[Principal]:
+    db = SessionLocal()
+    try:
+        return get_current_user(token, db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
 
-    return user
+async def get_websocket_user(websocket: WebSocket) -> Optional[Principal]:
+    """
+    Uwierzytelnia połączenie WebSocket tym samym tokenem co `get_current_user`
+    (nagłówek `Authorization: Bearer ...` albo parametr `token`).
+    Zwraca None dla brakującego lub nieważnego tokenu.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = websocket.query_params.get("token")
+    if not token:
+        return None
+    return await run_in_threadpool(_websocket_principal, token)
 
 # ---------------------------
 # Unieważnianie aktywnego tokenu
 # ---------------------------
-def invalidate_user_token(user: User, db: Session):
+def invalidate_user_token(user: Principal, db: Session):
     """
-    Unieważnia aktywny token użytkownika (wylogowanie).
+    Unieważnia aktywny token użytkownika (wylogowanie) i usuwa go z cache.
     """
-    user.active_token = None
+    db.query(User).filter(User.id == user.id).update({User.active_token: None})
     db.commit()
-    db.refresh(user)
+    principal_cache.invalidate(user.token)
+    event_bus.publish("auth", {"token": user.token})
     return success_response({}, "User logged out successfully")
 
-
-
-
+# ---------------------------
+# Wymiana aktywnego tokenu
+# ---------------------------
+def replace_user_token(user: Principal, db: Session) -> str:
+    """
+    Zapisuje nowy aktywny token użytkownika i usuwa poprzedni z cache.
+    """
+    new_token = create_access_token(data={"sub": user.username})
+    db.query(User).filter(User.id == user.id).update({User.active_token: new_token})
+    db.commit()
+    principal_cache.invalidate(user.token)
+    event_bus.publish("auth", {"token": user.token})
+    return new_token